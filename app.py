@@ -1,21 +1,39 @@
 
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, session, Response
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_from_directory, session, Response, abort
 from config import Config
 from extension import db, login_manager, migrate, cache
-from models import Admin, Customer, Insurer, Regulator, InsuranceCompany, InsurerRequest, RegulatoryBody, RegulatorRequest, Policy, PolicyPhoto, Claim, ClaimDocument, PremiumRate, Quote, CustomerMonitoredPolicy, CustomerPolicyRequest, PolicyCancellationRequest, PolicyRenewalRequest, BlogPost, ContactMessage
+from models import Admin, Customer, Insurer, Regulator, InsuranceCompany, InsurerRequest, RegulatoryBody, RegulatorRequest, Policy, PolicyPhoto, Claim, ClaimDocument, PremiumRate, Quote, CustomerMonitoredPolicy, CustomerPolicyRequest, PolicyCancellationRequest, PolicyRenewalRequest, BlogPost, ContactMessage, ExportJob, registration_key
 from forms import SignupForm, LoginForm, InsurerAccessRequestForm, RegulatorAccessRequestForm, PolicyCreationForm, ClaimForm
 from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from decorators import admin_required, customer_required, insurer_required, regulator_required
+import reports
+import metrics
+import exports
+import export_jobs
+import search
+import autocomplete
+import pagination
+import directory
+import sqlite_tuning
+import replica
+import loaders
+import query_stats
+import sequences
+import expiry
+import archive
+import imports
+import claim_intake
 from datetime import datetime, date, timedelta
 import os
-import csv
-from io import StringIO
+import click
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
+sqlite_tuning.init_app(app)
+query_stats.init_app(app)
 login_manager.init_app(app)
 migrate.init_app(app, db)
 cache.init_app(app)
@@ -102,10 +120,21 @@ with app.app_context():
 				db.session.add(body)
 			db.session.commit()
 			print(f"Added {len(REGULATORY_BODIES)} regulatory bodies to database")
+		
+		# Index existing records for full-text search
+		indexed = search.ensure_index()
+		if indexed:
+			print(f"Indexed {indexed} records for search")
+		
+		# Load registration and policy numbers for the claim form's autocomplete
+		autocomplete.warm_indexes()
 			
 	except Exception as e:
 		app.logger.warning(f"Database initialization warning: {e}")
 
+# Expire lapsed policies and quotes in process, if EXPIRY_INTERVAL is set
+expiry.start_scheduler(app)
+
 @login_manager.user_loader
 def load_user(user_id):
 	# Parse the prefixed user ID (e.g., "admin_1", "customer_2")
@@ -277,12 +306,18 @@ def forgot_password():
 @app.route('/admin/dashboard')
 @login_required
 @admin_required
+@replica.reads
 def admin_dashboard():
-	customers = Customer.query.all()
-	insurers = Insurer.query.all()
-	regulators = Regulator.query.all()
-	pending_insurer_count = InsurerRequest.query.filter_by(status='pending').count()
-	pending_regulator_count = RegulatorRequest.query.filter_by(status='pending').count()
+	# First few accounts of each role, and the per-role totals
+	customers = directory.directory_page({'role': 'customer'}, per_page=5).items
+	insurers = directory.directory_page({'role': 'insurer'}, per_page=5).items
+	regulators = directory.directory_page({'role': 'regulator'}, per_page=5).items
+	user_stats = reports.user_summary()
+	
+	# Pending staff access requests from the global rollup
+	rollup = metrics.get_rollup()
+	pending_insurer_count = rollup.pending_insurer_requests
+	pending_regulator_count = rollup.pending_regulator_requests
 	
 	# Get unread contact messages
 	unread_messages = ContactMessage.query.filter_by(read=False).order_by(ContactMessage.submitted_at.desc()).limit(5).all()
@@ -292,6 +327,7 @@ def admin_dashboard():
 						   customers=customers, 
 						   insurers=insurers, 
 						   regulators=regulators,
+						   user_stats=user_stats,
 						   pending_count=pending_insurer_count,
 						   pending_regulator_count=pending_regulator_count,
 						   unread_messages=unread_messages,
@@ -313,64 +349,36 @@ def admin_search():
 		'companies': []
 	}
 	
+	timed_out = []
 	if query:
-		search_pattern = f"%{query}%"
+		searches = {}
 		
-		# Search customers (only username and email exist)
+		# Search customers by username or email
 		if search_type in ['all', 'customers']:
-			results['customers'] = Customer.query.filter(
-				db.or_(
-					Customer.username.ilike(search_pattern),
-					Customer.email.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['customers'] = lambda: search.ranked(Customer, query).limit(20).all()
 		
-		# Search insurers (only username, email, and staff_id exist)
+		# Search insurers by username, email or staff ID
 		if search_type in ['all', 'insurers']:
-			results['insurers'] = Insurer.query.filter(
-				db.or_(
-					Insurer.username.ilike(search_pattern),
-					Insurer.email.ilike(search_pattern),
-					Insurer.staff_id.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['insurers'] = lambda: loaders.load(search.ranked(Insurer, query), 'insurer_list').limit(20).all()
 		
-		# Search regulators (only username, email, and staff_id exist)
+		# Search regulators by username, email or staff ID
 		if search_type in ['all', 'regulators']:
-			results['regulators'] = Regulator.query.filter(
-				db.or_(
-					Regulator.username.ilike(search_pattern),
-					Regulator.email.ilike(search_pattern),
-					Regulator.staff_id.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['regulators'] = lambda: loaders.load(search.ranked(Regulator, query), 'regulator_list').limit(20).all()
 		
-		# Search policies
+		# Search policies by number, insured name, email, registration or national ID
 		if search_type in ['all', 'policies']:
-			results['policies'] = Policy.query.filter(
-				db.or_(
-					Policy.policy_number.ilike(search_pattern),
-					Policy.insured_name.ilike(search_pattern),
-					Policy.email_address.ilike(search_pattern),
-					Policy.registration_number.ilike(search_pattern),
-					Policy.national_id.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['policies'] = lambda: loaders.load(search.ranked(Policy, query), 'policy_list').limit(20).all()
 		
-		# Search claims
+		# Search claims by claim or police report number
 		if search_type in ['all', 'claims']:
-			results['claims'] = Claim.query.filter(
-				db.or_(
-					Claim.claim_number.ilike(search_pattern),
-					Claim.police_report_number.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['claims'] = lambda: loaders.load(search.ranked(Claim, query), 'claim_list').limit(20).all()
 		
 		# Search insurance companies
 		if search_type in ['all', 'companies']:
-			results['companies'] = InsuranceCompany.query.filter(
-				InsuranceCompany.name.ilike(search_pattern)
-			).limit(20).all()
+			searches['companies'] = lambda: loaders.load(search.ranked(InsuranceCompany, query), 'company_list').limit(20).all()
+		
+		found, timed_out = search.run_searches(searches)
+		results.update(found)
 	
 	total_results = sum(len(v) for v in results.values())
 	
@@ -378,16 +386,17 @@ def admin_search():
 		query=query,
 		search_type=search_type,
 		results=results,
-		total_results=total_results
+		total_results=total_results,
+		timed_out=timed_out
 	)
 
 @app.route('/admin/insurer-requests')
 @login_required
 @admin_required
 def review_insurer_requests():
-	pending_requests = InsurerRequest.query.filter_by(status='pending').order_by(InsurerRequest.request_date.desc()).all()
-	approved_requests = InsurerRequest.query.filter_by(status='approved').order_by(InsurerRequest.reviewed_date.desc()).all()
-	rejected_requests = InsurerRequest.query.filter_by(status='rejected').order_by(InsurerRequest.reviewed_date.desc()).all()
+	pending_requests = loaders.load(InsurerRequest.query, 'insurer_requests').filter_by(status='pending').order_by(InsurerRequest.request_date.desc()).all()
+	approved_requests = loaders.load(InsurerRequest.query, 'insurer_requests').filter_by(status='approved').order_by(InsurerRequest.reviewed_date.desc()).all()
+	rejected_requests = loaders.load(InsurerRequest.query, 'insurer_requests').filter_by(status='rejected').order_by(InsurerRequest.reviewed_date.desc()).all()
 	
 	return render_template('admin/review_requests.html',
 						   pending_requests=pending_requests,
@@ -448,9 +457,9 @@ def reject_insurer_request(request_id):
 @login_required
 @admin_required
 def review_regulator_requests():
-	pending_requests = RegulatorRequest.query.filter_by(status='pending').order_by(RegulatorRequest.request_date.desc()).all()
-	approved_requests = RegulatorRequest.query.filter_by(status='approved').order_by(RegulatorRequest.reviewed_date.desc()).all()
-	rejected_requests = RegulatorRequest.query.filter_by(status='rejected').order_by(RegulatorRequest.reviewed_date.desc()).all()
+	pending_requests = loaders.load(RegulatorRequest.query, 'regulator_requests').filter_by(status='pending').order_by(RegulatorRequest.request_date.desc()).all()
+	approved_requests = loaders.load(RegulatorRequest.query, 'regulator_requests').filter_by(status='approved').order_by(RegulatorRequest.reviewed_date.desc()).all()
+	rejected_requests = loaders.load(RegulatorRequest.query, 'regulator_requests').filter_by(status='rejected').order_by(RegulatorRequest.reviewed_date.desc()).all()
 	
 	return render_template('admin/review_regulator_requests.html',
 						   pending_requests=pending_requests,
@@ -511,10 +520,35 @@ def reject_regulator_request(request_id):
 @login_required
 @admin_required
 def user_management():
-	customers = Customer.query.all()
-	insurers = Insurer.query.all()
-	regulators = Regulator.query.all()
-	return render_template('admin/usermanagement.html', customers=customers, insurers=insurers, regulators=regulators)
+	role_filter = request.args.get('role', '')
+	status_filter = request.args.get('status', '')
+	
+	# One alphabetical page of every account type, filtered in SQL
+	try:
+		page = directory.directory_page(request.args)
+	except ValueError:
+		abort(400)
+	
+	return render_template('admin/usermanagement.html',
+		users=page.items,
+		page=page,
+		user_stats=reports.user_summary(),
+		role_filter=role_filter,
+		status_filter=status_filter
+	)
+
+@app.route('/admin/export-users-csv')
+@login_required
+@admin_required
+@replica.reads
+def admin_export_users_csv():
+	"""Export the user directory, filtered by role and status"""
+	fmt = exports.requested_format(request.args)
+	if fmt is None:
+		flash('Parquet and Arrow exports are not available on this server.', 'warning')
+		return redirect(url_for('user_management'))
+	
+	return exports.export_response('clearview_users', exports.users(request.args), fmt)
 
 @app.route('/admin/toggle-user/<user_type>/<int:user_id>', methods=['POST'])
 @login_required
@@ -621,87 +655,23 @@ def delete_contact_message(message_id):
 @app.route('/admin/reports-and-insights')
 @login_required
 @admin_required
+@replica.reads
 def admin_reports_and_insights():
 	"""View comprehensive system-wide reports and insights"""
 	
-	# Get all data
-	all_customers = Customer.query.all()
-	all_insurers = Insurer.query.all()
-	all_regulators = Regulator.query.all()
-	all_companies = InsuranceCompany.query.filter_by(is_active=True).all()
-	all_policies = Policy.query.all()
-	all_claims = Claim.query.all()
-	all_quotes = Quote.query.all()
-	
 	# User statistics
-	total_customers = len(all_customers)
-	active_customers = sum(1 for c in all_customers if c.is_active)
-	total_insurers = len(all_insurers)
-	approved_insurers = sum(1 for i in all_insurers if i.is_approved)
-	total_regulators = len(all_regulators)
-	approved_regulators = sum(1 for r in all_regulators if r.is_approved)
+	users = reports.user_summary()
 	
-	# Policy statistics
-	total_policies = len(all_policies)
-	active_policies = sum(1 for p in all_policies if p.status == 'Active')
-	expired_policies = sum(1 for p in all_policies if p.status == 'Expired')
-	cancelled_policies = sum(1 for p in all_policies if p.status == 'Cancelled')
-	total_premium = sum(p.premium_amount for p in all_policies if p.status == 'Active')
+	# Policy, claims and quotes statistics
+	policies = reports.policy_summary()
+	claims = reports.claim_summary()
+	quotes = reports.quote_summary()
 	
-	# Claims statistics
-	total_claims = len(all_claims)
-	pending_claims = sum(1 for c in all_claims if c.status == 'Pending')
-	under_review_claims = sum(1 for c in all_claims if c.status == 'Under Review')
-	approved_claims = sum(1 for c in all_claims if c.status == 'Approved')
-	rejected_claims = sum(1 for c in all_claims if c.status == 'Rejected')
+	# Company rankings (sorted by active policies, descending)
+	company_rankings = reports.company_rankings()
 	
-	# Quotes statistics
-	total_quotes = len(all_quotes)
-	sent_quotes = sum(1 for q in all_quotes if q.status == 'Sent')
-	converted_quotes = sum(1 for q in all_quotes if q.status == 'Converted')
-	expired_quotes = sum(1 for q in all_quotes if q.status == 'Expired')
-	quote_conversion_rate = (converted_quotes / total_quotes * 100) if total_quotes else 0
-	
-	# Company rankings
-	company_rankings = []
-	for company in all_companies:
-		comp_policies = Policy.query.filter_by(insurance_company_id=company.id).all()
-		comp_active = sum(1 for p in comp_policies if p.status == 'Active')
-		comp_premium = sum(p.premium_amount for p in comp_policies if p.status == 'Active')
-		comp_claims = Claim.query.join(Policy).filter(Policy.insurance_company_id == company.id).all()
-		comp_approved_claims = sum(1 for c in comp_claims if c.status == 'Approved')
-		comp_staff = Insurer.query.filter_by(insurance_company_id=company.id, is_approved=True).count()
-		
-		company_rankings.append({
-			'name': company.name,
-			'active_policies': comp_active,
-			'total_premium': comp_premium,
-			'approved_claims': comp_approved_claims,
-			'staff_count': comp_staff
-		})
-	
-	# Sort by active policies (descending)
-	company_rankings.sort(key=lambda x: x['active_policies'], reverse=True)
-	
-	# User activity across all companies
-	user_activity = []
-	for insurer in all_insurers:
-		if insurer.is_approved:
-			user_policies = Policy.query.filter_by(created_by=insurer.id).count()
-			user_claims = Claim.query.filter_by(created_by=insurer.id).count()
-			user_quotes = Quote.query.filter_by(created_by=insurer.id).count()
-			
-			user_activity.append({
-				'username': insurer.username,
-				'email': insurer.email,
-				'company': insurer.company.name if insurer.company else 'N/A',
-				'policies_created': user_policies,
-				'claims_processed': user_claims,
-				'quotes_generated': user_quotes
-			})
-	
-	# Sort by policies created
-	user_activity.sort(key=lambda x: x['policies_created'], reverse=True)
+	# User activity across all companies (sorted by policies created)
+	user_activity = reports.user_activity()
 	
 	# Recent requests
 	pending_insurer_requests = InsurerRequest.query.filter_by(status='pending').count()
@@ -709,32 +679,32 @@ def admin_reports_and_insights():
 	
 	return render_template('admin/reports_and_insights.html',
 		# User stats
-		total_customers=total_customers,
-		active_customers=active_customers,
-		total_insurers=total_insurers,
-		approved_insurers=approved_insurers,
-		total_regulators=total_regulators,
-		approved_regulators=approved_regulators,
+		total_customers=users['total_customers'],
+		active_customers=users['active_customers'],
+		total_insurers=users['total_insurers'],
+		approved_insurers=users['approved_insurers'],
+		total_regulators=users['total_regulators'],
+		approved_regulators=users['approved_regulators'],
 		# Policy stats
-		total_policies=total_policies,
-		active_policies=active_policies,
-		expired_policies=expired_policies,
-		cancelled_policies=cancelled_policies,
-		total_premium=total_premium,
+		total_policies=policies['total'],
+		active_policies=policies['active'],
+		expired_policies=policies['expired'],
+		cancelled_policies=policies['cancelled'],
+		total_premium=policies['active_premium'],
 		# Claims stats
-		total_claims=total_claims,
-		pending_claims=pending_claims,
-		under_review_claims=under_review_claims,
-		approved_claims=approved_claims,
-		rejected_claims=rejected_claims,
+		total_claims=claims['total'],
+		pending_claims=claims['pending'],
+		under_review_claims=claims['under_review'],
+		approved_claims=claims['approved'],
+		rejected_claims=claims['rejected'],
 		# Quotes stats
-		total_quotes=total_quotes,
-		sent_quotes=sent_quotes,
-		converted_quotes=converted_quotes,
-		expired_quotes=expired_quotes,
-		quote_conversion_rate=quote_conversion_rate,
+		total_quotes=quotes['total'],
+		sent_quotes=quotes['sent'],
+		converted_quotes=quotes['converted'],
+		expired_quotes=quotes['expired'],
+		quote_conversion_rate=quotes['conversion_rate'],
 		# Company data
-		total_companies=len(all_companies),
+		total_companies=len(company_rankings),
 		company_rankings=company_rankings,
 		user_activity=user_activity,
 		# Requests
@@ -745,152 +715,48 @@ def admin_reports_and_insights():
 @app.route('/admin/export-reports-csv')
 @login_required
 @admin_required
+@replica.reads
 def admin_export_reports_csv():
 	"""Export admin reports data to CSV"""
-	si = StringIO()
-	writer = csv.writer(si)
-	
 	# Get export type from query parameter
 	export_type = request.args.get('type', 'summary')
-	
-	if export_type == 'companies':
-		writer.writerow(['Company Name', 'Active Policies', 'Total Premium (KES)', 'Approved Claims', 'Staff Count'])
-		all_companies = InsuranceCompany.query.filter_by(is_active=True).all()
-		for company in all_companies:
-			comp_policies = Policy.query.filter_by(insurance_company_id=company.id).all()
-			comp_active = sum(1 for p in comp_policies if p.status == 'Active')
-			comp_premium = sum(p.premium_amount for p in comp_policies if p.status == 'Active')
-			comp_claims = Claim.query.join(Policy).filter(Policy.insurance_company_id == company.id).all()
-			comp_approved_claims = sum(1 for c in comp_claims if c.status == 'Approved')
-			comp_staff = Insurer.query.filter_by(insurance_company_id=company.id, is_approved=True).count()
-			writer.writerow([company.name, comp_active, f'{comp_premium:.2f}', comp_approved_claims, comp_staff])
-	
-	elif export_type == 'users':
-		writer.writerow(['Username', 'Email', 'Role', 'Company/Body', 'Status'])
-		customers = Customer.query.all()
-		insurers = Insurer.query.all()
-		regulators = Regulator.query.all()
-		for c in customers:
-			writer.writerow([c.username, c.email, 'Customer', 'N/A', 'Active' if c.is_active else 'Inactive'])
-		for i in insurers:
-			writer.writerow([i.username, i.email, 'Insurer', i.company.name if i.company else 'N/A', 'Approved' if i.is_approved else 'Pending'])
-		for r in regulators:
-			writer.writerow([r.username, r.email, 'Regulator', r.regulatory_body.name if r.regulatory_body else 'N/A', 'Approved' if r.is_approved else 'Pending'])
-	
-	elif export_type == 'policies':
-		writer.writerow(['Policy Number', 'Company', 'Policyholder', 'Type', 'Premium (KES)', 'Status', 'Start Date', 'Expiry Date'])
-		all_policies = Policy.query.all()
-		for p in all_policies:
-			writer.writerow([
-				p.policy_number, 
-				p.insurance_company.name if p.insurance_company else 'N/A',
-				p.policyholder_name,
-				p.policy_type,
-				f'{p.premium_amount:.2f}',
-				p.status,
-				p.start_date.strftime('%Y-%m-%d') if p.start_date else 'N/A',
-				p.expiry_date.strftime('%Y-%m-%d') if p.expiry_date else 'N/A'
-			])
-	
-	elif export_type == 'claims':
-		writer.writerow(['Claim Number', 'Policy Number', 'Company', 'Status', 'Date Submitted'])
-		all_claims = Claim.query.all()
-		for c in all_claims:
-			writer.writerow([
-				c.claim_number,
-				c.policy.policy_number if c.policy else 'N/A',
-				c.insurance_company.name if c.insurance_company else 'N/A',
-				c.status,
-				c.date_submitted.strftime('%Y-%m-%d') if c.date_submitted else 'N/A'
-			])
-	
-	else:  # summary
-		writer.writerow(['Metric', 'Value'])
-		customers = Customer.query.all()
-		insurers = Insurer.query.all()
-		regulators = Regulator.query.all()
-		policies = Policy.query.all()
-		claims = Claim.query.all()
-		
-		writer.writerow(['Total Customers', len(customers)])
-		writer.writerow(['Active Customers', sum(1 for c in customers if c.is_active)])
-		writer.writerow(['Total Insurers', len(insurers)])
-		writer.writerow(['Approved Insurers', sum(1 for i in insurers if i.is_approved)])
-		writer.writerow(['Total Regulators', len(regulators)])
-		writer.writerow(['Approved Regulators', sum(1 for r in regulators if r.is_approved)])
-		writer.writerow(['Total Policies', len(policies)])
-		writer.writerow(['Active Policies', sum(1 for p in policies if p.status == 'Active')])
-		writer.writerow(['Total Premium (KES)', f'{sum(p.premium_amount for p in policies if p.status == "Active"):.2f}'])
-		writer.writerow(['Total Claims', len(claims)])
-		writer.writerow(['Approved Claims', sum(1 for c in claims if c.status == 'Approved')])
-	
-	output = si.getvalue()
-	si.close()
-	
-	return Response(
-		output,
-		mimetype='text/csv',
-		headers={'Content-Disposition': f'attachment; filename=clearview_admin_report_{export_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-	)
+	return exports.export_response(f'clearview_admin_report_{export_type}', exports.admin_report(export_type))
 
 @app.route('/admin/view-policies')
 @login_required
 @admin_required
 def admin_view_policies():
 	"""View all policies with filtering and export capabilities"""
-	from datetime import datetime
-	
 	# Get filter parameters
 	status_filter = request.args.get('status', '')
 	company_filter = request.args.get('company_id', '')
 	start_date = request.args.get('start_date', '')
 	end_date = request.args.get('end_date', '')
 	
-	# Base query
-	query = Policy.query
-	
-	# Apply filters
-	if status_filter:
-		query = query.filter_by(status=status_filter)
-	
-	if company_filter:
-		query = query.filter_by(insurance_company_id=company_filter)
-	
-	if start_date:
-		try:
-			start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-			query = query.filter(Policy.effective_date >= start_dt)
-		except ValueError:
-			pass
-	
-	if end_date:
-		try:
-			end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-			query = query.filter(Policy.expiry_date <= end_dt)
-		except ValueError:
-			pass
+	# Same filters as the policy export
+	query = exports.filter_policies(Policy.query, request.args)
 	
-	# Get filtered policies
-	policies = query.all()
+	# One page at a time, newest first
+	try:
+		page = pagination.keyset_page(loaders.load(query, 'policy_list'), Policy.date_entered, Policy.id, request.args)
+	except ValueError:
+		abort(400)
 	
-	# Calculate summary statistics
-	total_policies = len(policies)
-	active_policies = sum(1 for p in policies if p.status == 'Active')
-	expired_policies = sum(1 for p in policies if p.status == 'Expired')
-	cancelled_policies = sum(1 for p in policies if p.status == 'Cancelled')
-	total_premium = sum(p.premium_amount for p in policies)
+	# Summary statistics over every matching policy, in one aggregate query
+	summary = reports.policy_summary(query=query)
 	
 	# Get all companies for filter dropdown
 	companies = InsuranceCompany.query.all()
 	
 	return render_template('admin/view_policies.html',
-		policies=policies,
+		policies=page.items,
+		page=page,
 		companies=companies,
-		total_policies=total_policies,
-		active_policies=active_policies,
-		expired_policies=expired_policies,
-		cancelled_policies=cancelled_policies,
-		total_premium=total_premium,
+		total_policies=summary['total'],
+		active_policies=summary['active'],
+		expired_policies=summary['expired'],
+		cancelled_policies=summary['cancelled'],
+		total_premium=summary['total_premium'],
 		status_filter=status_filter,
 		company_filter=company_filter,
 		start_date=start_date,
@@ -900,133 +766,56 @@ def admin_view_policies():
 @app.route('/admin/export-policies-csv')
 @login_required
 @admin_required
+@replica.reads
 def admin_export_policies_csv():
 	"""Export filtered policies to CSV"""
-	from datetime import datetime
-	
-	# Get same filter parameters
-	status_filter = request.args.get('status', '')
-	company_filter = request.args.get('company_id', '')
-	start_date = request.args.get('start_date', '')
-	end_date = request.args.get('end_date', '')
-	
-	# Base query
-	query = Policy.query
-	
-	# Apply filters
-	if status_filter:
-		query = query.filter_by(status=status_filter)
+	fmt = exports.requested_format(request.args)
+	if fmt is None:
+		flash('Parquet and Arrow exports are not available on this server.', 'warning')
+		return redirect(url_for('admin_view_policies'))
 	
-	if company_filter:
-		query = query.filter_by(insurance_company_id=company_filter)
-	
-	if start_date:
-		try:
-			start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-			query = query.filter(Policy.effective_date >= start_dt)
-		except ValueError:
-			pass
-	
-	if end_date:
-		try:
-			end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-			query = query.filter(Policy.expiry_date <= end_dt)
-		except ValueError:
-			pass
-	
-	# Get filtered policies
-	policies = query.all()
-	
-	# Create CSV
-	si = StringIO()
-	writer = csv.writer(si)
-	
-	# Write header
-	writer.writerow(['Policy Number', 'Customer Email', 'Insurance Company', 'Vehicle Registration', 
-					 'Premium (KES)', 'Status', 'Start Date', 'End Date', 'Created Date'])
-	
-	# Write data
-	for policy in policies:
-		writer.writerow([
-			policy.policy_number or '',
-			policy.email_address or '',
-			policy.insurance_company.name if policy.insurance_company else '',
-			policy.registration_number or '',
-			f'{policy.premium_amount:.2f}',
-			policy.status or '',
-			policy.effective_date.strftime('%Y-%m-%d') if policy.effective_date else '',
-			policy.expiry_date.strftime('%Y-%m-%d') if policy.expiry_date else '',
-			policy.date_entered.strftime('%Y-%m-%d %H:%M') if policy.date_entered else ''
-		])
-	
-	output = si.getvalue()
-	si.close()
-	
-	return Response(
-		output,
-		mimetype='text/csv',
-		headers={'Content-Disposition': f'attachment; filename=clearview_policies_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-	)
+	# Same filter parameters as the view-policies page, plus an optional 'since' delta cursor
+	try:
+		export = exports.policies(request.args)
+	except ValueError:
+		abort(400, 'Invalid since cursor')
+	return exports.export_response('clearview_policies', export, fmt)
 
 @app.route('/admin/view-claims')
 @login_required
 @admin_required
 def admin_view_claims():
 	"""View all claims with filtering and export capabilities"""
-	from datetime import datetime
-	
 	# Get filter parameters
 	status_filter = request.args.get('status', '')
 	company_filter = request.args.get('company_id', '')
 	start_date = request.args.get('start_date', '')
 	end_date = request.args.get('end_date', '')
 	
-	# Base query
-	query = Claim.query
+	# Same filters as the claim export
+	query = exports.filter_claims(Claim.query, request.args)
 	
-	# Apply filters
-	if status_filter:
-		query = query.filter_by(status=status_filter)
-	
-	if company_filter:
-		# Filter by company through policy relationship
-		query = query.join(Policy).filter(Policy.insurance_company_id == company_filter)
-	
-	if start_date:
-		try:
-			start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-			query = query.filter(Claim.accident_date >= start_dt)
-		except ValueError:
-			pass
-	
-	if end_date:
-		try:
-			end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-			query = query.filter(Claim.accident_date <= end_dt)
-		except ValueError:
-			pass
-	
-	# Get filtered claims
-	claims = query.all()
+	# One page at a time, newest submissions first
+	try:
+		page = pagination.keyset_page(loaders.load(query, 'claim_list'), Claim.date_submitted, Claim.id, request.args)
+	except ValueError:
+		abort(400)
 	
-	# Calculate summary statistics
-	total_claims = len(claims)
-	pending_claims = sum(1 for c in claims if c.status == 'Pending')
-	approved_claims = sum(1 for c in claims if c.status == 'Approved')
-	rejected_claims = sum(1 for c in claims if c.status == 'Rejected')
-	under_review_claims = sum(1 for c in claims if c.status == 'Under Review')
+	# Summary statistics over every matching claim, in one aggregate query
+	summary = reports.claim_summary(query=query)
 	
 	# Get all companies for filter dropdown
 	companies = InsuranceCompany.query.all()
 	
 	return render_template('admin/view_claims.html',
-		claims=claims,
+		claims=page.items,
+		page=page,
 		companies=companies,
-		total_claims=total_claims,
-		pending_claims=pending_claims,
-		approved_claims=approved_claims,
-		rejected_claims=rejected_claims,
-		under_review_claims=under_review_claims,
+		total_claims=summary['total'],
+		pending_claims=summary['pending'],
+		approved_claims=summary['approved'],
+		rejected_claims=summary['rejected'],
+		under_review_claims=summary['under_review'],
 		status_filter=status_filter,
 		company_filter=company_filter,
 		start_date=start_date,
@@ -1036,76 +825,20 @@ def admin_view_claims():
 @app.route('/admin/export-claims-csv')
 @login_required
 @admin_required
+@replica.reads
 def admin_export_claims_csv():
 	"""Export filtered claims to CSV"""
-	from datetime import datetime
-	
-	# Get same filter parameters
-	status_filter = request.args.get('status', '')
-	company_filter = request.args.get('company_id', '')
-	start_date = request.args.get('start_date', '')
-	end_date = request.args.get('end_date', '')
-	
-	# Base query
-	query = Claim.query
+	fmt = exports.requested_format(request.args)
+	if fmt is None:
+		flash('Parquet and Arrow exports are not available on this server.', 'warning')
+		return redirect(url_for('admin_view_claims'))
 	
-	# Apply filters
-	if status_filter:
-		query = query.filter_by(status=status_filter)
-	
-	if company_filter:
-		# Filter by company through policy relationship
-		query = query.join(Policy).filter(Policy.insurance_company_id == company_filter)
-	
-	if start_date:
-		try:
-			start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-			query = query.filter(Claim.accident_date >= start_dt)
-		except ValueError:
-			pass
-	
-	if end_date:
-		try:
-			end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-			query = query.filter(Claim.accident_date <= end_dt)
-		except ValueError:
-			pass
-	
-	# Get filtered claims
-	claims = query.all()
-	
-	# Create CSV
-	si = StringIO()
-	writer = csv.writer(si)
-	
-	# Write header
-	writer.writerow(['Claim Number', 'Policy Number', 'Customer Email', 'Insurance Company', 
-					 'Date of Accident', 'Location', 'Description', 'Status', 
-					 'Filed Date', 'Review Date'])
-	
-	# Write data
-	for claim in claims:
-		writer.writerow([
-			claim.claim_number or '',
-			claim.policy.policy_number if claim.policy else '',
-			claim.policy.email_address if claim.policy else '',
-			claim.policy.insurance_company.name if claim.policy and claim.policy.insurance_company else '',
-			claim.accident_date.strftime('%Y-%m-%d') if claim.accident_date else '',
-			claim.accident_location or '',
-			claim.accident_description[:100] or '',  # Truncate long descriptions
-			claim.status or '',
-			claim.date_submitted.strftime('%Y-%m-%d %H:%M') if claim.date_submitted else '',
-			claim.review_date.strftime('%Y-%m-%d %H:%M') if claim.review_date else ''
-		])
-	
-	output = si.getvalue()
-	si.close()
-	
-	return Response(
-		output,
-		mimetype='text/csv',
-		headers={'Content-Disposition': f'attachment; filename=clearview_claims_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-	)
+	# Same filter parameters as the view-claims page, plus an optional 'since' delta cursor
+	try:
+		export = exports.claims(request.args)
+	except ValueError:
+		abort(400, 'Invalid since cursor')
+	return exports.export_response('clearview_claims', export, fmt)
 
 @app.route('/admin/policy/<int:policy_id>')
 @login_required
@@ -1128,6 +861,7 @@ def admin_view_claim_detail(claim_id):
 @app.route('/customer/dashboard')
 @login_required
 @customer_required
+@replica.reads
 def customer_dashboard():
 	# Get customer's owned policies (by email)
 	owned_policies = Policy.query.filter_by(email_address=current_user.email).order_by(
@@ -1144,7 +878,8 @@ def customer_dashboard():
 	total_policies = len(all_policies)
 	
 	# Get active policies (not expired)
-	active_owned = [p for p in owned_policies if p.expiry_date and p.expiry_date >= datetime.now().date() and p.status == 'Active']
+	# Until 'flask expire-policies' has run, a lapsed policy can still be marked Active
+	active_owned = [p for p in owned_policies if p.status == 'Active' and p.expiry_date and p.expiry_date >= datetime.now().date()]
 	active_policies = len(active_owned)
 	
 	# Get expiring soon (within 30 days)
@@ -1216,56 +951,47 @@ def customer_search():
 		'companies': []
 	}
 	
+	timed_out = []
 	if query:
-		search_pattern = f"%{query}%"
+		# Searches run on worker threads, so read the customer's email here
+		email = current_user.email
+		searches = {}
 		
 		# Search customer's own policies by email
 		if search_type in ['all', 'policies']:
-			results['policies'] = Policy.query.filter(
-				Policy.email_address == current_user.email
-			).filter(
-				db.or_(
-					Policy.policy_number.ilike(search_pattern),
-					Policy.insured_name.ilike(search_pattern),
-					Policy.registration_number.ilike(search_pattern),
-					Policy.vehicle_make.ilike(search_pattern),
-					Policy.vehicle_model.ilike(search_pattern)
-				)
+			searches['policies'] = lambda: search.ranked(Policy, query).filter(
+				Policy.email_address == email
 			).limit(20).all()
 		
 		# Search customer's own claims through their policies
 		if search_type in ['all', 'claims']:
-			customer_policies = Policy.query.filter_by(email_address=current_user.email).all()
-			policy_ids = [p.id for p in customer_policies]
-			if policy_ids:
-				results['claims'] = Claim.query.filter(
-					Claim.policy_id.in_(policy_ids)
-				).filter(
-					db.or_(
-						Claim.claim_number.ilike(search_pattern),
-						Claim.police_report_number.ilike(search_pattern),
-						Claim.accident_location.ilike(search_pattern)
-					)
-				).limit(20).all()
+			searches['claims'] = lambda: search.ranked(Claim, query).join(
+				Policy, Claim.policy_id == Policy.id
+			).filter(
+				Policy.email_address == email
+			).limit(20).all()
 		
 		# Search customer's own quotes
 		if search_type in ['all', 'quotes']:
-			results['quotes'] = Quote.query.filter(
-				Quote.customer_email == current_user.email
+			search_pattern = f"%{query}%"
+			searches['quotes'] = lambda: Quote.query.filter(
+				Quote.customer_email == email
 			).filter(
 				db.or_(
 					Quote.quote_number.ilike(search_pattern),
-					Quote.vehicle_make.ilike(search_pattern),
-					Quote.vehicle_model.ilike(search_pattern),
+					Quote.make_model.ilike(search_pattern),
 					Quote.registration_number.ilike(search_pattern)
 				)
 			).limit(20).all()
 		
 		# Search insurance companies
 		if search_type in ['all', 'companies']:
-			results['companies'] = InsuranceCompany.query.filter(
-				InsuranceCompany.name.ilike(search_pattern)
-			).filter_by(is_active=True).limit(20).all()
+			searches['companies'] = lambda: search.ranked(InsuranceCompany, query).filter(
+				InsuranceCompany.is_active == True
+			).limit(20).all()
+		
+		found, timed_out = search.run_searches(searches)
+		results.update(found)
 	
 	total_results = sum(len(v) for v in results.values())
 	
@@ -1273,7 +999,8 @@ def customer_search():
 		query=query,
 		search_type=search_type,
 		results=results,
-		total_results=total_results
+		total_results=total_results,
+		timed_out=timed_out
 	)
 
 @app.route('/customer/search-vehicle')
@@ -1288,17 +1015,24 @@ def customer_search_vehicle():
 @customer_required
 def customer_view_vehicle(registration_number):
 	"""View vehicle details, policies, and claims"""
-	# Search for policies with this registration number
-	policies = Policy.query.filter_by(registration_number=registration_number.upper()).all()
-	
-	if not policies:
-		flash('No vehicle found with that registration number.', 'warning')
-		return redirect(url_for('customer_search_vehicle'))
+	# Search for policies with this registration number, however it was spaced or punctuated
+	policies = Policy.query.filter_by(registration_key=registration_key(registration_number)).all()
 	
 	# Get all claims for these policies
 	policy_ids = [p.id for p in policies]
 	claims = Claim.query.filter(Claim.policy_id.in_(policy_ids)).all() if policy_ids else []
 	
+	# Add the vehicle's archived policies and claims when asked for
+	include_archived = request.args.get('archived') == '1'
+	if include_archived:
+		archived_policies, archived_claims = archive.archived_vehicle_history(registration_number)
+		policies += archived_policies
+		claims += archived_claims
+	
+	if not policies:
+		flash('No vehicle found with that registration number.', 'warning')
+		return redirect(url_for('customer_search_vehicle'))
+	
 	# Get the most recent policy for vehicle details
 	active_policy = next((p for p in policies if p.status == 'Active'), None)
 	vehicle_info = active_policy if active_policy else policies[0]
@@ -1307,7 +1041,8 @@ def customer_view_vehicle(registration_number):
 		registration_number=registration_number.upper(),
 		vehicle_info=vehicle_info,
 		policies=policies,
-		claims=claims
+		claims=claims,
+		include_archived=include_archived
 	)
 
 @app.route('/customer/policy/<int:policy_id>')
@@ -1337,6 +1072,7 @@ def customer_view_claim_detail(claim_id):
 @app.route('/customer/reports-and-insights')
 @login_required
 @customer_required
+@replica.reads
 def customer_reports_and_insights():
 	"""View customer-specific reports and insights"""
 	
@@ -1440,65 +1176,12 @@ def customer_reports_and_insights():
 @app.route('/customer/export-reports-csv')
 @login_required
 @customer_required
+@replica.reads
 def customer_export_reports_csv():
 	"""Export customer reports data to CSV"""
-	si = StringIO()
-	writer = csv.writer(si)
-	
 	# Get export type from query parameter
 	export_type = request.args.get('type', 'summary')
-	
-	if export_type == 'policies':
-		writer.writerow(['Policy Number', 'Insurance Company', 'Type', 'Premium (KES)', 'Status', 'Start Date', 'Expiry Date'])
-		customer_policies = Policy.query.filter_by(email_address=current_user.email).all()
-		for p in customer_policies:
-			writer.writerow([
-				p.policy_number,
-				p.insurance_company.name if p.insurance_company else 'N/A',
-				p.policy_type,
-				f'{p.premium_amount:.2f}',
-				p.status,
-				p.start_date.strftime('%Y-%m-%d') if p.start_date else 'N/A',
-				p.expiry_date.strftime('%Y-%m-%d') if p.expiry_date else 'N/A'
-			])
-	
-	elif export_type == 'claims':
-		writer.writerow(['Claim Number', 'Policy Number', 'Insurance Company', 'Status', 'Date Submitted', 'Review Date'])
-		customer_policies = Policy.query.filter_by(email_address=current_user.email).all()
-		policy_ids = [p.id for p in customer_policies]
-		customer_claims = Claim.query.filter(Claim.policy_id.in_(policy_ids)).all() if policy_ids else []
-		for c in customer_claims:
-			writer.writerow([
-				c.claim_number,
-				c.policy.policy_number if c.policy else 'N/A',
-				c.insurance_company.name if c.insurance_company else 'N/A',
-				c.status,
-				c.date_submitted.strftime('%Y-%m-%d') if c.date_submitted else 'N/A',
-				c.review_date.strftime('%Y-%m-%d') if c.review_date else 'N/A'
-			])
-	
-	else:  # summary
-		writer.writerow(['Metric', 'Value'])
-		customer_policies = Policy.query.filter_by(email_address=current_user.email).all()
-		policy_ids = [p.id for p in customer_policies]
-		customer_claims = Claim.query.filter(Claim.policy_id.in_(policy_ids)).all() if policy_ids else []
-		
-		writer.writerow(['Total Policies', len(customer_policies)])
-		writer.writerow(['Active Policies', sum(1 for p in customer_policies if p.status == 'Active')])
-		writer.writerow(['Total Premium Paid (KES)', f'{sum(p.premium_amount for p in customer_policies):.2f}'])
-		writer.writerow(['Active Premium (KES)', f'{sum(p.premium_amount for p in customer_policies if p.status == "Active"):.2f}'])
-		writer.writerow(['Total Claims', len(customer_claims)])
-		writer.writerow(['Approved Claims', sum(1 for c in customer_claims if c.status == 'Approved')])
-		writer.writerow(['Rejected Claims', sum(1 for c in customer_claims if c.status == 'Rejected')])
-	
-	output = si.getvalue()
-	si.close()
-	
-	return Response(
-		output,
-		mimetype='text/csv',
-		headers={'Content-Disposition': f'attachment; filename=clearview_customer_report_{export_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-	)
+	return exports.export_response(f'clearview_customer_report_{export_type}', exports.customer_report(export_type, current_user.email))
 
 # ========== CUSTOMER POLICY MANAGEMENT ROUTES ==========
 
@@ -1829,6 +1512,7 @@ def customer_view_policy_from_management(policy_id):
 @app.route('/insurer/dashboard')
 @login_required
 @insurer_required
+@replica.reads
 def insurer_dashboard():
 	# Check if insurer is approved
 	if not current_user.is_approved:
@@ -1847,71 +1531,33 @@ def insurer_dashboard():
 	# Get dashboard statistics
 	company_id = current_user.insurance_company_id
 	
-	# Total policies
-	total_policies = Policy.query.filter_by(insurance_company_id=company_id).count()
-	
-	# Active policies (not expired)
-	active_policies = Policy.query.filter_by(insurance_company_id=company_id).filter(
-		Policy.expiry_date >= datetime.now().date()
-	).count()
+	# Policy, claim and customer request counters (single query, cached per company)
+	counters = reports.insurer_dashboard_counters(company_id)
 	
 	# Recent policies (last 5)
 	recent_policies = Policy.query.filter_by(insurance_company_id=company_id).order_by(
 		Policy.date_entered.desc()
 	).limit(5).all()
 	
-	# Calculate total premium for active policies
-	total_premium = db.session.query(db.func.sum(Policy.premium_amount)).filter(
-		Policy.insurance_company_id == company_id,
-		Policy.expiry_date >= datetime.now().date()
-	).scalar() or 0
-	
-	# Claims statistics
-	total_claims = Claim.query.filter_by(insurance_company_id=company_id).count()
-	pending_claims = Claim.query.filter_by(insurance_company_id=company_id, status='Pending').count()
-	under_review_claims = Claim.query.filter_by(insurance_company_id=company_id, status='Under Review').count()
-	
 	# Recent claims (last 5)
-	recent_claims = Claim.query.filter_by(insurance_company_id=company_id).order_by(
+	recent_claims = loaders.load(Claim.query, 'claim_list').filter_by(insurance_company_id=company_id).order_by(
 		Claim.date_submitted.desc()
 	).limit(5).all()
 	
-	# Customer requests statistics
-	# Get all policy IDs for this company
-	company_policy_ids = [p.id for p in Policy.query.filter_by(insurance_company_id=company_id).all()]
-	
-	# Count pending customer requests
-	pending_access_requests = CustomerPolicyRequest.query.filter(
-		CustomerPolicyRequest.policy_id.in_(company_policy_ids),
-		CustomerPolicyRequest.status == 'pending'
-	).count()
-	
-	pending_cancellation_requests = PolicyCancellationRequest.query.filter(
-		PolicyCancellationRequest.policy_id.in_(company_policy_ids),
-		PolicyCancellationRequest.status == 'pending'
-	).count()
-	
-	pending_renewal_requests = PolicyRenewalRequest.query.filter(
-		PolicyRenewalRequest.policy_id.in_(company_policy_ids),
-		PolicyRenewalRequest.status == 'pending'
-	).count()
-	
-	total_customer_requests = pending_access_requests + pending_cancellation_requests + pending_renewal_requests
-	
 	# Insurer is approved, show dashboard with data
 	return render_template('insurer/insurerdashboard.html',
-						   total_policies=total_policies,
-						   active_policies=active_policies,
+						   total_policies=counters['total_policies'],
+						   active_policies=counters['active_policies'],
 						   recent_policies=recent_policies,
-						   total_premium=total_premium,
-						   total_claims=total_claims,
-						   pending_claims=pending_claims,
-						   under_review_claims=under_review_claims,
+						   total_premium=counters['total_premium'],
+						   total_claims=counters['total_claims'],
+						   pending_claims=counters['pending_claims'],
+						   under_review_claims=counters['under_review_claims'],
 						   recent_claims=recent_claims,
-						   pending_access_requests=pending_access_requests,
-						   pending_cancellation_requests=pending_cancellation_requests,
-						   pending_renewal_requests=pending_renewal_requests,
-						   total_customer_requests=total_customer_requests,
+						   pending_access_requests=counters['pending_access_requests'],
+						   pending_cancellation_requests=counters['pending_cancellation_requests'],
+						   pending_renewal_requests=counters['pending_renewal_requests'],
+						   total_customer_requests=counters['total_customer_requests'],
 						   now=datetime.now())
 
 @app.route('/insurer/search')
@@ -1999,20 +1645,7 @@ def create_policy():
 		# Generate policy number based on policy type
 		policy_type = form.policy_type.data
 		prefix = 'CO' if policy_type == 'Comprehensive' else 'TO'
-		
-		# Get the latest policy number for this type
-		last_policy = Policy.query.filter(
-			Policy.policy_number.like(f'{prefix}-%')
-		).order_by(Policy.id.desc()).first()
-		
-		if last_policy:
-			# Extract number and increment
-			last_num = int(last_policy.policy_number.split('-')[1])
-			new_num = last_num + 1
-		else:
-			new_num = 1
-		
-		policy_number = f'{prefix}-{str(new_num).zfill(4)}'
+		policy_number = sequences.next_number(prefix)
 		
 		# Calculate expiry date (1 year from effective date)
 		effective_date = form.effective_date.data
@@ -2064,7 +1697,7 @@ def create_policy():
 		]
 		
 		# Create upload directory for this policy
-		upload_dir = os.path.join(app.root_path, 'upload', 'insurer', str(new_policy.id))
+		upload_dir = os.path.join(app.root_path, app.config['UPLOAD_DIR'], 'insurer', str(new_policy.id))
 		os.makedirs(upload_dir, exist_ok=True)
 		
 		# Save each photo
@@ -2117,7 +1750,7 @@ def upload_photo(policy_id):
 		return jsonify({'success': False, 'error': 'Photo type not specified'}), 400
 	
 	# Create upload directory for this policy
-	upload_dir = os.path.join(app.root_path, 'upload', 'insurer', str(policy_id))
+	upload_dir = os.path.join(app.root_path, app.config['UPLOAD_DIR'], 'insurer', str(policy_id))
 	os.makedirs(upload_dir, exist_ok=True)
 	
 	# Secure filename and save
@@ -2141,6 +1774,54 @@ def upload_photo(policy_id):
 		'file_path': relative_path
 	})
 
+@app.route('/insurer/import-policies', methods=['GET', 'POST'])
+@login_required
+@insurer_required
+def import_policies():
+	"""Create policies in bulk from a CSV or Excel sheet"""
+	# Ensure insurer is approved
+	if not current_user.is_approved:
+		flash('You must be approved to create policies.', 'warning')
+		return redirect(url_for('insurer_dashboard'))
+	
+	result = None
+	report_url = None
+	if request.method == 'POST':
+		upload = request.files.get('file')
+		fmt = imports.import_format(upload.filename if upload else None)
+		if fmt is None:
+			flash('Please upload a CSV or Excel (.xlsx) file.', 'danger')
+		elif fmt == 'xlsx' and not imports.excel_available():
+			flash('Excel imports are not available on this server. Please upload a CSV file.', 'danger')
+		else:
+			try:
+				result = imports.import_policies(imports.read_rows(upload.stream, fmt), current_user)
+			except imports.UnreadableFile:
+				db.session.rollback()
+				flash('The file could not be read. Policies from rows before the problem were imported.', 'danger')
+			else:
+				if result.errors:
+					filename = imports.save_error_report(result)
+					report_url = url_for('download_import_errors', token=imports.report_token(filename, current_user.insurance_company_id))
+					flash(f'Imported {result.imported} policies. {len(result.errors)} rows were rejected.', 'warning')
+				else:
+					flash(f'Imported {result.imported} policies.', 'success')
+	
+	return render_template('insurer/import_policies.html',
+						   result=result,
+						   report_url=report_url,
+						   columns=imports.import_columns())
+
+@app.route('/insurer/import-policies/errors/<token>')
+@login_required
+@insurer_required
+def download_import_errors(token):
+	"""Download the rejected rows of a policy import"""
+	filename = imports.report_for_token(token, current_user.insurance_company_id)
+	if filename is None:
+		abort(404)
+	return send_from_directory(imports.import_dir(), filename, as_attachment=True, download_name='policy_import_errors.csv')
+
 @app.route('/insurer/manage-policies')
 @login_required
 @insurer_required
@@ -2183,24 +1864,25 @@ def manage_policies():
 	elif status_filter == 'cancelled':
 		policies_query = policies_query.filter_by(status='Cancelled')
 	
-	# Order by creation date (newest first)
-	policies = policies_query.order_by(Policy.date_entered.desc()).all()
+	# One page at a time, newest first
+	try:
+		page = pagination.keyset_page(loaders.load(policies_query, 'policy_list'), Policy.date_entered, Policy.id, request.args)
+	except ValueError:
+		abort(400)
 	
 	# Calculate statistics
-	total_policies = Policy.query.filter_by(insurance_company_id=current_user.insurance_company_id).count()
-	active_policies = Policy.query.filter_by(insurance_company_id=current_user.insurance_company_id, status='Active').count()
-	cancelled_policies = Policy.query.filter_by(insurance_company_id=current_user.insurance_company_id, status='Cancelled').count()
-	expired_policies = Policy.query.filter_by(insurance_company_id=current_user.insurance_company_id, status='Expired').count()
+	summary = reports.policy_summary(current_user.insurance_company_id)
 	
 	return render_template('insurer/manage_policies.html', 
-						   policies=policies,
+						   policies=page.items,
+						   page=page,
 						   search_query=search_query,
 						   policy_type_filter=policy_type_filter,
 						   status_filter=status_filter,
-						   total_policies=total_policies,
-						   active_policies=active_policies,
-						   cancelled_policies=cancelled_policies,
-						   expired_policies=expired_policies,
+						   total_policies=summary['total'],
+						   active_policies=summary['active'],
+						   cancelled_policies=summary['cancelled'],
+						   expired_policies=summary['expired'],
 						   now=datetime.now())
 
 @app.route('/insurer/policy/<int:policy_id>')
@@ -2227,7 +1909,7 @@ def view_policy(policy_id):
 		canceller = Insurer.query.get(policy.cancelled_by)
 	
 	# Check if policy is active
-	is_active = policy.expiry_date >= datetime.now().date()
+	is_active = policy.status == 'Active' and policy.expiry_date >= datetime.now().date()
 	
 	return render_template('insurer/view_policy.html', 
 						   policy=policy,
@@ -2349,23 +2031,23 @@ def manage_claims():
 			(Policy.insured_name.ilike(f'%{search_query}%'))
 		)
 	
-	# Get claims ordered by submission date (newest first)
-	claims = query.order_by(Claim.date_submitted.desc()).all()
+	# One page at a time, newest submissions first
+	try:
+		page = pagination.keyset_page(loaders.load(query, 'claim_list'), Claim.date_submitted, Claim.id, request.args)
+	except ValueError:
+		abort(400)
 	
 	# Calculate statistics
-	total_claims = Claim.query.filter_by(insurance_company_id=company_id).count()
-	pending_claims = Claim.query.filter_by(insurance_company_id=company_id, status='Pending').count()
-	under_review = Claim.query.filter_by(insurance_company_id=company_id, status='Under Review').count()
-	approved_claims = Claim.query.filter_by(insurance_company_id=company_id, status='Approved').count()
-	rejected_claims = Claim.query.filter_by(insurance_company_id=company_id, status='Rejected').count()
+	summary = reports.claim_summary(company_id)
 	
 	return render_template('insurer/claims.html',
-						   claims=claims,
-						   total_claims=total_claims,
-						   pending_claims=pending_claims,
-						   under_review=under_review,
-						   approved_claims=approved_claims,
-						   rejected_claims=rejected_claims,
+						   claims=page.items,
+						   page=page,
+						   total_claims=summary['total'],
+						   pending_claims=summary['pending'],
+						   under_review=summary['under_review'],
+						   approved_claims=summary['approved'],
+						   rejected_claims=summary['rejected'],
 						   status_filter=status_filter,
 						   search_query=search_query,
 						   datetime=datetime)
@@ -2401,13 +2083,7 @@ def create_claim():
 				return render_template('insurer/create_claim.html', form=form, datetime=datetime)
 			
 			# Generate claim number (CL-XXXX format)
-			last_claim = Claim.query.order_by(Claim.id.desc()).first()
-			if last_claim and last_claim.claim_number.startswith('CL-'):
-				last_number = int(last_claim.claim_number.split('-')[1])
-				new_number = last_number + 1
-			else:
-				new_number = 1
-			claim_number = f"CL-{new_number:04d}"
+			claim_number = sequences.next_number('CL')
 			
 			# Create claim
 			claim = Claim(
@@ -2436,8 +2112,8 @@ def create_claim():
 			db.session.add(claim)
 			db.session.commit()
 			
-			# Create directory for claim documents - changed to upload/claims/{id}
-			claim_dir = os.path.join('upload', 'claims', str(claim.id))
+			# Create directory for claim documents: claims/{id} under UPLOAD_DIR
+			claim_dir = os.path.join(app.root_path, app.config['UPLOAD_DIR'], 'claims', str(claim.id))
 			os.makedirs(claim_dir, exist_ok=True)
 			
 			# Handle file uploads
@@ -2541,7 +2217,7 @@ def upload_claim_document(claim_id):
 	if file:
 		try:
 			filename = secure_filename(file.filename)
-			claim_dir = os.path.join('upload', 'claims', str(claim_id))
+			claim_dir = os.path.join(app.root_path, app.config['UPLOAD_DIR'], 'claims', str(claim_id))
 			os.makedirs(claim_dir, exist_ok=True)
 			
 			file_path = os.path.join(claim_dir, f"{document_type}_{filename}")
@@ -2742,6 +2418,28 @@ def reject_claim(claim_id):
 	flash(f'Claim {claim.claim_number} has been rejected.', 'info')
 	return redirect(url_for('view_claim', claim_id=claim_id))
 
+@app.route('/api/insurer/claims/batch', methods=['POST'])
+@login_required
+@insurer_required
+def intake_claims():
+	"""Create claims in bulk from JSON lines or CSV, answering with a result per row"""
+	if not current_user.is_approved:
+		return jsonify({'success': False, 'error': 'Not approved'}), 403
+	
+	fmt = claim_intake.intake_format(request.mimetype, request.args.get('format'))
+	if fmt is None:
+		return jsonify({'success': False, 'error': 'Send JSON lines (application/x-ndjson) or CSV (text/csv)'}), 415
+	
+	try:
+		result = claim_intake.intake_claims(claim_intake.read_rows(request.stream, fmt), current_user)
+	except imports.UnreadableFile:
+		db.session.rollback()
+		return jsonify({'success': False, 'error': 'The request body is not UTF-8 JSON lines or CSV'}), 400
+	
+	if result.documents_queued:
+		claim_intake.dispatch()
+	return jsonify({'success': True, **result.report()})
+
 @app.route('/api/search-policies')
 @login_required
 @insurer_required
@@ -2754,32 +2452,38 @@ def search_policies_api():
 	if len(query) < 2:
 		return jsonify({'policies': []})
 	
-	# Search only policies for this insurance company
-	policies = Policy.query.filter(
-		Policy.insurance_company_id == current_user.insurance_company_id,
-		(Policy.registration_number.ilike(f'%{query}%')) |
-		(Policy.insured_name.ilike(f'%{query}%')) |
-		(Policy.policy_number.ilike(f'%{query}%'))
-	).limit(10).all()
-	
-	results = []
-	for policy in policies:
-		results.append({
-			'id': policy.id,
-			'policy_number': policy.policy_number,
-			'insured_name': policy.insured_name,
-			'registration_number': policy.registration_number,
-			'national_id': policy.national_id,
-			'phone_number': policy.phone_number,
-			'email_address': policy.email_address,
-			'make_model': policy.make_model,
-			'year_of_manufacture': policy.year_of_manufacture,
-			'chassis_number': policy.chassis_number,
-			'engine_number': policy.engine_number,
-			'policy_type': policy.policy_type
-		})
+	# Search only policies for this insurance company; suggestions carry
+	# just what the dropdown shows, details are fetched once one is picked
+	policies = autocomplete.suggest_policies(current_user.insurance_company_id, query)
+	return jsonify({'policies': policies})
+
+@app.route('/api/policies/<int:policy_id>')
+@login_required
+@insurer_required
+def policy_details_api(policy_id):
+	"""API endpoint for the details of a policy picked from the autocomplete"""
+	if not current_user.is_approved:
+		abort(403)
 	
-	return jsonify({'policies': results})
+	policy = Policy.query.filter_by(
+		id=policy_id,
+		insurance_company_id=current_user.insurance_company_id
+	).first_or_404()
+	
+	return jsonify({'policy': {
+		'id': policy.id,
+		'policy_number': policy.policy_number,
+		'insured_name': policy.insured_name,
+		'registration_number': policy.registration_number,
+		'national_id': policy.national_id,
+		'phone_number': policy.phone_number,
+		'email_address': policy.email_address,
+		'make_model': policy.make_model,
+		'year_of_manufacture': policy.year_of_manufacture,
+		'chassis_number': policy.chassis_number,
+		'engine_number': policy.engine_number,
+		'policy_type': policy.policy_type
+	}})
 
 @app.route('/insurer/premium-calculator', methods=['GET', 'POST'])
 @login_required
@@ -2941,13 +2645,7 @@ def create_quote_from_calculator():
 		return redirect(url_for('premium_calculator'))
 	
 	# Generate quote number
-	last_quote = Quote.query.order_by(Quote.id.desc()).first()
-	if last_quote and last_quote.quote_number.startswith('QT-'):
-		last_number = int(last_quote.quote_number.split('-')[1])
-		new_number = last_number + 1
-	else:
-		new_number = 1
-	quote_number = f"QT-{new_number:06d}"
+	quote_number = sequences.next_number('QT')
 	
 	# Create quote
 	from datetime import timedelta
@@ -3027,6 +2725,7 @@ def view_quote(quote_id):
 @app.route('/insurer/reports-and-insights')
 @login_required
 @insurer_required
+@replica.reads
 def reports_and_insights():
 	"""View comprehensive reports and insights"""
 	if not current_user.is_approved:
@@ -3187,19 +2886,19 @@ def insurer_customer_requests():
 	company_policy_ids = [p.id for p in Policy.query.filter_by(insurance_company_id=company_id).all()]
 	
 	# Access requests
-	access_requests = CustomerPolicyRequest.query.filter(
+	access_requests = loaders.load(CustomerPolicyRequest.query, 'access_requests').filter(
 		CustomerPolicyRequest.policy_id.in_(company_policy_ids),
 		CustomerPolicyRequest.status == 'pending'
 	).order_by(CustomerPolicyRequest.request_date.desc()).all()
 	
 	# Cancellation requests
-	cancellation_requests = PolicyCancellationRequest.query.filter(
+	cancellation_requests = loaders.load(PolicyCancellationRequest.query, 'cancellation_requests').filter(
 		PolicyCancellationRequest.policy_id.in_(company_policy_ids),
 		PolicyCancellationRequest.status == 'pending'
 	).order_by(PolicyCancellationRequest.request_date.desc()).all()
 	
 	# Renewal requests
-	renewal_requests = PolicyRenewalRequest.query.filter(
+	renewal_requests = loaders.load(PolicyRenewalRequest.query, 'renewal_requests').filter(
 		PolicyRenewalRequest.policy_id.in_(company_policy_ids),
 		PolicyRenewalRequest.status == 'pending'
 	).order_by(PolicyRenewalRequest.request_date.desc()).all()
@@ -3412,6 +3111,7 @@ def insurer_reject_renewal_request(request_id):
 @app.route('/regulator/dashboard')
 @login_required
 @regulator_required
+@replica.reads
 def regulator_dashboard():
 	# Check if regulator is approved
 	if not current_user.is_approved:
@@ -3429,67 +3129,26 @@ def regulator_dashboard():
 	
 	# Regulator is approved, show dashboard with data
 	
-	# Get all insurance companies
-	all_companies = InsuranceCompany.query.filter_by(is_active=True).all()
-	
-	# Get all insurers with their company info
-	all_insurers = Insurer.query.filter_by(is_approved=True).all()
-	
-	# Get all policies and claims for statistics
-	all_policies = Policy.query.all()
-	all_claims = Claim.query.all()
+	# Policy and claim statistics from the global rollup
+	rollup = metrics.get_rollup()
 	
 	# Calculate statistics
-	total_companies = len(all_companies)
-	total_insurers = len(all_insurers)
-	total_policies = len(all_policies)
-	active_policies = sum(1 for p in all_policies if p.status == 'Active')
-	total_claims = len(all_claims)
-	pending_claims = sum(1 for c in all_claims if c.status == 'Pending')
+	total_companies = InsuranceCompany.query.filter_by(is_active=True).count()
+	total_insurers = Insurer.query.filter_by(is_approved=True).count()
+	total_policies = rollup.policies_total
+	active_policies = rollup.policies_active
+	total_claims = rollup.claims_total
+	pending_claims = rollup.claims_pending
 	
 	# Calculate compliance rate (based on claim approval rate)
-	approved_claims = sum(1 for c in all_claims if c.status == 'Approved')
+	approved_claims = rollup.claims_approved
 	compliance_rate = (approved_claims / total_claims * 100) if total_claims > 0 else 100
 	
-	# Get company performance data
-	company_data = []
-	for company in all_companies[:10]:  # Top 10 companies
-		comp_policies = Policy.query.filter_by(insurance_company_id=company.id).all()
-		comp_active = sum(1 for p in comp_policies if p.status == 'Active')
-		comp_claims = Claim.query.join(Policy).filter(Policy.insurance_company_id == company.id).all()
-		comp_approved = sum(1 for c in comp_claims if c.status == 'Approved')
-		comp_total_claims = len(comp_claims)
-		
-		# Calculate compliance score
-		claim_approval = (comp_approved / comp_total_claims * 100) if comp_total_claims > 0 else 100
-		compliance_score = min(100, claim_approval)
-		
-		company_data.append({
-			'name': company.name,
-			'active_policies': comp_active,
-			'compliance_score': compliance_score,
-			'status': 'Active' if company.is_active else 'Inactive'
-		})
-	
-	# Sort by compliance score
-	company_data.sort(key=lambda x: x['compliance_score'], reverse=True)
+	# Top 10 companies by compliance score, ranked in the database
+	company_data = reports.company_scorecard(limit=10)
 	
-	# Get recent claims as "issues" (claims with Rejected or Pending status could be violations)
-	recent_issues = []
-	problem_claims = Claim.query.filter(
-		Claim.status.in_(['Rejected', 'Under Review'])
-	).order_by(Claim.date_submitted.desc()).limit(10).all()
-	
-	for claim in problem_claims:
-		issue_type = 'Claim Processing' if claim.status == 'Under Review' else 'Claim Rejection'
-		severity = 'Medium' if claim.status == 'Under Review' else 'High'
-		
-		recent_issues.append({
-			'id': claim.claim_number,
-			'company': claim.insurance_company.name if claim.insurance_company else 'Unknown',
-			'type': issue_type,
-			'severity': severity
-		})
+	# Recent rejected / under-review claims as "issues"
+	recent_issues = reports.recent_issues(limit=10)
 	
 	return render_template('regulator/regulatordashboard.html',
 		total_companies=total_companies,
@@ -3560,44 +3219,28 @@ def regulator_search():
 		'claims': []
 	}
 	
+	timed_out = []
 	if query:
-		search_pattern = f"%{query}%"
+		searches = {}
 		
 		# Search insurance companies
 		if search_type in ['all', 'companies']:
-			results['companies'] = InsuranceCompany.query.filter(
-				InsuranceCompany.name.ilike(search_pattern)
-			).limit(20).all()
+			searches['companies'] = lambda: loaders.load(search.ranked(InsuranceCompany, query), 'company_scorecard').limit(20).all()
 		
 		# Search insurers (professionals)
 		if search_type in ['all', 'insurers']:
-			results['insurers'] = Insurer.query.filter(
-				db.or_(
-					Insurer.username.ilike(search_pattern),
-					Insurer.email.ilike(search_pattern),
-					Insurer.staff_id.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['insurers'] = lambda: loaders.load(search.ranked(Insurer, query), 'insurer_list').limit(20).all()
 		
 		# Search all policies (regulatory oversight)
 		if search_type in ['all', 'policies']:
-			results['policies'] = Policy.query.filter(
-				db.or_(
-					Policy.policy_number.ilike(search_pattern),
-					Policy.insured_name.ilike(search_pattern),
-					Policy.registration_number.ilike(search_pattern),
-					Policy.national_id.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['policies'] = lambda: loaders.load(search.ranked(Policy, query), 'policy_list').limit(20).all()
 		
 		# Search all claims (regulatory oversight)
 		if search_type in ['all', 'claims']:
-			results['claims'] = Claim.query.filter(
-				db.or_(
-					Claim.claim_number.ilike(search_pattern),
-					Claim.police_report_number.ilike(search_pattern)
-				)
-			).limit(20).all()
+			searches['claims'] = lambda: loaders.load(search.ranked(Claim, query), 'claim_list').limit(20).all()
+		
+		found, timed_out = search.run_searches(searches)
+		results.update(found)
 	
 	total_results = sum(len(v) for v in results.values())
 	
@@ -3605,12 +3248,14 @@ def regulator_search():
 		query=query,
 		search_type=search_type,
 		results=results,
-		total_results=total_results
+		total_results=total_results,
+		timed_out=timed_out
 	)
 
 @app.route('/regulator/reports-and-insights')
 @login_required
 @regulator_required
+@replica.reads
 def regulator_reports_and_insights():
 	"""View comprehensive regulatory oversight reports and insights"""
 	if not current_user.is_approved:
@@ -3734,92 +3379,133 @@ def regulator_reports_and_insights():
 @app.route('/regulator/export-reports-csv')
 @login_required
 @regulator_required
+@replica.reads
 def regulator_export_reports_csv():
 	"""Export regulator reports data to CSV"""
 	if not current_user.is_approved:
 		return redirect(url_for('request_regulator_access'))
 	
-	si = StringIO()
-	writer = csv.writer(si)
+	fmt = exports.requested_format(request.args)
+	if fmt is None:
+		flash('Parquet and Arrow exports are not available on this server.', 'warning')
+		return redirect(url_for('regulator_reports_and_insights'))
 	
 	# Get export type from query parameter
 	export_type = request.args.get('type', 'summary')
+	return exports.export_response(f'clearview_regulator_report_{export_type}', exports.regulator_report(export_type), fmt)
+
+# ========== BACKGROUND EXPORT JOBS ==========
+
+@app.route('/export-jobs', methods=['POST'])
+@login_required
+def create_export_job():
+	"""Queue a background export (kind plus the same filters as the CSV routes)"""
+	kind = request.values.get('kind', '')
+	if not export_jobs.can_request(current_user, kind):
+		return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+	if exports.requested_format(request.values) is None:
+		return jsonify({'success': False, 'error': 'Parquet and Arrow exports are not available on this server'}), 400
 	
-	if export_type == 'companies':
-		writer.writerow(['Company Name', 'Active Policies', 'Total Premium (KES)', 'Total Claims', 'Approved Claims', 'Rejected Claims', 'Staff Count', 'Compliance Score'])
-		all_companies = InsuranceCompany.query.filter_by(is_active=True).all()
-		for company in all_companies:
-			comp_policies = Policy.query.filter_by(insurance_company_id=company.id).all()
-			comp_active = sum(1 for p in comp_policies if p.status == 'Active')
-			comp_premium = sum(p.premium_amount for p in comp_policies if p.status == 'Active')
-			comp_claims = Claim.query.join(Policy).filter(Policy.insurance_company_id == company.id).all()
-			comp_total_claims = len(comp_claims)
-			comp_approved_claims = sum(1 for c in comp_claims if c.status == 'Approved')
-			comp_rejected_claims = sum(1 for c in comp_claims if c.status == 'Rejected')
-			comp_staff = Insurer.query.filter_by(insurance_company_id=company.id, is_approved=True).count()
-			claim_approval = (comp_approved_claims / comp_total_claims * 100) if comp_total_claims else 100
-			compliance_score = min(100, (claim_approval * 0.6 + 40))
-			writer.writerow([company.name, comp_active, f'{comp_premium:.2f}', comp_total_claims, comp_approved_claims, comp_rejected_claims, comp_staff, f'{compliance_score:.1f}'])
-	
-	elif export_type == 'policies':
-		writer.writerow(['Policy Number', 'Company', 'Type', 'Premium (KES)', 'Status', 'Start Date', 'Expiry Date'])
-		all_policies = Policy.query.all()
-		for p in all_policies:
-			writer.writerow([
-				p.policy_number,
-				p.insurance_company.name if p.insurance_company else 'N/A',
-				p.policy_type,
-				f'{p.premium_amount:.2f}',
-				p.status,
-				p.start_date.strftime('%Y-%m-%d') if p.start_date else 'N/A',
-				p.expiry_date.strftime('%Y-%m-%d') if p.expiry_date else 'N/A'
-			])
-	
-	elif export_type == 'claims':
-		writer.writerow(['Claim Number', 'Policy Number', 'Company', 'Status', 'Date Submitted', 'Review Date'])
-		all_claims = Claim.query.all()
-		for c in all_claims:
-			writer.writerow([
-				c.claim_number,
-				c.policy.policy_number if c.policy else 'N/A',
-				c.insurance_company.name if c.insurance_company else 'N/A',
-				c.status,
-				c.date_submitted.strftime('%Y-%m-%d') if c.date_submitted else 'N/A',
-				c.review_date.strftime('%Y-%m-%d') if c.review_date else 'N/A'
-			])
-	
-	else:  # summary
-		writer.writerow(['Metric', 'Value'])
-		all_companies = InsuranceCompany.query.filter_by(is_active=True).all()
-		all_policies = Policy.query.all()
-		all_claims = Claim.query.all()
-		all_quotes = Quote.query.all()
-		
-		writer.writerow(['Total Insurance Companies', len(all_companies)])
-		writer.writerow(['Total Policies', len(all_policies)])
-		writer.writerow(['Active Policies', sum(1 for p in all_policies if p.status == 'Active')])
-		writer.writerow(['Total Premium (KES)', f'{sum(p.premium_amount for p in all_policies if p.status == "Active"):.2f}'])
-		writer.writerow(['Total Claims', len(all_claims)])
-		writer.writerow(['Approved Claims', sum(1 for c in all_claims if c.status == 'Approved')])
-		writer.writerow(['Rejected Claims', sum(1 for c in all_claims if c.status == 'Rejected')])
-		writer.writerow(['Claim Approval Rate (%)', f'{(sum(1 for c in all_claims if c.status == "Approved") / len(all_claims) * 100):.2f}' if all_claims else '0.00'])
-		writer.writerow(['Total Quotes', len(all_quotes)])
-		writer.writerow(['Quote Conversion Rate (%)', f'{(sum(1 for q in all_quotes if q.status == "Converted") / len(all_quotes) * 100):.2f}' if all_quotes else '0.00'])
-	
-	output = si.getvalue()
-	si.close()
-	
-	return Response(
-		output,
-		mimetype='text/csv',
-		headers={'Content-Disposition': f'attachment; filename=clearview_regulator_report_{export_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
+	job = export_jobs.submit_export(kind, request.values, current_user.get_id())
+	return jsonify({'success': True, 'job': export_jobs.job_status(job)}), 202
+
+@app.route('/export-jobs/<int:job_id>')
+@login_required
+def export_job_status(job_id):
+	"""Progress of a background export, with a download link once finished"""
+	job = db.session.get(ExportJob, job_id)
+	if job is None:
+		return jsonify({'success': False, 'error': 'Export job not found'}), 404
+	if not export_jobs.can_request(current_user, job.kind):
+		return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+	return jsonify({'success': True, 'job': export_jobs.job_status(job)})
+
+@app.route('/exports/<token>')
+@login_required
+def download_export(token):
+	"""Download a finished export through its signed link"""
+	job = export_jobs.job_for_token(token)
+	if job is None or not export_jobs.can_request(current_user, job.kind):
+		abort(404)
+	return send_from_directory(
+		export_jobs.export_dir(), job.file_path,
+		as_attachment=True,
+		download_name=f'clearview_{job.kind}_{job.completed_at.strftime("%Y%m%d_%H%M%S")}{os.path.splitext(job.file_path)[1]}'
 	)
 
+@app.cli.command('run-export-jobs')
+def run_export_jobs_command():
+	"""Fail stalled background exports, then run every queued one in this process"""
+	reaped = export_jobs.reap_stale_jobs()
+	jobs = export_jobs.run_queued_jobs()
+	print(f"Failed {reaped} stalled export jobs")
+	print(f"Ran {jobs} export jobs")
+
+@app.cli.command('expire-policies')
+def expire_policies_command():
+	"""Mark lapsed policies and quotes as expired"""
+	policies, quotes = expiry.run()
+	print(f"Expired {policies} policies and {quotes} quotes")
+
+@app.cli.command('archive-policies')
+def archive_policies_command():
+	"""Move long-expired and cancelled policies to the archive tables"""
+	policies = archive.archive_policies()
+	print(f"Archived {policies} policies")
+
+@app.cli.command('import-policies')
+@click.argument('path')
+@click.option('--insurer', 'email', required=True, help='Email of the insurer creating the policies')
+@click.option('--errors', 'errors_path', help='Write rejected rows to this CSV file')
+def import_policies_command(path, email, errors_path):
+	"""Create policies in bulk from a CSV or Excel sheet"""
+	insurer = Insurer.query.filter_by(email=email).first()
+	if insurer is None:
+		raise click.ClickException(f'No insurer with email {email}')
+	fmt = imports.import_format(path)
+	if fmt is None:
+		raise click.ClickException('Expected a .csv or .xlsx file')
+	with open(path, 'rb') as stream:
+		result = imports.import_policies(imports.read_rows(stream, fmt), insurer)
+	print(f"Imported {result.imported} of {result.rows} rows in {result.seconds:.1f}s ({result.rows / max(result.seconds, 0.001):.0f} rows/s)")
+	if result.errors:
+		if errors_path:
+			with open(errors_path, 'w', newline='', encoding='utf-8') as output:
+				imports.write_error_report(result, output)
+			print(f"{len(result.errors)} rows rejected, see {errors_path}")
+		else:
+			for row_number, registration_number, message in result.errors:
+				print(f"Row {row_number} ({registration_number}): {message}")
+
+@app.cli.command('store-claim-documents')
+@click.option('--retry-failed', is_flag=True, help='Queue documents that failed to store again first')
+def store_claim_documents_command(retry_failed):
+	"""Store claim documents queued by the batch claim intake"""
+	if retry_failed:
+		print(f"Queued {claim_intake.retry_failed_documents()} failed claim documents again")
+	documents = claim_intake.store_queued_documents()
+	print(f"Stored {documents} claim documents")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+	"""Rebuild the full-text search index from the raw tables"""
+	rows = search.rebuild_index()
+	print(f"Indexed {rows} search documents")
+
+@app.cli.command('reconcile-metrics')
+def reconcile_metrics_command():
+	"""Rebuild the dashboard metrics rollup from the raw tables"""
+	rows = metrics.reconcile_rollups()
+	print(f"Reconciled {rows} metrics rollup rows")
+
 @app.route('/uploads/<path:filename>')
 @login_required
 def uploaded_file(filename):
 	"""Serve uploaded files"""
-	return send_from_directory(os.path.join(app.root_path, 'upload'), filename)
+	# Export files and import error reports are only served through their signed download links
+	if os.path.normpath(filename).split(os.sep, 1)[0] in ('exports', 'imports'):
+		abort(404)
+	return send_from_directory(os.path.join(app.root_path, app.config['UPLOAD_DIR']), filename)
 
 if __name__ == '__main__':
 	app.run(debug=True)
\ No newline at end of file
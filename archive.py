@@ -0,0 +1,124 @@
+import calendar
+from datetime import date, datetime, time
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+
+from extension import db
+from models import (Policy, PolicyPhoto, Claim, ClaimDocument, ClaimDocumentUpload, CustomerMonitoredPolicy, CustomerPolicyRequest,
+	PolicyCancellationRequest, PolicyRenewalRequest, PolicyArchive, PolicyPhotoArchive, ClaimArchive,
+	ClaimDocumentArchive, registration_key)
+
+
+# Archive tier. Policies expired (or cancelled) more than ARCHIVE_AFTER_MONTHS
+# ago move, with their photos, claims and claim documents, into the *_archive
+# tables, so the hot tables that reports and dashboards scan only hold
+# policies people still work with. Each batch copies ARCHIVE_BATCH_SIZE
+# policies and deletes the originals in one transaction: a stopped run
+# leaves every policy either live or archived, and the next run carries on
+# from whatever is still eligible. The deletes go through the session so
+# the metrics rollup, search index and autocomplete follow them like any
+# other delete. Policies with open claims, claim documents the document
+# worker has not stored yet (queued, storing or failed uploads), customer
+# requests or monitoring customers stay live. Vehicle history includes the
+# archive when asked.
+
+# live model -> archive model
+ARCHIVES = {
+	Policy: PolicyArchive,
+	PolicyPhoto: PolicyPhotoArchive,
+	Claim: ClaimArchive,
+	ClaimDocument: ClaimDocumentArchive
+}
+
+OPEN_CLAIM_STATUSES = ('Pending', 'Under Review')
+
+POLICY_REFERENCES = (CustomerMonitoredPolicy, CustomerPolicyRequest, PolicyCancellationRequest, PolicyRenewalRequest)
+REFERENCE_COLLECTIONS = ('monitoring_customers', 'access_requests', 'cancellation_requests', 'renewal_requests')
+
+
+def months_before(day, months):
+	"""The same day of the month, months earlier (clamped to the month's end)"""
+	month = day.month - 1 - months
+	year = day.year + month // 12
+	month = month % 12 + 1
+	return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def archivable(cutoff):
+	"""Condition for policies that ended before cutoff and nothing live still points at"""
+	ended = db.or_(
+		db.and_(Policy.status == 'Expired', Policy.expiry_date < cutoff),
+		db.and_(Policy.status == 'Cancelled', Policy.cancellation_date < datetime.combine(cutoff, time.min))
+	)
+	open_claims = select(Claim.id).where(Claim.policy_id == Policy.id, Claim.status.in_(OPEN_CLAIM_STATUSES))
+	pending_uploads = select(ClaimDocumentUpload.id).join(Claim, ClaimDocumentUpload.claim_id == Claim.id).where(
+		Claim.policy_id == Policy.id
+	)
+	referenced = [select(model.id).where(model.policy_id == Policy.id) for model in POLICY_REFERENCES]
+	return db.and_(ended, ~open_claims.exists(), ~pending_uploads.exists(), *(~query.exists() for query in referenced))
+
+
+def archive_row(obj, archived_at):
+	row = {column.key: getattr(obj, column.key) for column in type(obj).__table__.columns}
+	row['archived_at'] = archived_at
+	return row
+
+
+def archive_batch(cutoff, batch_size):
+	"""Archive up to batch_size eligible policies in one transaction; returns how many"""
+	policy_ids = db.session.execute(
+		select(Policy.id).where(archivable(cutoff)).order_by(Policy.id).limit(batch_size)
+	).scalars().all()
+	if not policy_ids:
+		return 0
+
+	# The reference collections are empty, but the delete would otherwise
+	# lazy-load each of them per policy
+	policies = Policy.query.filter(Policy.id.in_(policy_ids)).options(
+		selectinload(Policy.photos),
+		selectinload(Policy.claims).selectinload(Claim.documents),
+		*(selectinload(getattr(Policy, name)) for name in REFERENCE_COLLECTIONS)
+	).all()
+	archived_at = datetime.utcnow()
+	rows = {model: [] for model in ARCHIVES}
+	for policy in policies:
+		rows[Policy].append(archive_row(policy, archived_at))
+		rows[PolicyPhoto].extend(archive_row(photo, archived_at) for photo in policy.photos)
+		for claim in policy.claims:
+			rows[Claim].append(archive_row(claim, archived_at))
+			rows[ClaimDocument].extend(archive_row(document, archived_at) for document in claim.documents)
+
+	for model, archive_model in ARCHIVES.items():
+		if rows[model]:
+			db.session.execute(insert(archive_model), rows[model])
+	# Photos and documents go with their policy and claim (delete-orphan cascades)
+	for policy in policies:
+		for claim in policy.claims:
+			db.session.delete(claim)
+		db.session.delete(policy)
+	db.session.commit()
+	return len(policies)
+
+
+def archive_policies(today=None, batch_size=None):
+	"""Archive every eligible policy, a batch at a time; returns how many"""
+	cutoff = months_before(today or date.today(), current_app.config['ARCHIVE_AFTER_MONTHS'])
+	batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+	archived = 0
+	while True:
+		count = archive_batch(cutoff, batch_size)
+		archived += count
+		if count < batch_size:
+			return archived
+
+
+def archived_vehicle_history(registration_number):
+	"""(policies, claims) archived for a registration number, ignoring spacing and punctuation"""
+	policies = PolicyArchive.query.filter_by(registration_key=registration_key(registration_number)).order_by(
+		PolicyArchive.expiry_date.desc()
+	).all()
+	policy_ids = [policy.id for policy in policies]
+	claims = ClaimArchive.query.filter(ClaimArchive.policy_id.in_(policy_ids)).all() if policy_ids else []
+	return policies, claims
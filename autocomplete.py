@@ -0,0 +1,393 @@
+import threading
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from extension import db, cache
+from models import InsuranceCompany, Policy
+from search import words
+
+
+# Policy autocomplete for the claim form. Every worker keeps an index of
+# each company's policies in process, built at start and patched after
+# every commit that touches a policy: sorted registration and policy
+# numbers answer prefix queries, the common case for adjusters typing a
+# number plate, without touching the database.
+# Substring queries (names, the middle of a number) of three or more
+# characters go to pg_trgm GIN indexes on Postgres; elsewhere (SQLite in
+# development) the index also keeps trigram postings to answer them.
+# Shorter text only matches prefixes, so a keystroke never scans a whole
+# company.
+#
+# Every commit that changes a company's policies publishes its row changes
+# to the cache as the company's next numbered delta. Workers replay the
+# deltas they have not seen onto a copy of their index, so other processes
+# catch up without reloading anything; only a worker missing a delta
+# (expired after AUTOCOMPLETE_DELTA_TIMEOUT, or too far behind) rebuilds,
+# on a background thread, answering from its old index meanwhile. A
+# published index is never changed, so lookups read it without a lock.
+# This only works when every process shares the cache; with a per-process
+# cache (AUTOCOMPLETE_INDEX off, the default for SimpleCache) every
+# suggestion comes from the database.
+
+# Matched against the typed text
+MATCHED_FIELDS = ('policy_number', 'insured_name', 'registration_number')
+# Returned for each suggestion: what the dropdown shows
+DROPDOWN_FIELDS = ('id', 'policy_number', 'insured_name', 'registration_number', 'make_model', 'policy_type')
+# Kept sorted for prefix lookups; matches on these rank first
+PREFIX_FIELDS = ('registration_number', 'policy_number')
+
+SUGGESTION_LIMIT = 10
+# Shorter text is matched against prefixes only
+SUBSTRING_MIN_LENGTH = 3
+# A worker further behind than this many deltas rebuilds instead of replaying
+REPLAY_LIMIT = 1000
+
+_lock = threading.Lock()  # Guards _indexes and _rebuilds, never held during a lookup or cache call
+_indexes = {}
+_rebuilds = {}  # company id -> future of its background rebuild
+_executor = None
+
+
+def normalise(value):
+	"""Lower-cased value with spacing and punctuation removed, so 'KAA 123A',
+	'kaa-123a' and 'KAA123A' are the same key"""
+	return ''.join(words(value))
+
+
+def trigrams(key):
+	return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+class CompanyIndex:
+	"""Prefix (and optionally trigram) index of one company's policies.
+	Changed only before it is published; later changes go to a copy"""
+
+	def __init__(self, version, substring=True):
+		self.version = version
+		self.substring = substring
+		self.rows = {}  # policy id -> dropdown row
+		self.keys = {}  # policy id -> normalised matched values
+		self.sorted_keys = {field: [] for field in PREFIX_FIELDS}  # field -> sorted (key, policy id)
+		self.postings = {}  # trigram -> policy ids, when substring is set
+		self._owned = None  # On a copy: trigrams whose posting sets are no longer shared
+
+	def copy(self, version):
+		"""A copy at another version that can be changed without touching this one;
+		posting sets stay shared until the copy changes them"""
+		other = CompanyIndex(version, self.substring)
+		other.rows = dict(self.rows)
+		other.keys = dict(self.keys)
+		other.sorted_keys = {field: list(entries) for field, entries in self.sorted_keys.items()}
+		other.postings = dict(self.postings)
+		other._owned = set()
+		return other
+
+	def replay(self, deltas, version):
+		"""A copy with published deltas applied; replaying a change twice is harmless"""
+		other = self.copy(version)
+		for delta in deltas:
+			for operation, value in delta:
+				if operation == 'add':
+					other.add(value)
+				else:
+					other.remove(value)
+		return other
+
+	def _prefix_keys(self, keys):
+		for field in PREFIX_FIELDS:
+			yield self.sorted_keys[field], keys[MATCHED_FIELDS.index(field)]
+
+	def _posting(self, trigram):
+		ids = self.postings.get(trigram)
+		if self._owned is not None and trigram not in self._owned:
+			ids = set(ids or ())
+			self.postings[trigram] = ids
+			self._owned.add(trigram)
+		elif ids is None:
+			ids = self.postings[trigram] = set()
+		return ids
+
+	def add(self, row):
+		self.remove(row['id'])
+		keys = tuple(normalise(row[field] or '') for field in MATCHED_FIELDS)
+		self.rows[row['id']] = row
+		self.keys[row['id']] = keys
+		for entries, key in self._prefix_keys(keys):
+			insort(entries, (key, row['id']))
+		if self.substring:
+			for key in keys:
+				for trigram in trigrams(key):
+					self._posting(trigram).add(row['id'])
+
+	def remove(self, policy_id):
+		keys = self.keys.pop(policy_id, None)
+		if keys is None:
+			return
+		del self.rows[policy_id]
+		for entries, key in self._prefix_keys(keys):
+			del entries[bisect_left(entries, (key, policy_id))]
+		if self.substring:
+			for key in keys:
+				for trigram in trigrams(key):
+					ids = self._posting(trigram)
+					ids.discard(policy_id)
+					if not ids:
+						del self.postings[trigram]
+
+	def _starting_with(self, field, key):
+		"""Policy ids whose field starts with key, in key order"""
+		entries = self.sorted_keys[field]
+		position = bisect_left(entries, (key,))
+		while position < len(entries) and entries[position][0].startswith(key):
+			yield entries[position][1]
+			position += 1
+
+	def prefix_lookup(self, text, limit=SUGGESTION_LIMIT):
+		"""Rows whose registration or policy number starts with text"""
+		key = normalise(text)
+		if not key:
+			return []
+		found = []
+		for field in PREFIX_FIELDS:
+			for policy_id in self._starting_with(field, key):
+				if policy_id not in found:
+					found.append(policy_id)
+					if len(found) == limit:
+						return [self.rows[policy_id] for policy_id in found]
+		return [self.rows[policy_id] for policy_id in found]
+
+	def substring_lookup(self, text, limit=SUGGESTION_LIMIT):
+		"""Rows whose matched values contain text, prefix matches first; text
+		shorter than a trigram only matches prefixes"""
+		key = normalise(text)
+		if not key:
+			return []
+		if len(key) < SUBSTRING_MIN_LENGTH:
+			return self.prefix_lookup(text, limit)
+		# Intersect the rarest trigrams first; the last check below
+		# drops candidates whose trigrams are not contiguous
+		postings = sorted((self.postings.get(trigram, set()) for trigram in trigrams(key)), key=len)
+		candidates = set(postings[0]).intersection(*postings[1:])
+
+		prefix_positions = [MATCHED_FIELDS.index(field) for field in PREFIX_FIELDS]
+		matches = []
+		for policy_id in candidates:
+			keys = self.keys[policy_id]
+			if not any(key in value for value in keys):
+				continue
+			prefix = any(keys[i].startswith(key) for i in prefix_positions)
+			row = self.rows[policy_id]
+			matches.append((not prefix, row['policy_number'], policy_id))
+		matches.sort()
+		return [self.rows[policy_id] for _, _, policy_id in matches[:limit]]
+
+
+def version_key(company_id):
+	return f'autocomplete:{company_id}:version'
+
+
+def delta_key(company_id, version):
+	return f'autocomplete:{company_id}:delta:{version}'
+
+
+def current_version(company_id):
+	"""Number of the company's latest published delta (0 before the first)"""
+	return cache.get(version_key(company_id)) or 0
+
+
+def dropdown_row(values):
+	return dict(zip(DROPDOWN_FIELDS, values))
+
+
+def database_substring():
+	"""Whether substring queries go to the database's trigram indexes"""
+	return db.engine.dialect.name == 'postgresql'
+
+
+def build_index(company_id):
+	"""Load a company's policies into a fresh index"""
+	# Read the version first: deltas published during the load are replayed
+	# onto the new index, and the changes it already has are harmless twice
+	index = CompanyIndex(current_version(company_id), substring=not database_substring())
+	query = select(*(getattr(Policy, field) for field in DROPDOWN_FIELDS)).where(
+		Policy.insurance_company_id == company_id
+	).execution_options(yield_per=1000)
+	for values in db.session.execute(query):
+		index.add(dropdown_row(values))
+	return index
+
+
+def _publish(company_id, index, force=False):
+	"""Make index the company's current one, unless a newer one got there first"""
+	with _lock:
+		current = _indexes.get(company_id)
+		if force or current is None or index.version > current.version:
+			_indexes[company_id] = index
+
+
+def _deltas(company_id, since, version):
+	"""(deltas, version reached) published after since, stopping before any
+	not in the cache yet; None when some are lost and only a rebuild can catch up"""
+	if version < since or version - since > REPLAY_LIMIT:
+		return None
+	found = cache.get_many(*(delta_key(company_id, n) for n in range(since + 1, version + 1)))
+	available = len(found) if None not in found else found.index(None)
+	if any(delta is not None for delta in found[available:]):
+		# A later delta arrived, so the missing one expired or was never written
+		return None
+	return found[:available], since + available
+
+
+def _rebuild(app, company_id):
+	with app.app_context():
+		try:
+			_publish(company_id, build_index(company_id), force=True)
+		except Exception:
+			app.logger.exception('Rebuilding the autocomplete index of company %s failed', company_id)
+		finally:
+			db.session.remove()
+			with _lock:
+				_rebuilds.pop(company_id, None)
+
+
+def rebuild_in_background(company_id):
+	"""Rebuild a company's index on the autocomplete thread, unless it already is"""
+	global _executor
+	app = current_app._get_current_object()
+	with _lock:
+		if company_id in _rebuilds:
+			return _rebuilds[company_id]
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autocomplete')
+		future = _rebuilds[company_id] = _executor.submit(_rebuild, app, company_id)
+	return future
+
+
+def company_index(company_id):
+	"""The in-process index for a company, caught up with the published deltas
+	when they are all still in the cache; otherwise the last one while a
+	rebuild runs in the background"""
+	version = current_version(company_id)
+	with _lock:
+		index = _indexes.get(company_id)
+	if index is None:
+		index = build_index(company_id)
+		_publish(company_id, index)
+	elif index.version != version:
+		found = _deltas(company_id, index.version, version)
+		if found is None:
+			rebuild_in_background(company_id)
+		elif found[0]:
+			index = index.replay(*found)
+			_publish(company_id, index)
+	return index
+
+
+def warm_indexes():
+	"""Build every company's index up front, at worker start"""
+	if not current_app.config['AUTOCOMPLETE_INDEX']:
+		return 0
+	company_ids = db.session.execute(select(InsuranceCompany.id)).scalars().all()
+	for company_id in company_ids:
+		company_index(company_id)
+	return len(company_ids)
+
+
+def reset_indexes():
+	"""Drop every in-process index, e.g. when switching databases"""
+	with _lock:
+		_indexes.clear()
+
+
+def _escape_like(text):
+	return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _database_suggestions(company_id, text, limit):
+	"""Suggestions straight from the trigram-indexed columns; text shorter
+	than a trigram only matches prefixes"""
+	escaped = _escape_like(text)
+	prefix = db.or_(*(getattr(Policy, field).ilike(f'{escaped}%', escape='\\') for field in PREFIX_FIELDS))
+	if len(normalise(text)) < SUBSTRING_MIN_LENGTH:
+		contains = prefix
+	else:
+		contains = db.or_(*(getattr(Policy, field).ilike(f'%{escaped}%', escape='\\') for field in MATCHED_FIELDS))
+	query = select(*(getattr(Policy, field) for field in DROPDOWN_FIELDS)).where(
+		Policy.insurance_company_id == company_id,
+		contains
+	).order_by(db.case((prefix, 0), else_=1), Policy.policy_number, Policy.id).limit(limit)
+	return [dropdown_row(values) for values in db.session.execute(query)]
+
+
+def suggest_policies(company_id, text, limit=SUGGESTION_LIMIT):
+	"""Dropdown rows for a company's policies matching text: registration and
+	policy number prefix matches first, then any other substring matches"""
+	if not current_app.config['AUTOCOMPLETE_INDEX']:
+		return _database_suggestions(company_id, text, limit)
+	index = company_index(company_id)
+	rows = index.prefix_lookup(text, limit)
+	if len(rows) == limit or len(normalise(text)) < SUBSTRING_MIN_LENGTH:
+		return rows
+	if index.substring:
+		more = index.substring_lookup(text, limit)
+	else:
+		more = _database_suggestions(company_id, text, limit)
+	seen = {row['id'] for row in rows}
+	return (rows + [row for row in more if row['id'] not in seen])[:limit]
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_policy_changes(session, flush_context):
+	"""Remember flushed policy changes until the transaction commits"""
+	changes = session.info.setdefault('autocomplete_changes', [])
+	for obj in session.new:
+		if isinstance(obj, Policy):
+			changes.append((None, obj.insurance_company_id, dropdown_row(getattr(obj, field) for field in DROPDOWN_FIELDS)))
+	for obj in session.dirty:
+		if not isinstance(obj, Policy):
+			continue
+		state = inspect(obj)
+		if not any(state.attrs[field].history.has_changes() for field in DROPDOWN_FIELDS + ('insurance_company_id',)):
+			continue
+		history = state.attrs.insurance_company_id.history
+		previous = history.deleted[0] if history.deleted else None
+		changes.append((previous, obj.insurance_company_id, dropdown_row(getattr(obj, field) for field in DROPDOWN_FIELDS)))
+	for obj in session.deleted:
+		if isinstance(obj, Policy):
+			changes.append((obj.insurance_company_id, None, {'id': inspect(obj).identity[0]}))
+
+
+def record_inserts(session, mappings):
+	"""Remember policies added by a bulk insert, which never reaches the flush
+	listener, until the transaction commits"""
+	session.info.setdefault('autocomplete_changes', []).extend(
+		(None, mapping['insurance_company_id'], dropdown_row(mapping[field] for field in DROPDOWN_FIELDS))
+		for mapping in mappings
+	)
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_policy_changes(session):
+	"""Publish committed policy changes as each touched company's next delta"""
+	changes = session.info.pop('autocomplete_changes', None)
+	if not changes or not has_app_context() or not current_app.config['AUTOCOMPLETE_INDEX']:
+		return
+	deltas = {}
+	for previous, company_id, row in changes:
+		if previous is not None and previous != company_id:
+			deltas.setdefault(previous, []).append(('remove', row['id']))
+		if company_id is not None:
+			deltas.setdefault(company_id, []).append(('add', row))
+	timeout = current_app.config['AUTOCOMPLETE_DELTA_TIMEOUT']
+	for company_id, delta in deltas.items():
+		version = cache.cache.inc(version_key(company_id))
+		cache.set(delta_key(company_id, version), delta, timeout=timeout)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_policy_changes(session):
+	session.info.pop('autocomplete_changes', None)
@@ -0,0 +1,379 @@
+import base64
+import binascii
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from werkzeug.utils import secure_filename
+
+from extension import db
+from forms import ClaimForm
+from models import Policy, Claim, ClaimDocument, ClaimDocumentUpload
+import imports
+import metrics
+import replica
+import search
+import sequences
+
+
+# Batch claim intake. Insurer systems post historical and daily claims as
+# JSON lines or CSV, one claim per row with ClaimForm's field names plus the
+# policy_number it is against. Rows are checked by ClaimForm itself, so the
+# rules match the create-claim page, and each batch of
+# CLAIM_INTAKE_BATCH_SIZE rows looks its policies and their existing claims
+# up in one query to enforce the one-claim-per-policy rule. Accepted claims
+# are numbered from a 'CL' sequence block, inserted with
+# bulk_insert_mappings and committed with their rollup and search
+# bookkeeping. Documents (JSON lines only, base64 encoded) are queued in
+# claim_document_upload and written to disk by the document worker, so the
+# request never waits on file storage. The answer is a result per row.
+# A unique index on claim.policy_id backs the one-claim-per-policy rule:
+# when a concurrent request (a batch re-sent while the first is still
+# running) claims a policy between the lookup and the insert, the batch is
+# rolled back, its rows checked again and the rest inserted, so re-sending
+# a batch is safe. A worker marks the documents it is storing with the
+# time; ones still 'storing' after CLAIM_DOCUMENT_TIMEOUT are taken by the
+# next run, and 'flask store-claim-documents --retry-failed' queues the
+# ones that could not be written again.
+
+# Content type -> intake format
+CONTENT_TYPES = {
+	'application/x-ndjson': 'jsonl',
+	'application/jsonl': 'jsonl',
+	'text/csv': 'csv'
+}
+
+# Form fields the intake does not read: the policy comes from policy_number
+FORM_ONLY_FIELDS = ('policy_search', 'policy_id', 'submit')
+
+DOCUMENT_TYPES = (
+	'accident_photo_1', 'accident_photo_2', 'accident_photo_3', 'accident_photo_4',
+	'damage_photo_front', 'damage_photo_side', 'damage_photo_rear', 'damage_photo_interior',
+	'police_abstract', 'driver_license', 'logbook', 'other'
+)
+
+_executor = None
+
+
+class IntakeResult:
+	"""Outcome of one intake: a result per row"""
+
+	def __init__(self):
+		self.results = []
+		self.created = 0
+		self.documents_queued = 0
+
+	@property
+	def rejected(self):
+		return len(self.results) - self.created
+
+	def reject(self, row_number, policy_number, errors):
+		self.results.append({'row': row_number, 'policy_number': policy_number or '', 'status': 'rejected', 'errors': errors})
+
+	def accept(self, row_number, policy_number, mapping, documents):
+		self.results.append({
+			'row': row_number,
+			'policy_number': policy_number,
+			'status': 'created',
+			'claim_id': mapping['id'],
+			'claim_number': mapping['claim_number'],
+			'documents_queued': documents
+		})
+		self.created += 1
+		self.documents_queued += documents
+
+	def report(self):
+		"""JSON-ready summary with the per-row results in row order"""
+		return {
+			'rows': len(self.results),
+			'created': self.created,
+			'rejected': self.rejected,
+			'documents_queued': self.documents_queued,
+			'results': sorted(self.results, key=lambda result: result['row'])
+		}
+
+
+def intake_format(mimetype, requested=None):
+	"""The intake format of a request, from ?format= or its content type; None if unsupported"""
+	if requested:
+		return requested if requested in CONTENT_TYPES.values() else None
+	return CONTENT_TYPES.get(mimetype)
+
+
+def read_jsonl(stream):
+	"""(line number, object) for each non-blank line; the object is None if
+	the line is not a JSON object"""
+	for row_number, line in enumerate(iter(stream.readline, b''), 1):
+		try:
+			text = line.decode('utf-8-sig' if row_number == 1 else 'utf-8').strip()
+		except UnicodeDecodeError as e:
+			raise imports.UnreadableFile(str(e)) from e
+		if not text:
+			continue
+		try:
+			values = json.loads(text)
+		except ValueError:
+			values = None
+		yield row_number, values if isinstance(values, dict) else None
+
+
+def read_rows(stream, fmt):
+	"""(row number, values) for each row of a JSON lines or CSV request body"""
+	if fmt == 'jsonl':
+		return read_jsonl(stream)
+	return imports.read_rows(stream, 'csv')
+
+
+def _text(value):
+	return '' if value is None else str(value).strip()
+
+
+def _formdata(values, fields):
+	formdata = MultiDict({field.name: _text(values.get(field.name)) for field in fields})
+	formdata['vehicle_towed'] = 'Yes' if formdata['vehicle_towed'].lower() in imports.TRUE_VALUES else 'No'
+	return formdata
+
+
+def _documents(entries):
+	"""(documents, errors) for a row's documents: [{document_type, filename, content (base64)}]"""
+	if not entries:
+		return [], []
+	if not isinstance(entries, list):
+		return [], ['Documents must be a list']
+	documents, errors = [], []
+	for n, entry in enumerate(entries, 1):
+		if not isinstance(entry, dict):
+			errors.append(f'Document {n}: not an object')
+			continue
+		document_type = entry.get('document_type')
+		filename = secure_filename(_text(entry.get('filename')))
+		try:
+			content = base64.b64decode(entry.get('content') or '', validate=True)
+		except (binascii.Error, TypeError, ValueError):
+			content = b''
+		if document_type not in DOCUMENT_TYPES:
+			errors.append(f'Document {n}: unknown document type {document_type!r}')
+		elif not filename:
+			errors.append(f'Document {n}: file name is required')
+		elif not content:
+			errors.append(f'Document {n}: content must be non-empty base64')
+		else:
+			documents.append({'document_type': document_type, 'filename': filename, 'content': content})
+	return documents, errors
+
+
+def claim_mapping(fields, insurer):
+	"""Claim column values for validated fields, as create_claim would set them"""
+	mapping = {field.name: field.data if field.data != '' else None for field in fields}
+	towed = mapping['vehicle_towed'] == 'Yes'
+	mapping.update(
+		vehicle_towed=towed,
+		tow_location=mapping['tow_location'] if towed else None,
+		insurance_company_id=insurer.insurance_company_id,
+		created_by=insurer.id,
+		status='Pending'
+	)
+	return mapping
+
+
+def _policies(policy_numbers, company_id):
+	"""policy number -> (policy id, number of its claim or None) for a company's policies"""
+	if not policy_numbers:
+		return {}
+	rows = db.session.execute(
+		select(Policy.policy_number, Policy.id, Claim.claim_number).outerjoin(
+			Claim, Claim.policy_id == Policy.id
+		).where(
+			Policy.policy_number.in_(policy_numbers),
+			Policy.insurance_company_id == company_id
+		)
+	).all()
+	return {policy_number: (policy_id, claim_number) for policy_number, policy_id, claim_number in rows}
+
+
+def _insert_batch(accepted, numbers, result):
+	mappings = [mapping for _, _, mapping, _ in accepted]
+	for mapping in mappings:
+		mapping['claim_number'] = next(numbers)
+	# As in the policy import, return_defaults would insert row by row on
+	# SQLite, so fetch the new ids by claim number
+	db.session.bulk_insert_mappings(Claim, mappings)
+	ids = dict(db.session.execute(
+		select(Claim.claim_number, Claim.id).where(Claim.claim_number.in_([m['claim_number'] for m in mappings]))
+	).all())
+	uploads = []
+	for _, _, mapping, documents in accepted:
+		mapping['id'] = ids[mapping['claim_number']]
+		uploads.extend(dict(document, claim_id=mapping['id']) for document in documents)
+	metrics.apply_claim_inserts(db.session, [(m['insurance_company_id'], m['status']) for m in mappings])
+	search.index_mappings(db.session.connection(), Claim, mappings)
+	if uploads:
+		db.session.execute(insert(ClaimDocumentUpload), uploads)
+	replica.note_bulk_write(db.session)
+	db.session.commit()
+	for row_number, policy_number, mapping, documents in accepted:
+		result.accept(row_number, policy_number, mapping, len(documents))
+
+
+def _unclaimed(rows, company_id, result):
+	"""The rows whose policy is the company's and has no claim yet; the others are rejected"""
+	policies = _policies([policy_number for _, policy_number, _, _ in rows], company_id)
+	accepted = []
+	for row_number, policy_number, mapping, documents in rows:
+		if policy_number not in policies:
+			result.reject(row_number, policy_number, [f'No policy {policy_number} with your company'])
+			continue
+		policy_id, claim_number = policies[policy_number]
+		if claim_number:
+			result.reject(row_number, policy_number, [f'Policy already has a claim (Claim No: {claim_number})'])
+			continue
+		mapping['policy_id'] = policy_id
+		accepted.append((row_number, policy_number, mapping, documents))
+	return accepted
+
+
+def intake_claims(rows, insurer, batch_size=None):
+	"""Validate and insert (row number, values) rows as claims of an insurer"""
+	batch_size = batch_size or current_app.config['CLAIM_INTAKE_BATCH_SIZE']
+	result = IntakeResult()
+	form = ClaimForm(formdata=None, meta={'csrf': False})
+	fields = [field for field in form if field.name not in FORM_ONLY_FIELDS]
+	numbers = sequences.numbers('CL')
+	seen = set()  # policy numbers earlier in the request
+	rows = iter(rows)
+
+	while True:
+		batch = list(islice(rows, batch_size))
+		if not batch:
+			break
+
+		valid = []
+		for row_number, values in batch:
+			if values is None:
+				result.reject(row_number, '', ['Line is not a JSON object'])
+				continue
+			policy_number = _text(values.get('policy_number')).upper()
+			form.process(_formdata(values, fields))
+			errors = [f'{field.label.text}: {message}' for field in fields if not field.validate(form) for message in field.errors]
+			documents, document_errors = _documents(values.get('documents'))
+			errors.extend(document_errors)
+			if not policy_number:
+				errors.insert(0, 'Policy number is required')
+			elif policy_number in seen:
+				errors.insert(0, 'Policy appears more than once in the request')
+			if errors:
+				result.reject(row_number, policy_number, errors)
+				continue
+			seen.add(policy_number)
+			valid.append((row_number, policy_number, claim_mapping(fields, insurer), documents))
+
+		accepted = _unclaimed(valid, insurer.insurance_company_id, result)
+		while accepted:
+			try:
+				_insert_batch(accepted, numbers, result)
+				break
+			except IntegrityError:
+				# Another request claimed some of these policies since the lookup
+				db.session.rollback()
+				retry = _unclaimed(accepted, insurer.insurance_company_id, result)
+				if len(retry) == len(accepted):
+					raise
+				accepted = retry
+				# On SQLite the rollback released the reserved numbers
+				numbers = sequences.numbers('CL')
+
+	return result
+
+
+def upload_dir():
+	return os.path.join(current_app.root_path, current_app.config['UPLOAD_DIR'])
+
+
+def _claim_batch(batch_size):
+	# Claim the uploads so a second worker never writes them too; uploads
+	# whose worker stopped while storing them are claimed again
+	table = ClaimDocumentUpload.__table__
+	now = datetime.utcnow()
+	cutoff = now - timedelta(seconds=current_app.config['CLAIM_DOCUMENT_TIMEOUT'])
+	claimable = db.or_(
+		table.c.status == 'queued',
+		db.and_(table.c.status == 'storing', table.c.claimed_at < cutoff)
+	)
+	candidates = select(table.c.id).where(claimable).order_by(table.c.id).limit(batch_size)
+	ids = db.session.execute(
+		table.update().where(table.c.id.in_(candidates), claimable).values(status='storing', claimed_at=now).returning(table.c.id)
+	).scalars().all()
+	db.session.commit()
+	return ids
+
+
+def retry_failed_documents():
+	"""Queue documents that failed to store again; returns how many"""
+	retried = ClaimDocumentUpload.query.filter_by(status='failed').update(
+		{'status': 'queued', 'error': None, 'claimed_at': None}, synchronize_session=False
+	)
+	db.session.commit()
+	return retried
+
+
+def store_queued_documents(batch_size=None):
+	"""Write queued claim documents to disk as ClaimDocuments; returns how many were stored"""
+	batch_size = batch_size or current_app.config['CLAIM_DOCUMENT_BATCH_SIZE']
+	stored = 0
+	while True:
+		ids = _claim_batch(batch_size)
+		if not ids:
+			return stored
+
+		documents = []
+		for upload in ClaimDocumentUpload.query.filter(ClaimDocumentUpload.id.in_(ids)):
+			relative_path = f'claims/{upload.claim_id}/{upload.document_type}_{upload.filename}'
+			path = os.path.join(upload_dir(), relative_path)
+			try:
+				os.makedirs(os.path.dirname(path), exist_ok=True)
+				# Write under a temporary name so a half-written file is never served
+				with open(path + '.part', 'wb') as output:
+					output.write(upload.content)
+				os.replace(path + '.part', path)
+			except OSError as e:
+				current_app.logger.exception('Storing claim document upload %s failed', upload.id)
+				upload.status = 'failed'
+				upload.error = str(e)
+				continue
+			documents.append({
+				'claim_id': upload.claim_id,
+				'document_type': upload.document_type,
+				'file_path': relative_path,
+				'uploaded_at': upload.created_at
+			})
+			db.session.delete(upload)
+		if documents:
+			db.session.execute(insert(ClaimDocument), documents)
+		db.session.commit()
+		stored += len(documents)
+
+
+def _store_in_background(app):
+	with app.app_context():
+		try:
+			store_queued_documents()
+		except Exception:
+			app.logger.exception('Storing claim documents failed')
+			db.session.rollback()
+
+
+def dispatch():
+	"""Hand queued documents to the document worker, if one is configured"""
+	global _executor
+	workers = current_app.config['CLAIM_DOCUMENT_WORKERS']
+	if not workers:
+		return
+	if _executor is None:
+		_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='claim-documents')
+	_executor.submit(_store_in_background, current_app._get_current_object())
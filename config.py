@@ -8,3 +8,68 @@ class Config:
 	# Flask-Caching defaults
 	CACHE_TYPE = os.environ.get('CACHE_TYPE', 'SimpleCache')
 	CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', '300'))
+	# Serve claim-form autocomplete from in-process indexes. Other workers hear of policy changes through
+	# the cache, so this is off unless the cache is shared by every process (set it for a single process)
+	AUTOCOMPLETE_INDEX = os.environ.get('AUTOCOMPLETE_INDEX', '0' if CACHE_TYPE in ('SimpleCache', 'NullCache') else '1').lower() in ('1', 'true', 'yes')
+	# Policy changes published for other workers' autocomplete indexes stay in the cache this many seconds
+	AUTOCOMPLETE_DELTA_TIMEOUT = int(os.environ.get('AUTOCOMPLETE_DELTA_TIMEOUT', '3600'))
+	# Per-company insurer dashboard counters are cached this many seconds
+	DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', '30'))
+	# Export queries fetch and stream this many rows per batch
+	EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+	# Background export worker threads (0 leaves jobs queued for 'flask run-export-jobs')
+	EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '2'))
+	# Export jobs queued or running longer than this many seconds are presumed lost with their worker
+	EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT', str(3600)))
+	# Export download links stay valid this many seconds
+	EXPORT_LINK_MAX_AGE = int(os.environ.get('EXPORT_LINK_MAX_AGE', str(24 * 3600)))
+	# Finished background exports are written here (relative to the app root)
+	EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join('upload', 'exports'))
+	# Delta exports leave rows changed in the last this-many seconds for the next pull
+	EXPORT_DELTA_LAG = int(os.environ.get('EXPORT_DELTA_LAG', '5'))
+	# Multi-entity searches run their entity queries on this many threads (0 runs them in turn)
+	SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', '8'))
+	# Entities still searching after this many seconds are left out of the results
+	SEARCH_TIMEOUT = float(os.environ.get('SEARCH_TIMEOUT', '2'))
+	# Rows per page on keyset-paginated lists
+	PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '50'))
+	# SQLite performance mode: WAL journal, synchronous=NORMAL, larger cache and mmap on every connection
+	SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '0').lower() in ('1', 'true', 'yes')
+	# With SQLITE_TUNING, wait this many milliseconds for a locked database before failing
+	SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))
+	# With SQLITE_TUNING, page cache per connection in KiB
+	SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', '65536'))
+	# With SQLITE_TUNING, bytes of the database file memory-mapped for reads
+	SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+	# Read replica serving the report, dashboard and export views (unset: they read the primary)
+	SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_URL_REPLICA']} if os.environ.get('DATABASE_URL_REPLICA') else {}
+	# After a user commits, their reads stay on the primary this many seconds while the replica catches up
+	REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+	# A statement run this many times in one request is logged as a likely N+1 query
+	SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', '5'))
+	# Bulk jobs reserve policy, claim and quote numbers this many at a time
+	SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', '500'))
+	# Policy and quote expiry updates this many rows per statement and commit
+	EXPIRY_BATCH_SIZE = int(os.environ.get('EXPIRY_BATCH_SIZE', '1000'))
+	# Expire lapsed policies and quotes in process every this many seconds (0 leaves it to 'flask expire-policies')
+	EXPIRY_INTERVAL = int(os.environ.get('EXPIRY_INTERVAL', '0'))
+	# Expired and cancelled policies move to the archive tables this many months after they end
+	ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', '12'))
+	# Policies archived per transaction
+	ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '200'))
+	# Policy imports validate and insert this many rows per batch and commit
+	IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+	# Import error reports are written here (relative to the app root)
+	IMPORT_DIR = os.environ.get('IMPORT_DIR', os.path.join('upload', 'imports'))
+	# Import error report links stay valid this many seconds
+	IMPORT_REPORT_MAX_AGE = int(os.environ.get('IMPORT_REPORT_MAX_AGE', str(24 * 3600)))
+	# Files served by /uploads/, claim documents under claims/ (relative to the app root)
+	UPLOAD_DIR = os.environ.get('UPLOAD_DIR', 'upload')
+	# Batch claim intake looks up, numbers and inserts this many rows per batch and commit
+	CLAIM_INTAKE_BATCH_SIZE = int(os.environ.get('CLAIM_INTAKE_BATCH_SIZE', '500'))
+	# Background threads storing documents queued by the claim intake (0 leaves it to 'flask store-claim-documents')
+	CLAIM_DOCUMENT_WORKERS = int(os.environ.get('CLAIM_DOCUMENT_WORKERS', '1'))
+	# Queued claim documents written to disk per commit
+	CLAIM_DOCUMENT_BATCH_SIZE = int(os.environ.get('CLAIM_DOCUMENT_BATCH_SIZE', '50'))
+	# Claim documents still being stored after this many seconds are presumed lost with their worker and stored again
+	CLAIM_DOCUMENT_TIMEOUT = int(os.environ.get('CLAIM_DOCUMENT_TIMEOUT', '600'))
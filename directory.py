@@ -0,0 +1,85 @@
+from extension import db
+from models import Customer, Insurer, Regulator, InsuranceCompany, RegulatoryBody
+import pagination
+
+
+# Unified user directory. Customers, insurers and regulators are one
+# UNION ALL of column-only selects with a role discriminator and the
+# insurer's company / regulator's body name joined in, so admin pages list,
+# filter and page every account with one statement and no per-row lookups.
+# The directory is alphabetical by (username, role_rank); usernames are only
+# unique within a role.
+
+ROLES = ('customer', 'insurer', 'regulator')
+STATUSES = ('active', 'disabled', 'approved', 'pending')
+
+
+def _branch(role, model, organisation=None, join=None):
+	"""One role's rows of the directory, with its filters applied"""
+	staff = model is not Customer
+	query = db.select(
+		db.literal(role).label('role'),
+		db.literal(ROLES.index(role)).label('role_rank'),
+		model.id.label('id'),
+		model.username.label('username'),
+		model.email.label('email'),
+		(model.staff_id if staff else db.null()).label('staff_id'),
+		(organisation if organisation is not None else db.null()).label('organisation'),
+		model.is_active.label('is_active'),
+		# Customers need no approval
+		(model.is_approved if staff else db.true()).label('is_approved')
+	)
+	if join is not None:
+		query = query.outerjoin(*join)
+	return query
+
+
+def _status_filter(query, model, status):
+	if status == 'active':
+		return query.where(model.is_active == True)
+	if status == 'disabled':
+		return query.where(model.is_active == False)
+	if model is Customer:
+		# Customers are never pending approval
+		return query if status == 'approved' else query.where(db.false())
+	if status == 'approved':
+		return query.where(model.is_approved == True)
+	if status == 'pending':
+		return query.where(model.is_approved == False)
+	return query
+
+
+def directory(role=None, status=None):
+	"""Subquery of directory rows, optionally for one role and status
+
+	Columns: role, role_rank, id, username, email, staff_id, organisation,
+	is_active, is_approved. Unknown roles or statuses are ignored.
+	"""
+	branches = {
+		'customer': (Customer, _branch('customer', Customer)),
+		'insurer': (Insurer, _branch(
+			'insurer', Insurer, InsuranceCompany.name,
+			(InsuranceCompany, InsuranceCompany.id == Insurer.insurance_company_id)
+		)),
+		'regulator': (Regulator, _branch(
+			'regulator', Regulator, RegulatoryBody.name,
+			(RegulatoryBody, RegulatoryBody.id == Regulator.regulatory_body_id)
+		))
+	}
+	selects = []
+	for name, (model, query) in branches.items():
+		if role in ROLES and name != role:
+			continue
+		if status in STATUSES:
+			query = _status_filter(query, model, status)
+		selects.append(query)
+	return db.union_all(*selects).subquery('directory')
+
+
+def directory_page(args, per_page=None):
+	"""A page of the directory, filtered by the 'role' and 'status' args"""
+	rows = directory(args.get('role'), args.get('status'))
+	return pagination.keyset_page(
+		db.session.query(rows), rows.c.username, rows.c.role_rank, args,
+		per_page=per_page, descending=False, parse=str
+	)
@@ -0,0 +1,101 @@
+import threading
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import select
+
+from extension import db
+from models import Policy, Quote
+import metrics
+
+
+# Policy and quote expiry. Policies whose expiry_date has passed become
+# 'Expired' and quotes past valid_until stop being 'Sent', so status alone
+# says whether a policy is in force and every list, count and index can go
+# by it. Each batch is one set-based UPDATE ... RETURNING over at most
+# EXPIRY_BATCH_SIZE rows, committed on its own with the matching rollup
+# deltas, so a run never holds a long write lock and an interrupted run
+# just leaves the rest for the next one. Runs are idempotent: 'flask
+# expire-policies' from cron, or an in-process thread every EXPIRY_INTERVAL
+# seconds, in as many workers as you like.
+
+_scheduler = None
+_stop = threading.Event()
+
+
+def _expire_batch(table, where, batch_size, *returning):
+	batch = select(table.c.id).where(*where).order_by(table.c.id).limit(batch_size)
+	return db.session.execute(
+		table.update().where(table.c.id.in_(batch), *where).values(status='Expired').returning(*returning)
+	).all()
+
+
+def expire_policies(today=None, batch_size=None):
+	"""Mark active policies that expired before today as 'Expired'; returns how many"""
+	today = today or date.today()
+	batch_size = batch_size or current_app.config['EXPIRY_BATCH_SIZE']
+	table = Policy.__table__
+	where = (table.c.status == 'Active', table.c.expiry_date < today)
+	expired = 0
+	while True:
+		rows = _expire_batch(table, where, batch_size, table.c.insurance_company_id, table.c.premium_amount)
+		metrics.apply_policy_status_change(db.session, rows, 'Active', 'Expired')
+		db.session.commit()
+		expired += len(rows)
+		if len(rows) < batch_size:
+			return expired
+
+
+def expire_quotes(now=None, batch_size=None):
+	"""Mark sent quotes past their valid_until as 'Expired'; returns how many"""
+	now = now or datetime.now()
+	batch_size = batch_size or current_app.config['EXPIRY_BATCH_SIZE']
+	table = Quote.__table__
+	where = (table.c.status == 'Sent', table.c.valid_until < now)
+	expired = 0
+	while True:
+		rows = _expire_batch(table, where, batch_size, table.c.id)
+		db.session.commit()
+		expired += len(rows)
+		if len(rows) < batch_size:
+			return expired
+
+
+def run(now=None):
+	"""Expire policies and quotes; returns (policies, quotes) expired"""
+	now = now or datetime.now()
+	return expire_policies(now.date()), expire_quotes(now)
+
+
+def _run_every(app, interval):
+	while not _stop.is_set():
+		with app.app_context():
+			try:
+				policies, quotes = run()
+				if policies or quotes:
+					app.logger.info('Expired %s policies and %s quotes', policies, quotes)
+			except Exception:
+				app.logger.exception('Policy expiry run failed')
+				db.session.rollback()
+		_stop.wait(interval)
+
+
+def start_scheduler(app):
+	"""Run expiry every EXPIRY_INTERVAL seconds on a daemon thread (0 leaves it to 'flask expire-policies')"""
+	global _scheduler
+	interval = app.config['EXPIRY_INTERVAL']
+	if not interval or _scheduler is not None:
+		return None
+	_stop.clear()
+	_scheduler = threading.Thread(target=_run_every, args=(app, interval), name='expiry', daemon=True)
+	_scheduler.start()
+	return _scheduler
+
+
+def stop_scheduler():
+	"""Stop the expiry thread after its current run"""
+	global _scheduler
+	_stop.set()
+	if _scheduler is not None:
+		_scheduler.join()
+	_scheduler = None
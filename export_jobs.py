@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.exc import IntegrityError
+
+from extension import db, cache
+from models import ExportJob
+import exports
+import replica
+
+
+# Background exports. A job records an export kind and its parameters; a
+# worker thread (or 'flask run-export-jobs') streams the same rows as the
+# matching CSV route into upload/exports/ and the requester downloads the
+# file through a signed, expiring link. Identical queued or running jobs
+# are shared instead of being exported twice; a unique index on in-flight
+# fingerprints settles simultaneous requests. A job still queued or running
+# after EXPORT_JOB_TIMEOUT is presumed lost with its worker and failed, so
+# the next identical request starts a fresh one.
+
+IN_FLIGHT = ('queued', 'running')
+
+# kind -> (role allowed to request it, accepted parameters, export builder)
+EXPORT_KINDS = {
+	'policies': ('Admin', ('status', 'company_id', 'start_date', 'end_date', 'format'), exports.policies),
+	'claims': ('Admin', ('status', 'company_id', 'start_date', 'end_date', 'format'), exports.claims),
+	'users': ('Admin', ('role', 'status', 'format'), exports.users),
+	'admin_report': ('Admin', ('type',), lambda params: exports.admin_report(params.get('type', 'summary'))),
+	'regulator_report': ('Regulator', ('type', 'format'), lambda params: exports.regulator_report(params.get('type', 'summary')))
+}
+
+_executor = None
+
+
+def export_dir():
+	return os.path.join(current_app.root_path, current_app.config['EXPORT_DIR'])
+
+
+def can_request(user, kind):
+	"""Whether a user may request (and download) exports of a kind"""
+	if kind not in EXPORT_KINDS:
+		return False
+	role = EXPORT_KINDS[kind][0]
+	if user.__class__.__name__ != role:
+		return False
+	# Regulators only see industry data once approved
+	return role != 'Regulator' or user.is_approved
+
+
+def export_params(kind, args):
+	"""The non-blank parameters an export kind accepts"""
+	params = {key: args[key] for key in EXPORT_KINDS[kind][1] if args.get(key)}
+	if params.get('format') not in exports.FORMATS or params['format'] == 'csv':
+		params.pop('format', None)
+	return params
+
+
+def fingerprint(kind, params):
+	return hashlib.sha256(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+
+def reap_stale_jobs():
+	"""Fail jobs queued or running for longer than EXPORT_JOB_TIMEOUT; returns how many"""
+	now = datetime.utcnow()
+	cutoff = now - timedelta(seconds=current_app.config['EXPORT_JOB_TIMEOUT'])
+	reaped = ExportJob.query.filter(db.or_(
+		db.and_(ExportJob.status == 'queued', ExportJob.created_at < cutoff),
+		db.and_(ExportJob.status == 'running', ExportJob.started_at < cutoff)
+	)).update({
+		'status': 'failed',
+		'error': 'Timed out: the export worker stopped before finishing',
+		'completed_at': now
+	}, synchronize_session=False)
+	db.session.commit()
+	return reaped
+
+
+def _in_flight(key):
+	return ExportJob.query.filter(
+		ExportJob.fingerprint == key,
+		ExportJob.status.in_(IN_FLIGHT)
+	).order_by(ExportJob.id).first()
+
+
+def submit_export(kind, args, requested_by):
+	"""Queue an export, or return the identical job already queued or running"""
+	params = export_params(kind, args)
+	key = fingerprint(kind, params)
+	reap_stale_jobs()
+	job = _in_flight(key)
+	if job is not None:
+		return job
+
+	job = ExportJob(
+		kind=kind,
+		params=json.dumps(params, sort_keys=True),
+		fingerprint=key,
+		requested_by=requested_by
+	)
+	db.session.add(job)
+	try:
+		db.session.commit()
+	except IntegrityError:
+		# An identical request queued the same export in the meantime
+		db.session.rollback()
+		return _in_flight(key) or ExportJob.query.filter_by(fingerprint=key).order_by(ExportJob.id.desc()).first()
+	dispatch(job.id)
+	return job
+
+
+def dispatch(job_id):
+	"""Hand a queued job to the worker pool, if one is configured"""
+	global _executor
+	workers = current_app.config['EXPORT_WORKERS']
+	if not workers:
+		return
+	if _executor is None:
+		_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+	_executor.submit(run_job, current_app._get_current_object(), job_id)
+
+
+def progress_key(job_id):
+	return f'export_job:{job_id}:rows'
+
+
+def rows_written(job):
+	"""Rows written so far; running jobs report through the cache"""
+	if job.status == 'running':
+		return cache.get(progress_key(job.id)) or 0
+	return job.rows_written
+
+
+def run_job(app, job_id):
+	"""Run one queued export job to completion"""
+	with app.app_context():
+		# Claim the job so a second worker or runner never picks it up
+		claimed = ExportJob.query.filter_by(id=job_id, status='queued').update(
+			{'status': 'running', 'started_at': datetime.utcnow()}
+		)
+		db.session.commit()
+		if not claimed:
+			return
+
+		job = db.session.get(ExportJob, job_id)
+		params = json.loads(job.params)
+		fmt = params.get('format', 'csv')
+		filename = f'{job.kind}_{job.id}_{secrets.token_hex(8)}.{exports.FORMATS[fmt][0]}'
+		path = os.path.join(export_dir(), filename)
+		count = {'rows': 0}
+
+		def counted(records):
+			for record in records:
+				count['rows'] += 1
+				yield record
+
+		try:
+			# The export's own reads go to the replica, if there is one
+			with replica.reading():
+				export = EXPORT_KINDS[job.kind][2](params)
+				export.records = counted(export.records)
+				os.makedirs(export_dir(), exist_ok=True)
+				# Write under a temporary name so a half-written file is never served
+				with open(path + '.part', 'wb') as output:
+					for chunk in exports.stream_export(export, fmt):
+						output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+						cache.set(progress_key(job.id), count['rows'])
+			os.replace(path + '.part', path)
+		except Exception as e:
+			current_app.logger.exception('Export job %s failed', job_id)
+			if os.path.exists(path + '.part'):
+				os.remove(path + '.part')
+			db.session.rollback()
+			job = db.session.get(ExportJob, job_id)
+			job.status = 'failed'
+			job.error = str(e)
+		else:
+			job.status = 'completed'
+			job.file_path = filename
+		job.rows_written = count['rows']
+		job.completed_at = datetime.utcnow()
+		db.session.commit()
+		cache.delete(progress_key(job_id))
+
+
+def run_queued_jobs():
+	"""Run every queued job in this process; returns how many ran"""
+	app = current_app._get_current_object()
+	reap_stale_jobs()
+	job_ids = [job_id for (job_id,) in db.session.query(ExportJob.id).filter(
+		ExportJob.status == 'queued'
+	).order_by(ExportJob.id)]
+	for job_id in job_ids:
+		run_job(app, job_id)
+	return len(job_ids)
+
+
+def _serializer():
+	return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='export-download')
+
+
+def download_token(job):
+	return _serializer().dumps(job.id)
+
+
+def job_for_token(token):
+	"""The completed job a download token was signed for, or None if invalid or expired"""
+	try:
+		job_id = _serializer().loads(token, max_age=current_app.config['EXPORT_LINK_MAX_AGE'])
+	except BadSignature:
+		return None
+	job = db.session.get(ExportJob, job_id)
+	if job is None or job.status != 'completed':
+		return None
+	return job
+
+
+def job_status(job):
+	"""JSON-ready status of a job, with a download link once it has completed"""
+	status = {
+		'id': job.id,
+		'kind': job.kind,
+		'params': json.loads(job.params),
+		'status': job.status,
+		'rows_written': rows_written(job),
+		'error': job.error,
+		'created_at': job.created_at.isoformat(),
+		'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+		'download_url': None
+	}
+	if job.status == 'completed':
+		status['download_url'] = url_for('download_export', token=download_token(job))
+	return status
@@ -0,0 +1,553 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from itertools import islice
+
+from flask import Response, current_app, stream_with_context
+
+from extension import db
+from models import InsuranceCompany, Policy, Claim
+from pagination import encode_cursor, decode_cursor
+import directory
+import replica
+import reports
+
+
+# Streaming exports. Every export is a header, a type per column and a
+# generator of typed records. Records come from column-only queries with
+# company names joined in SQL (never through ORM relationships), fetched
+# EXPORT_BATCH_SIZE rows at a time, and are written out batch by batch -
+# as CSV text or as Parquet / Arrow IPC row groups - so memory stays flat no
+# matter how many policies or claims are exported.
+
+FORMATS = {
+	'csv': ('csv', 'text/csv'),
+	'parquet': ('parquet', 'application/vnd.apache.parquet'),
+	'arrow': ('arrow', 'application/vnd.apache.arrow.file')
+}
+
+
+class Export:
+	"""Header, column types and typed records of one export
+
+	types name each column's type for the columnar formats ('str', 'int',
+	'float', 'date' or 'datetime'); format_row turns a record into its CSV row.
+	"""
+
+	def __init__(self, header, types, records, format_row=list, next_cursor=None):
+		self.header = header
+		self.types = types
+		self.records = records
+		self.format_row = format_row
+		# Delta exports: cursor to pass as 'since' to fetch the next changes
+		self.next_cursor = next_cursor
+
+	def csv_rows(self):
+		for record in self.records:
+			yield self.format_row(record)
+
+
+def fmt_date(value, default='', fmt='%Y-%m-%d'):
+	return value.strftime(fmt) if value else default
+
+
+def fmt_money(value):
+	return f'{value or 0:.2f}'
+
+
+def parse_date(value):
+	"""Parse a YYYY-MM-DD filter value, ignoring blank or malformed input"""
+	try:
+		return datetime.strptime(value or '', '%Y-%m-%d').date()
+	except ValueError:
+		return None
+
+
+def batched(query):
+	"""Iterate a query's rows in server-side batches of EXPORT_BATCH_SIZE"""
+	return query.yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+
+
+def filter_policies(query, args):
+	"""Apply the admin policy filters: status, company_id, start_date, end_date"""
+	if args.get('status'):
+		query = query.filter(Policy.status == args['status'])
+	if args.get('company_id'):
+		query = query.filter(Policy.insurance_company_id == args['company_id'])
+	start_date = parse_date(args.get('start_date'))
+	if start_date:
+		query = query.filter(Policy.effective_date >= start_date)
+	end_date = parse_date(args.get('end_date'))
+	if end_date:
+		query = query.filter(Policy.expiry_date <= end_date)
+	return query
+
+
+def filter_claims(query, args):
+	"""Apply the admin claim filters: status, company_id, start_date, end_date"""
+	if args.get('status'):
+		query = query.filter(Claim.status == args['status'])
+	if args.get('company_id'):
+		# Claim.insurance_company_id is always copied from the claim's policy
+		query = query.filter(Claim.insurance_company_id == args['company_id'])
+	start_date = parse_date(args.get('start_date'))
+	if start_date:
+		query = query.filter(Claim.accident_date >= start_date)
+	end_date = parse_date(args.get('end_date'))
+	if end_date:
+		query = query.filter(Claim.accident_date <= end_date)
+	return query
+
+
+def apply_delta(query, changed_at, row_id, args):
+	"""Limit a query to rows changed after the 'since' cursor in args
+
+	Returns (query, next_cursor). Without 'since' the query is unchanged and
+	there is no cursor; a blank 'since' starts the feed from the first row.
+	Rows are ordered by (changed_at, id) so the scan follows the
+	(changed_at, id) index, and the upper bound is fixed before any row is
+	read, leaving changes made during the export to the next delta. Rows
+	changed in the last EXPORT_DELTA_LAG seconds are also left for later, so
+	a transaction that commits late with an earlier timestamp is not skipped.
+	"""
+	if 'since' not in args:
+		return query, None
+	# A lagging replica would hide rows behind the cutoff from this and every later pull
+	replica.use_primary()
+
+	since = decode_cursor(args['since']) if args['since'] else None
+	cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['EXPORT_DELTA_LAG'])
+	upper = db.session.query(changed_at, row_id).filter(
+		changed_at <= cutoff
+	).order_by(changed_at.desc(), row_id.desc()).first()
+
+	position = db.tuple_(changed_at, row_id)
+	if since is not None:
+		query = query.filter(position > since)
+	if upper is None:
+		# Nothing has changed yet; keep the caller where it is
+		return query.filter(db.false()), args['since'] or None
+	query = query.filter(position <= tuple(upper)).order_by(None).order_by(changed_at, row_id)
+	return query, encode_cursor(*upper)
+
+
+def policy_query(*columns):
+	"""Column-only policy query with the company name joined in"""
+	return db.session.query(*columns).select_from(Policy).outerjoin(
+		InsuranceCompany, InsuranceCompany.id == Policy.insurance_company_id
+	)
+
+
+def claim_query(*columns):
+	"""Column-only claim query with the policy and company joined in"""
+	return db.session.query(*columns).select_from(Claim).outerjoin(
+		Policy, Policy.id == Claim.policy_id
+	).outerjoin(
+		InsuranceCompany, InsuranceCompany.id == Claim.insurance_company_id
+	)
+
+
+def query_records(query):
+	def records():
+		for row in batched(query):
+			yield tuple(row)
+	return records()
+
+
+# ---------- Admin view-policies / view-claims exports ----------
+
+POLICY_HEADER = ['Policy Number', 'Customer Email', 'Insurance Company', 'Vehicle Registration',
+				 'Premium (KES)', 'Status', 'Start Date', 'End Date', 'Created Date']
+POLICY_TYPES = ['str', 'str', 'str', 'str', 'float', 'str', 'date', 'date', 'datetime']
+
+
+def policies(args):
+	"""Filtered policies, as listed on the admin view-policies page
+
+	With a 'since' cursor only policies created or changed after it are
+	exported (see apply_delta).
+	"""
+	query = filter_policies(policy_query(
+		Policy.policy_number,
+		Policy.email_address,
+		InsuranceCompany.name,
+		Policy.registration_number,
+		Policy.premium_amount,
+		Policy.status,
+		Policy.effective_date,
+		Policy.expiry_date,
+		Policy.date_entered
+	), args).order_by(Policy.id)
+	query, next_cursor = apply_delta(query, Policy.updated_at, Policy.id, args)
+
+	def format_row(row):
+		return [
+			row[0] or '',
+			row[1] or '',
+			row[2] or '',
+			row[3] or '',
+			fmt_money(row[4]),
+			row[5] or '',
+			fmt_date(row[6]),
+			fmt_date(row[7]),
+			fmt_date(row[8], fmt='%Y-%m-%d %H:%M')
+		]
+
+	return Export(POLICY_HEADER, POLICY_TYPES, query_records(query), format_row, next_cursor)
+
+
+CLAIM_HEADER = ['Claim Number', 'Policy Number', 'Customer Email', 'Insurance Company',
+				'Date of Accident', 'Location', 'Description', 'Status',
+				'Filed Date', 'Review Date']
+CLAIM_TYPES = ['str', 'str', 'str', 'str', 'date', 'str', 'str', 'str', 'datetime', 'datetime']
+
+
+def claims(args):
+	"""Filtered claims, as listed on the admin view-claims page
+
+	With a 'since' cursor only claims created or changed after it are
+	exported (see apply_delta).
+	"""
+	query = filter_claims(claim_query(
+		Claim.claim_number,
+		Policy.policy_number,
+		Policy.email_address,
+		InsuranceCompany.name,
+		Claim.accident_date,
+		Claim.accident_location,
+		Claim.accident_description,
+		Claim.status,
+		Claim.date_submitted,
+		Claim.review_date
+	), args).order_by(Claim.id)
+	query, next_cursor = apply_delta(query, Claim.last_updated, Claim.id, args)
+
+	def format_row(row):
+		return [
+			row[0] or '',
+			row[1] or '',
+			row[2] or '',
+			row[3] or '',
+			fmt_date(row[4]),
+			row[5] or '',
+			(row[6] or '')[:100],  # Truncate long descriptions
+			row[7] or '',
+			fmt_date(row[8], fmt='%Y-%m-%d %H:%M'),
+			fmt_date(row[9], fmt='%Y-%m-%d %H:%M')
+		]
+
+	return Export(CLAIM_HEADER, CLAIM_TYPES, query_records(query), format_row, next_cursor)
+
+
+# ---------- Report exports (admin, customer, regulator) ----------
+
+def _report_policies(holder=False, email=None):
+	"""Policy book export for the reports, optionally for one policyholder email"""
+	header = ['Policy Number', 'Company']
+	types = ['str', 'str']
+	columns = [Policy.policy_number, InsuranceCompany.name]
+	if holder:
+		header.append('Policyholder')
+		types.append('str')
+		columns.append(Policy.insured_name)
+	header += ['Type', 'Premium (KES)', 'Status', 'Start Date', 'Expiry Date']
+	types += ['str', 'float', 'str', 'date', 'date']
+	columns += [Policy.policy_type, Policy.premium_amount, Policy.status, Policy.effective_date, Policy.expiry_date]
+
+	query = policy_query(*columns)
+	if email is not None:
+		query = query.filter(Policy.email_address == email)
+	query = query.order_by(Policy.id)
+
+	def format_row(row):
+		row = list(row)
+		row[1] = row[1] or 'N/A'
+		row[-4] = fmt_money(row[-4])
+		row[-2] = fmt_date(row[-2], 'N/A')
+		row[-1] = fmt_date(row[-1], 'N/A')
+		return row
+
+	return Export(header, types, query_records(query), format_row)
+
+
+def _report_claims(review_date=True, email=None):
+	"""Claim export for the reports, optionally for one policyholder email"""
+	header = ['Claim Number', 'Policy Number', 'Company', 'Status', 'Date Submitted']
+	types = ['str', 'str', 'str', 'str', 'datetime']
+	columns = [Claim.claim_number, Policy.policy_number, InsuranceCompany.name, Claim.status, Claim.date_submitted]
+	if review_date:
+		header.append('Review Date')
+		types.append('datetime')
+		columns.append(Claim.review_date)
+
+	query = claim_query(*columns)
+	if email is not None:
+		query = query.filter(Policy.email_address == email)
+	query = query.order_by(Claim.id)
+
+	def format_row(row):
+		return [
+			row[0],
+			row[1] or 'N/A',
+			row[2] or 'N/A',
+			row[3]
+		] + [fmt_date(value, 'N/A') for value in row[4:]]
+
+	return Export(header, types, query_records(query), format_row)
+
+
+def users(args):
+	"""User directory export, optionally for one 'role' and 'status'"""
+	rows = directory.directory(args.get('role'), args.get('status'))
+	query = db.session.query(
+		rows.c.username, rows.c.email, rows.c.role, rows.c.organisation, rows.c.is_active, rows.c.is_approved
+	).order_by(rows.c.username, rows.c.role_rank)
+
+	def records():
+		for username, email, role, organisation, is_active, is_approved in batched(query):
+			if role == 'customer':
+				status = 'Active' if is_active else 'Inactive'
+			else:
+				status = 'Approved' if is_approved else 'Pending'
+			yield (username, email, role.title(), organisation or 'N/A', status)
+
+	return Export(['Username', 'Email', 'Role', 'Company/Body', 'Status'], ['str'] * 5, records())
+
+
+def _summary(metrics):
+	"""Metric/value export; values are kept as their CSV text"""
+	return Export(['Metric', 'Value'], ['str', 'str'], [(name, str(value)) for name, value in metrics])
+
+
+def admin_report(export_type):
+	"""Admin reports export: companies, users, policies, claims or summary"""
+	if export_type == 'companies':
+		return Export(
+			['Company Name', 'Active Policies', 'Total Premium (KES)', 'Approved Claims', 'Staff Count'],
+			['str', 'int', 'float', 'int', 'int'],
+			[(
+				company['name'],
+				company['active_policies'],
+				company['total_premium'],
+				company['approved_claims'],
+				company['staff_count']
+			) for company in reports.company_rankings()],
+			lambda row: [row[0], row[1], fmt_money(row[2]), row[3], row[4]]
+		)
+
+	if export_type == 'users':
+		return users({})
+
+	if export_type == 'policies':
+		return _report_policies(holder=True)
+
+	if export_type == 'claims':
+		return _report_claims(review_date=False)
+
+	user_stats = reports.user_summary()
+	policy_stats = reports.policy_summary()
+	claim_stats = reports.claim_summary()
+	return _summary([
+		('Total Customers', user_stats['total_customers']),
+		('Active Customers', user_stats['active_customers']),
+		('Total Insurers', user_stats['total_insurers']),
+		('Approved Insurers', user_stats['approved_insurers']),
+		('Total Regulators', user_stats['total_regulators']),
+		('Approved Regulators', user_stats['approved_regulators']),
+		('Total Policies', policy_stats['total']),
+		('Active Policies', policy_stats['active']),
+		('Total Premium (KES)', fmt_money(policy_stats['active_premium'])),
+		('Total Claims', claim_stats['total']),
+		('Approved Claims', claim_stats['approved'])
+	])
+
+
+def customer_report(export_type, email):
+	"""Customer reports export for the policies held under one email address"""
+	if export_type == 'policies':
+		export = _report_policies(email=email)
+		export.header[1] = 'Insurance Company'
+		return export
+
+	if export_type == 'claims':
+		export = _report_claims(email=email)
+		export.header[2] = 'Insurance Company'
+		return export
+
+	summary = reports.customer_summary(email)
+	return _summary([
+		('Total Policies', summary['total_policies']),
+		('Active Policies', summary['active_policies']),
+		('Total Premium Paid (KES)', fmt_money(summary['total_premium'])),
+		('Active Premium (KES)', fmt_money(summary['active_premium'])),
+		('Total Claims', summary['total_claims']),
+		('Approved Claims', summary['approved_claims']),
+		('Rejected Claims', summary['rejected_claims'])
+	])
+
+
+def regulator_report(export_type):
+	"""Regulator reports export: companies, policies, claims or summary"""
+	if export_type == 'companies':
+		records = []
+		for company in reports.company_rankings():
+			total_claims = company['total_claims']
+			claim_approval = (company['approved_claims'] / total_claims * 100) if total_claims else 100
+			compliance_score = min(100, (claim_approval * 0.6 + 40))
+			records.append((
+				company['name'],
+				company['active_policies'],
+				company['total_premium'],
+				total_claims,
+				company['approved_claims'],
+				company['rejected_claims'],
+				company['staff_count'],
+				compliance_score
+			))
+		return Export(
+			['Company Name', 'Active Policies', 'Total Premium (KES)', 'Total Claims', 'Approved Claims', 'Rejected Claims', 'Staff Count', 'Compliance Score'],
+			['str', 'int', 'float', 'int', 'int', 'int', 'int', 'float'],
+			records,
+			lambda row: [row[0], row[1], fmt_money(row[2])] + list(row[3:7]) + [f'{row[7]:.1f}']
+		)
+
+	if export_type == 'policies':
+		return _report_policies()
+
+	if export_type == 'claims':
+		return _report_claims()
+
+	total_companies = InsuranceCompany.query.filter_by(is_active=True).count()
+	policy_stats = reports.policy_summary()
+	claim_stats = reports.claim_summary()
+	quote_stats = reports.quote_summary()
+	approval_rate = (claim_stats['approved'] / claim_stats['total'] * 100) if claim_stats['total'] else 0
+	return _summary([
+		('Total Insurance Companies', total_companies),
+		('Total Policies', policy_stats['total']),
+		('Active Policies', policy_stats['active']),
+		('Total Premium (KES)', fmt_money(policy_stats['active_premium'])),
+		('Total Claims', claim_stats['total']),
+		('Approved Claims', claim_stats['approved']),
+		('Rejected Claims', claim_stats['rejected']),
+		('Claim Approval Rate (%)', f'{approval_rate:.2f}'),
+		('Total Quotes', quote_stats['total']),
+		('Quote Conversion Rate (%)', f"{quote_stats['conversion_rate']:.2f}")
+	])
+
+
+# ---------- Writers ----------
+
+def stream_csv(export):
+	"""Yield an export as CSV text, one chunk per EXPORT_BATCH_SIZE rows"""
+	batch_size = current_app.config['EXPORT_BATCH_SIZE']
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+	writer.writerow(export.header)
+	for count, row in enumerate(export.csv_rows(), 1):
+		writer.writerow(row)
+		if count % batch_size == 0:
+			yield buffer.getvalue()
+			buffer.seek(0)
+			buffer.truncate()
+	yield buffer.getvalue()
+
+
+def columnar_available():
+	"""Whether pyarrow is installed for the Parquet and Arrow formats"""
+	try:
+		import pyarrow  # noqa: F401
+	except ImportError:
+		return False
+	return True
+
+
+class _ChunkSink(io.RawIOBase):
+	"""Write-only file that hands back whatever was written since the last drain"""
+
+	def __init__(self):
+		self.chunks = []
+		self.position = 0
+
+	def writable(self):
+		return True
+
+	def write(self, data):
+		self.chunks.append(bytes(data))
+		self.position += len(data)
+		return len(data)
+
+	def tell(self):
+		return self.position
+
+	def drain(self):
+		data = b''.join(self.chunks)
+		self.chunks = []
+		return data
+
+
+def stream_columnar(export, fmt):
+	"""Yield an export as Parquet or Arrow IPC bytes, one row group per EXPORT_BATCH_SIZE rows"""
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+
+	arrow_types = {
+		'str': pa.string(),
+		'int': pa.int64(),
+		'float': pa.float64(),
+		'date': pa.date32(),
+		'datetime': pa.timestamp('us')
+	}
+	schema = pa.schema([(name, arrow_types[kind]) for name, kind in zip(export.header, export.types)])
+	batch_size = current_app.config['EXPORT_BATCH_SIZE']
+
+	sink = _ChunkSink()
+	if fmt == 'parquet':
+		writer = pq.ParquetWriter(sink, schema, compression='snappy')
+	else:
+		writer = pa.ipc.new_file(sink, schema)
+
+	records = iter(export.records)
+	while True:
+		batch = list(islice(records, batch_size))
+		if not batch:
+			break
+		columns = list(zip(*batch))
+		writer.write_batch(pa.record_batch(
+			[pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+			schema=schema
+		))
+		yield sink.drain()
+	writer.close()
+	yield sink.drain()
+
+
+def requested_format(args):
+	"""The export format asked for in args; None if it needs pyarrow and pyarrow is missing"""
+	fmt = args.get('format', 'csv')
+	if fmt not in FORMATS:
+		fmt = 'csv'
+	if fmt != 'csv' and not columnar_available():
+		return None
+	return fmt
+
+
+def stream_export(export, fmt='csv'):
+	"""Yield an export in one of FORMATS"""
+	if fmt == 'csv':
+		return stream_csv(export)
+	return stream_columnar(export, fmt)
+
+
+def export_response(name, export, fmt='csv'):
+	"""Stream an export as a timestamped attachment in one of FORMATS"""
+	extension, mimetype = FORMATS[fmt]
+	filename = f'{name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+	headers = {'Content-Disposition': f'attachment; filename={filename}'}
+	if export.next_cursor:
+		headers['X-Next-Cursor'] = export.next_cursor
+	return Response(
+		stream_with_context(stream_export(export, fmt)),
+		mimetype=mimetype,
+		headers=headers
+	)
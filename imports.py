@@ -0,0 +1,287 @@
+import csv
+import io
+import os
+import secrets
+import time
+import zipfile
+from datetime import date, datetime
+from itertools import islice
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import select
+from werkzeug.datastructures import MultiDict
+
+from extension import db
+from forms import PolicyCreationForm
+from models import Policy, registration_key
+import autocomplete
+import metrics
+import replica
+import search
+import sequences
+
+
+# Bulk policy import. An insurer's in-force book arrives as a CSV or Excel
+# sheet with one policy per row and the policy form's field names as its
+# header. Rows are validated by PolicyCreationForm itself - one form
+# instance re-processed per row - so the rules cannot drift from the
+# create-policy page. Each batch of IMPORT_BATCH_SIZE valid rows is checked
+# against the one-active-policy-per-registration rule in a single query,
+# numbered from sequence blocks, inserted with bulk_insert_mappings and
+# committed, with the rollup, search and autocomplete bookkeeping the
+# flush listeners would otherwise have done. Rejected rows are reported
+# with their line number and reasons, as a downloadable CSV.
+
+FORMATS = ('csv', 'xlsx')
+
+BOOLEAN_FIELDS = ('political_violence', 'windscreen_cover', 'passenger_liability', 'road_rescue')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'x')
+
+ERROR_HEADER = ['row', 'registration_number', 'errors']
+
+
+class UnreadableFile(Exception):
+	"""An uploaded sheet that is not valid CSV or Excel"""
+
+
+class ImportResult:
+	"""Outcome of one import: policies created and rejected rows"""
+
+	def __init__(self):
+		self.imported = 0
+		self.errors = []  # (row number, registration number, message)
+		self.seconds = 0.0
+
+	@property
+	def rows(self):
+		return self.imported + len(self.errors)
+
+	def reject(self, row_number, registration_number, message):
+		self.errors.append((row_number, registration_number or '', message))
+
+
+def import_format(filename):
+	"""The import format of a file name, or None if it is not one of FORMATS"""
+	extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+	return extension if extension in FORMATS else None
+
+
+def excel_available():
+	"""Whether openpyxl is installed for Excel imports"""
+	try:
+		import openpyxl  # noqa: F401
+	except ImportError:
+		return False
+	return True
+
+
+def _header(values):
+	return [str(value or '').strip().lower().replace(' ', '_') for value in values]
+
+
+def _cell(value):
+	"""A spreadsheet cell as the text a form field would receive"""
+	if value is None:
+		return ''
+	if isinstance(value, bool):
+		return 'true' if value else ''
+	if isinstance(value, datetime):
+		value = value.date()
+	if isinstance(value, date):
+		return value.isoformat()
+	if isinstance(value, float) and value.is_integer():
+		return str(int(value))
+	return str(value).strip()
+
+
+def read_csv(stream):
+	reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+	header = _header(next(reader, []))
+	for row_number, values in enumerate(reader, 2):
+		if any(values):
+			yield row_number, dict(zip(header, (value.strip() for value in values)))
+
+
+def read_xlsx(stream):
+	import openpyxl
+
+	workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+	try:
+		rows = workbook.active.iter_rows(values_only=True)
+		header = _header(next(rows, []))
+		for row_number, values in enumerate(rows, 2):
+			if any(value is not None for value in values):
+				yield row_number, dict(zip(header, (_cell(value) for value in values)))
+	finally:
+		workbook.close()
+
+
+def read_rows(stream, fmt):
+	"""(row number, {column: text}) for each non-blank row of an uploaded sheet"""
+	reader = read_xlsx if fmt == 'xlsx' else read_csv
+	try:
+		yield from reader(stream)
+	except (UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+		raise UnreadableFile(str(e)) from e
+
+
+def import_columns():
+	"""The sheet columns an import reads: the policy form's fields"""
+	return [field.name for field in PolicyCreationForm(formdata=None, meta={'csrf': False}) if field.name != 'submit']
+
+
+def _formdata(values):
+	# BooleanField treats any non-blank text as checked, so spell 'no' as blank
+	formdata = MultiDict(values)
+	for field in BOOLEAN_FIELDS:
+		formdata[field] = 'y' if values.get(field, '').lower() in TRUE_VALUES else ''
+	return formdata
+
+
+def one_year_on(day):
+	"""The day a year later; 29 February runs to 28 February"""
+	try:
+		return day.replace(year=day.year + 1)
+	except ValueError:
+		return day.replace(year=day.year + 1, day=28)
+
+
+def policy_mapping(form, insurer):
+	"""Policy column values for a validated form, as create_policy would set them"""
+	mapping = {field.name: field.data for field in form if field.name != 'submit'}
+	mapping.update(
+		registration_number=mapping['registration_number'].upper(),
+		registration_key=registration_key(mapping['registration_number']),
+		kra_pin=mapping['kra_pin'] or None,
+		expiry_date=one_year_on(mapping['effective_date']),
+		insurance_company_id=insurer.insurance_company_id,
+		created_by=insurer.id,
+		status='Active'
+	)
+	return mapping
+
+
+def _form_errors(form):
+	return '; '.join(
+		f'{form[name].label.text}: {message}'
+		for name, messages in form.errors.items() for message in messages
+	)
+
+
+def _active_registrations(registration_numbers):
+	"""registration number -> policy number of the active policies on any of them"""
+	if not registration_numbers:
+		return {}
+	return dict(db.session.execute(
+		select(Policy.registration_number, Policy.policy_number).where(
+			Policy.registration_number.in_(registration_numbers),
+			Policy.status == 'Active'
+		)
+	).all())
+
+
+def _insert_batch(mappings, numbers):
+	for mapping in mappings:
+		prefix = 'CO' if mapping['policy_type'] == 'Comprehensive' else 'TO'
+		if prefix not in numbers:
+			numbers[prefix] = sequences.numbers(prefix)
+		mapping['policy_number'] = next(numbers[prefix])
+	# return_defaults would make some drivers (SQLite) insert row by row, so
+	# fetch the new ids by the policy numbers just assigned instead
+	db.session.bulk_insert_mappings(Policy, mappings)
+	ids = dict(db.session.execute(
+		select(Policy.policy_number, Policy.id).where(Policy.policy_number.in_([m['policy_number'] for m in mappings]))
+	).all())
+	for mapping in mappings:
+		mapping['id'] = ids[mapping['policy_number']]
+	metrics.apply_policy_inserts(
+		db.session, [(m['insurance_company_id'], m['status'], m['premium_amount']) for m in mappings]
+	)
+	search.index_mappings(db.session.connection(), Policy, mappings)
+	autocomplete.record_inserts(db.session, mappings)
+	replica.note_bulk_write(db.session)
+	db.session.commit()
+
+
+def import_policies(rows, insurer, batch_size=None):
+	"""Validate and insert (row number, values) rows as policies of an insurer"""
+	batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+	result = ImportResult()
+	started = time.perf_counter()
+	form = PolicyCreationForm(formdata=None, meta={'csrf': False})
+	numbers = {}  # prefix -> policy numbers reserved a block at a time
+	seen = set()  # registration numbers earlier in the file
+	rows = iter(rows)
+
+	while True:
+		batch = list(islice(rows, batch_size))
+		if not batch:
+			break
+
+		valid = []
+		for row_number, values in batch:
+			form.process(_formdata(values))
+			if not form.validate():
+				result.reject(row_number, values.get('registration_number'), _form_errors(form))
+				continue
+			mapping = policy_mapping(form, insurer)
+			if mapping['registration_number'] in seen:
+				result.reject(row_number, mapping['registration_number'], 'Registration number appears more than once in the file')
+				continue
+			seen.add(mapping['registration_number'])
+			valid.append((row_number, mapping))
+
+		active = _active_registrations([mapping['registration_number'] for _, mapping in valid])
+		mappings = []
+		for row_number, mapping in valid:
+			policy_number = active.get(mapping['registration_number'])
+			if policy_number:
+				result.reject(row_number, mapping['registration_number'], f'Registration number is already on active policy {policy_number}')
+			else:
+				mappings.append(mapping)
+		if mappings:
+			_insert_batch(mappings, numbers)
+			result.imported += len(mappings)
+
+	result.seconds = time.perf_counter() - started
+	return result
+
+
+def write_error_report(result, output):
+	"""Write an import's rejected rows to a text stream as CSV"""
+	writer = csv.writer(output)
+	writer.writerow(ERROR_HEADER)
+	writer.writerows(result.errors)
+
+
+def import_dir():
+	return os.path.join(current_app.root_path, current_app.config['IMPORT_DIR'])
+
+
+def save_error_report(result):
+	"""Save an import's rejected rows under IMPORT_DIR; returns the file name"""
+	filename = f'policy_import_errors_{secrets.token_hex(8)}.csv'
+	os.makedirs(import_dir(), exist_ok=True)
+	with open(os.path.join(import_dir(), filename), 'w', newline='', encoding='utf-8') as output:
+		write_error_report(result, output)
+	return filename
+
+
+def _serializer():
+	return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='import-errors')
+
+
+def report_token(filename, company_id):
+	return _serializer().dumps([filename, company_id])
+
+
+def report_for_token(token, company_id):
+	"""The error report file a token was signed for, or None if invalid, expired or another company's"""
+	try:
+		filename, signed_company_id = _serializer().loads(token, max_age=current_app.config['IMPORT_REPORT_MAX_AGE'])
+	except (BadSignature, ValueError):
+		return None
+	if signed_company_id != company_id or not os.path.exists(os.path.join(import_dir(), filename)):
+		return None
+	return filename
@@ -0,0 +1,75 @@
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload, with_expression
+
+from models import (Insurer, InsurerRequest, Regulator, RegulatorRequest, InsuranceCompany, Policy, Claim,
+	CustomerPolicyRequest, PolicyCancellationRequest, PolicyRenewalRequest)
+
+
+# Loader profiles. Every relationship a list template touches on each row
+# is loaded with the list itself - many-to-one references joined into the
+# same SELECT, collections in one extra IN query - instead of one lazy load
+# per row. Templates that only count a collection get the count as a
+# correlated COUNT subquery in the list's SELECT rather than the rows.
+# Views pick the profile matching their template; when a template starts
+# using another relationship, add it to the profile here.
+
+def _count(model, company_column):
+	"""Number of a company's rows of model, for with_expression"""
+	return select(func.count(model.id)).where(company_column == InsuranceCompany.id).correlate(InsuranceCompany).scalar_subquery()
+
+
+PROFILES = {
+	# Policy tables: the company name
+	'policy_list': (
+		joinedload(Policy.insurance_company),
+	),
+	# Claim tables: the policy number, holder and company
+	'claim_list': (
+		joinedload(Claim.policy).joinedload(Policy.insurance_company),
+		joinedload(Claim.insurance_company),
+	),
+	'insurer_list': (
+		joinedload(Insurer.company),
+	),
+	'regulator_list': (
+		joinedload(Regulator.regulatory_body),
+	),
+	# Company search results count each company's insurers
+	'company_list': (
+		selectinload(InsuranceCompany.insurers),
+	),
+	# Regulator search results count each company's policies and claims
+	'company_scorecard': (
+		with_expression(InsuranceCompany.policy_count, _count(Policy, Policy.insurance_company_id)),
+		with_expression(InsuranceCompany.claim_count, _count(Claim, Claim.insurance_company_id)),
+	),
+	# Admin review of staff access requests
+	'insurer_requests': (
+		joinedload(InsurerRequest.insurer),
+		joinedload(InsurerRequest.insurance_company),
+		joinedload(InsurerRequest.reviewer),
+	),
+	'regulator_requests': (
+		joinedload(RegulatorRequest.regulator),
+		joinedload(RegulatorRequest.regulatory_body),
+		joinedload(RegulatorRequest.reviewer),
+	),
+	# Insurer review of customer requests: who asked, about which policy
+	'access_requests': (
+		joinedload(CustomerPolicyRequest.customer),
+		joinedload(CustomerPolicyRequest.policy),
+	),
+	'cancellation_requests': (
+		joinedload(PolicyCancellationRequest.customer),
+		joinedload(PolicyCancellationRequest.policy),
+	),
+	'renewal_requests': (
+		joinedload(PolicyRenewalRequest.customer),
+		joinedload(PolicyRenewalRequest.policy),
+	),
+}
+
+
+def load(query, profile):
+	"""query with a named loader profile applied"""
+	return query.options(*PROFILES[profile])
@@ -0,0 +1,369 @@
+from collections import defaultdict
+from datetime import datetime
+
+from flask import has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from extension import db
+from models import InsuranceCompany, InsurerRequest, RegulatorRequest, Policy, Claim, CustomerPolicyRequest, PolicyCancellationRequest, PolicyRenewalRequest, MetricsRollup
+from reports import count_where, sum_where, invalidate_insurer_dashboard
+
+
+# Dashboard counters kept in MetricsRollup. Every flush that adds, changes or
+# deletes a policy, claim or request turns into a handful of
+# "counter = counter + delta" UPDATEs on the rollup rows, issued on the same
+# connection so they commit (or roll back) with the change itself.
+
+GLOBAL_SCOPE = 'global'
+
+POLICY_STATUS_COUNTERS = {
+	'Active': 'policies_active',
+	'Expired': 'policies_expired',
+	'Cancelled': 'policies_cancelled'
+}
+
+CLAIM_STATUS_COUNTERS = {
+	'Pending': 'claims_pending',
+	'Under Review': 'claims_under_review',
+	'Approved': 'claims_approved',
+	'Rejected': 'claims_rejected'
+}
+
+CUSTOMER_REQUEST_COUNTERS = {
+	CustomerPolicyRequest: 'pending_access_requests',
+	PolicyCancellationRequest: 'pending_cancellation_requests',
+	PolicyRenewalRequest: 'pending_renewal_requests'
+}
+
+STAFF_REQUEST_COUNTERS = {
+	InsurerRequest: 'pending_insurer_requests',
+	RegulatorRequest: 'pending_regulator_requests'
+}
+
+# Attributes whose changes move a row between counters
+TRACKED_ATTRIBUTES = {
+	Policy: ('status', 'premium_amount', 'insurance_company_id'),
+	Claim: ('status', 'insurance_company_id'),
+	CustomerPolicyRequest: ('status', 'policy_id'),
+	PolicyCancellationRequest: ('status', 'policy_id'),
+	PolicyRenewalRequest: ('status', 'policy_id'),
+	InsurerRequest: ('status',),
+	RegulatorRequest: ('status',)
+}
+
+COUNTER_COLUMNS = [
+	'policies_total', 'policies_active', 'policies_expired', 'policies_cancelled', 'active_premium',
+	'claims_total', 'claims_pending', 'claims_under_review', 'claims_approved', 'claims_rejected',
+	'pending_access_requests', 'pending_cancellation_requests', 'pending_renewal_requests',
+	'pending_insurer_requests', 'pending_regulator_requests'
+]
+
+
+def company_scope(company_id):
+	return f'company:{company_id}'
+
+
+def policy_counters(status, premium):
+	"""Counter contribution of a single policy"""
+	counters = {'policies_total': 1}
+	if status in POLICY_STATUS_COUNTERS:
+		counters[POLICY_STATUS_COUNTERS[status]] = 1
+	if status == 'Active':
+		counters['active_premium'] = premium or 0
+	return counters
+
+
+def claim_counters(status):
+	"""Counter contribution of a single claim"""
+	counters = {'claims_total': 1}
+	if status in CLAIM_STATUS_COUNTERS:
+		counters[CLAIM_STATUS_COUNTERS[status]] = 1
+	return counters
+
+
+def _status(obj, value):
+	# Column defaults are only applied during the INSERT, so fall back to them
+	# for rows whose status was never set explicitly
+	if value is None:
+		return type(obj).__table__.c.status.default.arg
+	return value
+
+
+def _previous_value(state, key):
+	history = state.attrs[key].history
+	if history.deleted:
+		return history.deleted[0]
+	if history.unchanged:
+		return history.unchanged[0]
+	return state.attrs[key].value
+
+
+def _policy_company(connection, policy_id, cache):
+	if policy_id not in cache:
+		cache[policy_id] = connection.execute(
+			select(Policy.insurance_company_id).where(Policy.id == policy_id)
+		).scalar()
+	return cache[policy_id]
+
+
+def _contribution(obj, get, connection, cache):
+	"""Return (company_id, counters) for an object as seen through get()"""
+	if isinstance(obj, Policy):
+		return get('insurance_company_id'), policy_counters(_status(obj, get('status')), get('premium_amount'))
+	if isinstance(obj, Claim):
+		return get('insurance_company_id'), claim_counters(_status(obj, get('status')))
+	if type(obj) in CUSTOMER_REQUEST_COUNTERS:
+		counters = {CUSTOMER_REQUEST_COUNTERS[type(obj)]: 1} if _status(obj, get('status')) == 'pending' else {}
+		return _policy_company(connection, get('policy_id'), cache), counters
+	if type(obj) in STAFF_REQUEST_COUNTERS:
+		counters = {STAFF_REQUEST_COUNTERS[type(obj)]: 1} if _status(obj, get('status')) == 'pending' else {}
+		return None, counters
+	return None
+
+
+def _add(deltas, company_id, counters, sign):
+	scopes = [(GLOBAL_SCOPE, None)]
+	if company_id is not None:
+		scopes.append((company_scope(company_id), company_id))
+	for scope in scopes:
+		for name, amount in counters.items():
+			deltas[scope][name] += sign * amount
+
+
+def collect_deltas(session, connection):
+	"""Counter deltas implied by the objects in the current flush"""
+	deltas = defaultdict(lambda: defaultdict(int))
+	cache = {}
+
+	for obj in session.new:
+		if type(obj) in TRACKED_ATTRIBUTES:
+			company_id, counters = _contribution(obj, lambda key: getattr(obj, key), connection, cache)
+			_add(deltas, company_id, counters, 1)
+
+	for obj in session.deleted:
+		if type(obj) in TRACKED_ATTRIBUTES:
+			state = inspect(obj)
+			company_id, counters = _contribution(obj, lambda key: _previous_value(state, key), connection, cache)
+			_add(deltas, company_id, counters, -1)
+
+	for obj in session.dirty:
+		attributes = TRACKED_ATTRIBUTES.get(type(obj))
+		if not attributes:
+			continue
+		state = inspect(obj)
+		if not any(state.attrs[key].history.has_changes() for key in attributes):
+			continue
+		company_id, counters = _contribution(obj, lambda key: _previous_value(state, key), connection, cache)
+		_add(deltas, company_id, counters, -1)
+		company_id, counters = _contribution(obj, lambda key: getattr(obj, key), connection, cache)
+		_add(deltas, company_id, counters, 1)
+
+	return deltas
+
+
+def _insert_if_missing(connection, values):
+	table = MetricsRollup.__table__
+	dialect = connection.dialect.name
+	if dialect == 'postgresql':
+		from sqlalchemy.dialects.postgresql import insert
+		stmt = insert(table).values(**values).on_conflict_do_nothing(index_elements=['scope'])
+	elif dialect == 'sqlite':
+		from sqlalchemy.dialects.sqlite import insert
+		stmt = insert(table).values(**values).on_conflict_do_nothing(index_elements=['scope'])
+	else:
+		stmt = table.insert().values(**values)
+	return connection.execute(stmt).rowcount
+
+
+def apply_deltas(connection, deltas):
+	"""Add counter deltas to the rollup rows, creating missing rows from scratch"""
+	table = MetricsRollup.__table__
+	for (scope, company_id), counters in deltas.items():
+		values = {name: table.c[name] + amount for name, amount in counters.items() if amount}
+		if not values:
+			continue
+		values['updated_at'] = datetime.utcnow()
+		result = connection.execute(table.update().where(table.c.scope == scope).values(**values))
+		if result.rowcount:
+			continue
+
+		# No row yet: compute it from the tables, which already include this
+		# change. If another transaction created the row in the meantime,
+		# fall back to applying the delta on top of theirs.
+		row = compute_counters(connection, company_id)
+		if not _insert_if_missing(connection, dict(row, scope=scope, insurance_company_id=company_id, updated_at=datetime.utcnow())):
+			connection.execute(table.update().where(table.c.scope == scope).values(**values))
+
+
+def _apply_bulk_deltas(session, deltas):
+	if deltas:
+		apply_deltas(session.connection(), deltas)
+		session.info.setdefault('touched_companies', set()).update(
+			company_id for _, company_id in deltas if company_id is not None
+		)
+
+
+# Bulk UPDATEs and inserts never reach the flush listener, so their callers
+# hand the changed rows over instead
+
+def apply_policy_status_change(session, rows, old_status, new_status):
+	"""Move policies changed by a bulk UPDATE between status counters; rows
+	are (company_id, premium)"""
+	deltas = defaultdict(lambda: defaultdict(int))
+	for company_id, premium in rows:
+		_add(deltas, company_id, policy_counters(old_status, premium), -1)
+		_add(deltas, company_id, policy_counters(new_status, premium), 1)
+	_apply_bulk_deltas(session, deltas)
+
+
+def apply_policy_inserts(session, rows):
+	"""Count policies added by a bulk insert; rows are (company_id, status, premium)"""
+	deltas = defaultdict(lambda: defaultdict(int))
+	for company_id, status, premium in rows:
+		_add(deltas, company_id, policy_counters(status, premium), 1)
+	_apply_bulk_deltas(session, deltas)
+
+
+def apply_claim_inserts(session, rows):
+	"""Count claims added by a bulk insert; rows are (company_id, status)"""
+	deltas = defaultdict(lambda: defaultdict(int))
+	for company_id, status in rows:
+		_add(deltas, company_id, claim_counters(status), 1)
+	_apply_bulk_deltas(session, deltas)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+	pass
+
+
+# active_history makes SQLAlchemy load the old value of an expired attribute
+# before it is overwritten, so the flush can always subtract it again
+for _model, _attributes in TRACKED_ATTRIBUTES.items():
+	for _key in _attributes:
+		event.listen(getattr(_model, _key), 'set', _load_previous_value, active_history=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def update_rollups(session, flush_context):
+	"""Keep MetricsRollup in step with every flushed change"""
+	connection = session.connection()
+	deltas = collect_deltas(session, connection)
+	if deltas:
+		apply_deltas(connection, deltas)
+		# Remember which companies changed so their cached dashboards can be
+		# dropped once the transaction commits
+		session.info.setdefault('touched_companies', set()).update(
+			company_id for _, company_id in deltas if company_id is not None
+		)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_dashboards(session):
+	company_ids = session.info.pop('touched_companies', None)
+	if company_ids and has_app_context():
+		invalidate_insurer_dashboard(company_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_touched_companies(session):
+	session.info.pop('touched_companies', None)
+
+
+def _grouped_counters(connection, company_id=None):
+	"""Counters for each company, from one grouped query per table"""
+	counters = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+
+	policy_query = select(
+		Policy.insurance_company_id,
+		db.func.count(Policy.id),
+		count_where(Policy.status == 'Active'),
+		count_where(Policy.status == 'Expired'),
+		count_where(Policy.status == 'Cancelled'),
+		sum_where(Policy.status == 'Active', Policy.premium_amount)
+	).group_by(Policy.insurance_company_id)
+	claim_query = select(
+		Claim.insurance_company_id,
+		db.func.count(Claim.id),
+		count_where(Claim.status == 'Pending'),
+		count_where(Claim.status == 'Under Review'),
+		count_where(Claim.status == 'Approved'),
+		count_where(Claim.status == 'Rejected')
+	).group_by(Claim.insurance_company_id)
+	if company_id is not None:
+		policy_query = policy_query.where(Policy.insurance_company_id == company_id)
+		claim_query = claim_query.where(Claim.insurance_company_id == company_id)
+
+	for row in connection.execute(policy_query):
+		counters[row[0]].update(zip(['policies_total', 'policies_active', 'policies_expired', 'policies_cancelled', 'active_premium'], row[1:]))
+	for row in connection.execute(claim_query):
+		counters[row[0]].update(zip(['claims_total', 'claims_pending', 'claims_under_review', 'claims_approved', 'claims_rejected'], row[1:]))
+
+	for model, column in CUSTOMER_REQUEST_COUNTERS.items():
+		request_query = select(
+			Policy.insurance_company_id,
+			db.func.count(model.id)
+		).join(Policy, Policy.id == model.policy_id).where(model.status == 'pending').group_by(Policy.insurance_company_id)
+		if company_id is not None:
+			request_query = request_query.where(Policy.insurance_company_id == company_id)
+		for row in connection.execute(request_query):
+			counters[row[0]][column] = row[1]
+
+	return counters
+
+
+def _global_counters(connection, per_company):
+	totals = dict.fromkeys(COUNTER_COLUMNS, 0)
+	for counters in per_company.values():
+		for name, amount in counters.items():
+			totals[name] += amount
+	for model, column in STAFF_REQUEST_COUNTERS.items():
+		totals[column] = connection.execute(
+			select(db.func.count(model.id)).where(model.status == 'pending')
+		).scalar()
+	return totals
+
+
+def compute_counters(connection, company_id=None):
+	"""Counters for one company, or the global totals when company_id is None"""
+	if company_id is not None:
+		return dict(_grouped_counters(connection, company_id)[company_id])
+	return _global_counters(connection, _grouped_counters(connection))
+
+
+def get_rollup(company_id=None):
+	"""Rollup row for a company, or the global row when company_id is None"""
+	scope = GLOBAL_SCOPE if company_id is None else company_scope(company_id)
+	rollup = MetricsRollup.query.filter_by(scope=scope).first()
+	if rollup is None:
+		# Created in a transaction of its own on the primary, so the
+		# request's session is neither committed nor moved off the replica
+		table = MetricsRollup.__table__
+		with db.engine.begin() as connection:
+			row = compute_counters(connection, company_id)
+			_insert_if_missing(connection, dict(row, scope=scope, insurance_company_id=company_id, updated_at=datetime.utcnow()))
+			values = connection.execute(select(table).where(table.c.scope == scope)).one()._asdict()
+		rollup = MetricsRollup(**values)
+		make_transient_to_detached(rollup)
+		rollup = db.session.merge(rollup, load=False)
+	return rollup
+
+
+def reconcile_rollups():
+	"""Rebuild every rollup row from the raw tables"""
+	table = MetricsRollup.__table__
+	connection = db.session.connection()
+	now = datetime.utcnow()
+
+	per_company = _grouped_counters(connection)
+	rows = {GLOBAL_SCOPE: (None, _global_counters(connection, per_company))}
+	for company_id in connection.execute(select(InsuranceCompany.id)).scalars():
+		rows[company_scope(company_id)] = (company_id, dict(per_company[company_id]))
+
+	for scope, (company_id, counters) in rows.items():
+		result = connection.execute(table.update().where(table.c.scope == scope).values(updated_at=now, **counters))
+		if not result.rowcount:
+			connection.execute(table.insert().values(scope=scope, insurance_company_id=company_id, updated_at=now, **counters))
+
+	db.session.commit()
+	return len(rows)
@@ -0,0 +1,32 @@
+"""Add admin policy and claim list keyset indexes
+
+Revision ID: 41f7d0b3a5c2
+Revises: e2a9c4f61b07
+Create Date: 2026-10-16 19:27:04.118630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '41f7d0b3a5c2'
+down_revision = 'e2a9c4f61b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.create_index('ix_policy_date_entered_id', ['date_entered', 'id'], unique=False)
+
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.create_index('ix_claim_date_submitted_id', ['date_submitted', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_date_submitted_id')
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.drop_index('ix_policy_date_entered_id')
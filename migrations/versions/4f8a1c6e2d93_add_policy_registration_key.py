@@ -0,0 +1,47 @@
+"""Add a normalised registration key to policies for vehicle lookups
+
+Revision ID: 4f8a1c6e2d93
+Revises: 9d4b2f6e8a31
+Create Date: 2026-10-17 09:12:40.551307
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a1c6e2d93'
+down_revision = '9d4b2f6e8a31'
+branch_labels = None
+depends_on = None
+
+
+def registration_key(registration_number):
+    # Same as models.registration_key, frozen for this migration
+    return ''.join(re.findall(r'[^\W_]+', (registration_number or '').lower()))
+
+
+def upgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('registration_key', sa.String(length=50), nullable=True))
+
+    policy = sa.table('policy', sa.column('id', sa.Integer), sa.column('registration_number', sa.String),
+                      sa.column('registration_key', sa.String))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(policy.c.id, policy.c.registration_number)).all()
+    if rows:
+        connection.execute(
+            policy.update().where(policy.c.id == sa.bindparam('policy_id')).values(registration_key=sa.bindparam('key')),
+            [{'policy_id': policy_id, 'key': registration_key(number)} for policy_id, number in rows]
+        )
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.create_index('ix_policy_registration_key', ['registration_key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.drop_index('ix_policy_registration_key')
+        batch_op.drop_column('registration_key')
@@ -0,0 +1,41 @@
+"""Add policy updated_at and delta export indexes
+
+Revision ID: 5b8e2d4a7c61
+Revises: c3f1a7d2e9b4
+Create Date: 2026-10-16 14:03:11.284517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2d4a7c61'
+down_revision = 'c3f1a7d2e9b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Existing policies were last changed no earlier than they were entered
+    op.execute("UPDATE policy SET updated_at = date_entered WHERE updated_at IS NULL")
+    op.execute("UPDATE claim SET last_updated = date_submitted WHERE last_updated IS NULL")
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', nullable=False)
+        batch_op.create_index('ix_policy_updated_at_id', ['updated_at', 'id'], unique=False)
+
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.create_index('ix_claim_last_updated_id', ['last_updated', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_last_updated_id')
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.drop_index('ix_policy_updated_at_id')
+        batch_op.drop_column('updated_at')
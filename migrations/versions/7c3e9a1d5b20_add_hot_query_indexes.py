@@ -0,0 +1,59 @@
+"""Add composite indexes for the hot query shapes
+
+Revision ID: 7c3e9a1d5b20
+Revises: 41f7d0b3a5c2
+Create Date: 2026-10-16 20:12:45.530217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a1d5b20'
+down_revision = '41f7d0b3a5c2'
+branch_labels = None
+depends_on = None
+
+REQUEST_TABLES = ('customer_policy_request', 'policy_cancellation_request', 'policy_renewal_request')
+
+
+def upgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.create_index('ix_policy_company_status', ['insurance_company_id', 'status'], unique=False)
+        batch_op.create_index('ix_policy_email_address', ['email_address'], unique=False)
+        batch_op.create_index('ix_policy_registration_status', ['registration_number', 'status'], unique=False)
+
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.create_index('ix_claim_company_status', ['insurance_company_id', 'status'], unique=False)
+        batch_op.create_index('ix_claim_policy_id', ['policy_id'], unique=False)
+
+    for table in REQUEST_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(f'ix_{table}_customer_policy_status', ['customer_id', 'policy_id', 'status'], unique=False)
+
+    # One active policy per vehicle. Postgres only: fails if a registration
+    # already has two active policies, which must be resolved first
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index(
+            'ux_policy_active_registration', 'policy', ['registration_number'], unique=True,
+            postgresql_where=sa.text("status = 'Active'")
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ux_policy_active_registration', table_name='policy')
+
+    for table in reversed(REQUEST_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_customer_policy_status')
+
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_policy_id')
+        batch_op.drop_index('ix_claim_company_status')
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.drop_index('ix_policy_registration_status')
+        batch_op.drop_index('ix_policy_email_address')
+        batch_op.drop_index('ix_policy_company_status')
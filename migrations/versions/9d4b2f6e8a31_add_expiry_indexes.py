@@ -0,0 +1,32 @@
+"""Add status and expiry indexes for the expiry job
+
+Revision ID: 9d4b2f6e8a31
+Revises: 7c3e9a1d5b20
+Create Date: 2026-10-16 23:40:12.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b2f6e8a31'
+down_revision = '7c3e9a1d5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.create_index('ix_policy_status_expiry_date', ['status', 'expiry_date'], unique=False)
+
+    with op.batch_alter_table('quote', schema=None) as batch_op:
+        batch_op.create_index('ix_quote_status_valid_until', ['status', 'valid_until'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('quote', schema=None) as batch_op:
+        batch_op.drop_index('ix_quote_status_valid_until')
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.drop_index('ix_policy_status_expiry_date')
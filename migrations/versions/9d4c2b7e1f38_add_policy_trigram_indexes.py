@@ -0,0 +1,37 @@
+"""Add policy trigram indexes for autocomplete
+
+Revision ID: 9d4c2b7e1f38
+Revises: 5b8e2d4a7c61
+Create Date: 2026-10-16 16:41:52.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4c2b7e1f38'
+down_revision = '5b8e2d4a7c61'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('policy_number', 'insured_name', 'registration_number')
+
+
+def upgrade():
+    # Trigram indexes are Postgres only; other databases autocomplete in process
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in COLUMNS:
+        op.create_index(
+            f'ix_policy_{column}_trgm', 'policy', [column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for column in COLUMNS:
+        op.drop_index(f'ix_policy_{column}_trgm', table_name='policy')
@@ -0,0 +1,37 @@
+"""Allow one in-flight export job per fingerprint
+
+Revision ID: b7e3d5a9c142
+Revises: 4f8a1c6e2d93
+Create Date: 2026-10-17 11:03:18.204615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3d5a9c142'
+down_revision = '4f8a1c6e2d93'
+branch_labels = None
+depends_on = None
+
+IN_FLIGHT = sa.text("status IN ('queued', 'running')")
+
+
+def upgrade():
+    # export_job is created by db.create_all(), so it may not exist yet
+    if 'export_job' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+    # Jobs left in flight by a duplicate request would break the unique index
+    op.execute(
+        "UPDATE export_job SET status = 'failed', error = 'Superseded by an identical job' "
+        "WHERE status IN ('queued', 'running') AND id NOT IN "
+        "(SELECT MIN(id) FROM export_job WHERE status IN ('queued', 'running') GROUP BY fingerprint)"
+    )
+    op.create_index('ux_export_job_in_flight_fingerprint', 'export_job', ['fingerprint'], unique=True,
+                    sqlite_where=IN_FLIGHT, postgresql_where=IN_FLIGHT)
+
+
+def downgrade():
+    if 'export_job' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index('ux_export_job_in_flight_fingerprint', table_name='export_job')
@@ -0,0 +1,26 @@
+"""Add claim status/date_submitted index
+
+Revision ID: c3f1a7d2e9b4
+Revises: 26099498db06
+Create Date: 2026-10-16 09:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a7d2e9b4'
+down_revision = '26099498db06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.create_index('ix_claim_status_date_submitted', ['status', 'date_submitted'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_status_date_submitted')
@@ -0,0 +1,29 @@
+"""Allow one claim per policy
+
+Revision ID: d2c8f4b6a713
+Revises: b7e3d5a9c142
+Create Date: 2026-10-17 12:26:09.718342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c8f4b6a713'
+down_revision = 'b7e3d5a9c142'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails if a policy already has two claims, which must be resolved first
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_policy_id')
+        batch_op.create_index('ix_claim_policy_id', ['policy_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_policy_id')
+        batch_op.create_index('ix_claim_policy_id', ['policy_id'], unique=False)
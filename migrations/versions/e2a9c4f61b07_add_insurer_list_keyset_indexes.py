@@ -0,0 +1,32 @@
+"""Add insurer policy and claim list keyset indexes
+
+Revision ID: e2a9c4f61b07
+Revises: 9d4c2b7e1f38
+Create Date: 2026-10-16 18:12:37.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9c4f61b07'
+down_revision = '9d4c2b7e1f38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.create_index('ix_policy_company_date_entered_id', ['insurance_company_id', 'date_entered', 'id'], unique=False)
+
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.create_index('ix_claim_company_date_submitted_id', ['insurance_company_id', 'date_submitted', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('claim', schema=None) as batch_op:
+        batch_op.drop_index('ix_claim_company_date_submitted_id')
+
+    with op.batch_alter_table('policy', schema=None) as batch_op:
+        batch_op.drop_index('ix_policy_company_date_entered_id')
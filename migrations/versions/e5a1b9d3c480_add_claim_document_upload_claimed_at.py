@@ -0,0 +1,40 @@
+"""Record when a claim document upload was taken for storing
+
+Revision ID: e5a1b9d3c480
+Revises: d2c8f4b6a713
+Create Date: 2026-10-17 13:41:52.093186
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1b9d3c480'
+down_revision = 'd2c8f4b6a713'
+branch_labels = None
+depends_on = None
+
+
+def _columns():
+    # claim_document_upload is created by db.create_all(), so it may not exist yet
+    inspector = sa.inspect(op.get_bind())
+    if 'claim_document_upload' not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns('claim_document_upload')}
+
+
+def upgrade():
+    columns = _columns()
+    if columns is None or 'claimed_at' in columns:
+        return
+    with op.batch_alter_table('claim_document_upload', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    columns = _columns()
+    if columns is None or 'claimed_at' not in columns:
+        return
+    with op.batch_alter_table('claim_document_upload', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
@@ -1,8 +1,17 @@
 
+import re
 from flask_login import UserMixin
+from sqlalchemy.orm import query_expression, validates
 from extension import db
 from datetime import datetime
 
+
+def registration_key(registration_number):
+	"""Registration number lower-cased with spacing and punctuation removed,
+	so 'KAA 123A', 'kaa-123a' and 'KAA123A' are the same vehicle"""
+	return ''.join(re.findall(r'[^\W_]+', (registration_number or '').lower()))
+
+
 class Admin(UserMixin, db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	username = db.Column(db.String(150), unique=True, nullable=False)
@@ -29,6 +38,9 @@ class InsuranceCompany(db.Model):
 	name = db.Column(db.String(200), unique=True, nullable=False)
 	is_active = db.Column(db.Boolean, default=True, nullable=False)
 	insurers = db.relationship('Insurer', backref='company', lazy=True)
+	# Set by the 'company_scorecard' loader profile; None otherwise
+	policy_count = query_expression()
+	claim_count = query_expression()
 
 class RegulatoryBody(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
@@ -114,6 +126,7 @@ class Policy(db.Model):
 	
 	# Vehicle Details
 	registration_number = db.Column(db.String(50), nullable=False)
+	registration_key = db.Column(db.String(50), nullable=True)  # registration_key(registration_number), for vehicle lookups
 	make_model = db.Column(db.String(150), nullable=False)
 	year_of_manufacture = db.Column(db.Integer, nullable=False)
 	chassis_number = db.Column(db.String(100), nullable=False)
@@ -135,6 +148,7 @@ class Policy(db.Model):
 	insurance_company_id = db.Column(db.Integer, db.ForeignKey('insurance_company.id'), nullable=False)
 	created_by = db.Column(db.Integer, db.ForeignKey('insurer.id'), nullable=False)
 	date_entered = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 	status = db.Column(db.String(20), default='Active', nullable=False)  # Active, Expired, Cancelled
 	cancelled_by = db.Column(db.Integer, db.ForeignKey('insurer.id'), nullable=True)
 	cancellation_date = db.Column(db.DateTime, nullable=True)
@@ -145,6 +159,44 @@ class Policy(db.Model):
 	creator = db.relationship('Insurer', backref='created_policies', lazy=True, foreign_keys=[created_by])
 	canceller = db.relationship('Insurer', backref='cancelled_policies', lazy=True, foreign_keys=[cancelled_by])
 	photos = db.relationship('PolicyPhoto', backref='policy', lazy=True, cascade='all, delete-orphan')
+	
+	@validates('registration_number')
+	def _set_registration_key(self, key, registration_number):
+		self.registration_key = registration_key(registration_number)
+		return registration_number
+	
+	# Delta export feed: changes after a (updated_at, id) cursor
+	__table_args__ = (
+		db.Index('ix_policy_updated_at_id', 'updated_at', 'id'),
+		# Admin policy list: the whole market, newest first, by (date_entered, id) cursor
+		db.Index('ix_policy_date_entered_id', 'date_entered', 'id'),
+		# Insurer policy list: a company's policies, newest first, by (date_entered, id) cursor
+		db.Index('ix_policy_company_date_entered_id', 'insurance_company_id', 'date_entered', 'id'),
+		# Company dashboards and rollups: a company's policies by status
+		db.Index('ix_policy_company_status', 'insurance_company_id', 'status'),
+		# Customer pages: the policies held under the customer's email
+		db.Index('ix_policy_email_address', 'email_address'),
+		# Policy creation: is the vehicle already on an active policy
+		db.Index('ix_policy_registration_status', 'registration_number', 'status'),
+		# Customer vehicle lookup: every policy on a registration, however it was typed
+		db.Index('ix_policy_registration_key', 'registration_key'),
+		# Expiry job: active policies past their expiry date
+		db.Index('ix_policy_status_expiry_date', 'status', 'expiry_date'),
+		# One active policy per vehicle, enforced by the database where it can
+		# (SQLite databases rely on the check in create_policy)
+		db.Index(
+			'ux_policy_active_registration', 'registration_number', unique=True,
+			postgresql_where=db.text("status = 'Active'")
+		).ddl_if(dialect='postgresql'),
+		# Postgres trigram indexes behind the claim form's policy autocomplete
+		*(
+			db.Index(f'ix_policy_{column}_trgm', column, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+			for column in ('policy_number', 'insured_name', 'registration_number')
+		),
+	)
+
+# gin_trgm_ops comes from the pg_trgm extension
+db.event.listen(Policy.__table__, 'before_create', db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
 
 class PolicyPhoto(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
@@ -212,6 +264,21 @@ class Claim(db.Model):
 	creator = db.relationship('Insurer', backref='claims_created', foreign_keys=[created_by])
 	reviewer = db.relationship('Insurer', backref='claims_reviewed', foreign_keys=[reviewed_by])
 	approver = db.relationship('Insurer', backref='claims_approved', foreign_keys=[approved_by])
+	
+	__table_args__ = (
+		# Regulator issue feed: filter on status, newest first
+		db.Index('ix_claim_status_date_submitted', 'status', 'date_submitted'),
+		# Delta export feed: changes after a (last_updated, id) cursor
+		db.Index('ix_claim_last_updated_id', 'last_updated', 'id'),
+		# Admin claim list: the whole market, newest first, by (date_submitted, id) cursor
+		db.Index('ix_claim_date_submitted_id', 'date_submitted', 'id'),
+		# Insurer claim list: a company's claims, newest first, by (date_submitted, id) cursor
+		db.Index('ix_claim_company_date_submitted_id', 'insurance_company_id', 'date_submitted', 'id'),
+		# Company dashboards and rollups: a company's claims by status
+		db.Index('ix_claim_company_status', 'insurance_company_id', 'status'),
+		# One claim per policy; also serves claims against a policy (customer pages)
+		db.Index('ix_claim_policy_id', 'policy_id', unique=True),
+	)
 
 
 class ClaimDocument(db.Model):
@@ -303,6 +370,11 @@ class Quote(db.Model):
 	# Relationships
 	insurance_company = db.relationship('InsuranceCompany', backref='quotes')
 	creator = db.relationship('Insurer', backref='quotes_created')
+	
+	# Expiry job: sent quotes past their validity
+	__table_args__ = (
+		db.Index('ix_quote_status_valid_until', 'status', 'valid_until'),
+	)
 
 
 class CustomerMonitoredPolicy(db.Model):
@@ -340,6 +412,9 @@ class CustomerPolicyRequest(db.Model):
 	customer = db.relationship('Customer', backref='policy_requests')
 	policy = db.relationship('Policy', backref='access_requests')
 	reviewer = db.relationship('Insurer', backref='reviewed_policy_requests')
+	
+	# Customer pages: a customer's requests by policy and status
+	__table_args__ = (db.Index('ix_customer_policy_request_customer_policy_status', 'customer_id', 'policy_id', 'status'),)
 
 
 class PolicyCancellationRequest(db.Model):
@@ -361,6 +436,9 @@ class PolicyCancellationRequest(db.Model):
 	customer = db.relationship('Customer', backref='cancellation_requests')
 	policy = db.relationship('Policy', backref='cancellation_requests')
 	reviewer = db.relationship('Insurer', backref='reviewed_cancellation_requests')
+	
+	# Customer pages: a customer's requests by policy and status
+	__table_args__ = (db.Index('ix_policy_cancellation_request_customer_policy_status', 'customer_id', 'policy_id', 'status'),)
 
 
 class PolicyRenewalRequest(db.Model):
@@ -387,6 +465,9 @@ class PolicyRenewalRequest(db.Model):
 	customer = db.relationship('Customer', backref='renewal_requests')
 	policy = db.relationship('Policy', backref='renewal_requests')
 	reviewer = db.relationship('Insurer', backref='reviewed_renewal_requests')
+	
+	# Customer pages: a customer's requests by policy and status
+	__table_args__ = (db.Index('ix_policy_renewal_request_customer_policy_status', 'customer_id', 'policy_id', 'status'),)
 
 
 class BlogPost(db.Model):
@@ -421,3 +502,155 @@ class ContactMessage(db.Model):
 	# Relationship
 	reader = db.relationship('Admin', backref='read_contact_messages')
 
+
+
+class MetricsRollup(db.Model):
+	"""Incrementally maintained dashboard counters (one global row and one row per company)"""
+	id = db.Column(db.Integer, primary_key=True)
+	scope = db.Column(db.String(50), unique=True, nullable=False)  # global, company:<id>
+	insurance_company_id = db.Column(db.Integer, db.ForeignKey('insurance_company.id'), nullable=True)
+	
+	# Policies by status
+	policies_total = db.Column(db.Integer, default=0, nullable=False)
+	policies_active = db.Column(db.Integer, default=0, nullable=False)
+	policies_expired = db.Column(db.Integer, default=0, nullable=False)
+	policies_cancelled = db.Column(db.Integer, default=0, nullable=False)
+	active_premium = db.Column(db.Float, default=0, nullable=False)
+	
+	# Claims by status
+	claims_total = db.Column(db.Integer, default=0, nullable=False)
+	claims_pending = db.Column(db.Integer, default=0, nullable=False)
+	claims_under_review = db.Column(db.Integer, default=0, nullable=False)
+	claims_approved = db.Column(db.Integer, default=0, nullable=False)
+	claims_rejected = db.Column(db.Integer, default=0, nullable=False)
+	
+	# Pending customer requests
+	pending_access_requests = db.Column(db.Integer, default=0, nullable=False)
+	pending_cancellation_requests = db.Column(db.Integer, default=0, nullable=False)
+	pending_renewal_requests = db.Column(db.Integer, default=0, nullable=False)
+	
+	# Pending staff access requests (global row only)
+	pending_insurer_requests = db.Column(db.Integer, default=0, nullable=False)
+	pending_regulator_requests = db.Column(db.Integer, default=0, nullable=False)
+	
+	updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+	
+	# Relationships
+	insurance_company = db.relationship('InsuranceCompany', backref='metrics_rollup')
+
+
+class ExportJob(db.Model):
+	"""Background CSV export, written to upload/exports/ by the export worker"""
+	id = db.Column(db.Integer, primary_key=True)
+	kind = db.Column(db.String(50), nullable=False)  # policies, claims, admin_report, regulator_report
+	params = db.Column(db.Text, nullable=False)  # JSON export parameters
+	fingerprint = db.Column(db.String(64), nullable=False, index=True)  # Hash of kind + params, for deduplicating in-flight jobs
+	status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, completed, failed
+	requested_by = db.Column(db.String(50), nullable=False)  # Login id, e.g. admin_1
+	rows_written = db.Column(db.Integer, default=0, nullable=False)
+	file_path = db.Column(db.String(500), nullable=True)  # Relative to upload/exports/
+	error = db.Column(db.Text, nullable=True)
+	created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+	started_at = db.Column(db.DateTime, nullable=True)
+	completed_at = db.Column(db.DateTime, nullable=True)
+	
+	__table_args__ = (
+		# At most one queued or running job per export, even for simultaneous requests
+		db.Index(
+			'ux_export_job_in_flight_fingerprint', 'fingerprint', unique=True,
+			sqlite_where=db.text("status IN ('queued', 'running')"),
+			postgresql_where=db.text("status IN ('queued', 'running')")
+		),
+	)
+
+
+class ClaimDocumentUpload(db.Model):
+	"""Claim document received by the batch claim intake, waiting for the document worker to store it"""
+	id = db.Column(db.Integer, primary_key=True)
+	claim_id = db.Column(db.Integer, db.ForeignKey('claim.id'), nullable=False, index=True)
+	document_type = db.Column(db.String(100), nullable=False)
+	filename = db.Column(db.String(255), nullable=False)  # Sender's file name, made safe
+	content = db.Column(db.LargeBinary, nullable=False)
+	status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, storing, failed (stored uploads are deleted)
+	error = db.Column(db.Text, nullable=True)
+	created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+	claimed_at = db.Column(db.DateTime, nullable=True)  # When a worker marked it storing
+
+
+class SearchDocument(db.Model):
+	"""Full-text search terms of one policy, claim, user or company"""
+	id = db.Column(db.Integer, primary_key=True)
+	kind = db.Column(db.String(20), nullable=False)  # policy, claim, customer, insurer, regulator, company
+	entity_id = db.Column(db.Integer, nullable=False)
+	content = db.Column(db.Text, nullable=False)  # Lower-cased search terms, space separated
+	
+	__table_args__ = (
+		db.UniqueConstraint('kind', 'entity_id', name='_search_document_uc'),
+		# Postgres full-text index; SQLite uses the search_document_fts FTS5 table instead
+		db.Index('ix_search_document_content_tsv', db.text("to_tsvector('simple', content)"), postgresql_using='gin').ddl_if(dialect='postgresql'),
+	)
+
+
+class NumberSequence(db.Model):
+	"""Last number handed out for a policy, claim or quote number prefix"""
+	name = db.Column(db.String(20), primary_key=True)  # CO, TO, CL, QT
+	last_value = db.Column(db.Integer, default=0, nullable=False)
+
+
+# Archive tier: policies moved out of the hot tables by archive.py, with their
+# photos, claims and claim documents. Same columns as the live tables, minus
+# the foreign keys, plus when the row was archived.
+
+def archive_columns(table):
+	"""Copies of a live table's columns for its archive table"""
+	return [
+		db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+		for column in table.columns
+	] + [db.Column('archived_at', db.DateTime, nullable=False)]
+
+
+class PolicyArchive(db.Model):
+	"""An archived policy"""
+	__table__ = db.Table(
+		'policy_archive',
+		*archive_columns(Policy.__table__),
+		# Vehicle history: archived policies on a registration
+		db.Index('ix_policy_archive_registration_key', 'registration_key')
+	)
+	archived = True
+	
+	insurance_company = db.relationship(
+		'InsuranceCompany', primaryjoin='foreign(PolicyArchive.insurance_company_id) == InsuranceCompany.id', viewonly=True
+	)
+
+
+class PolicyPhotoArchive(db.Model):
+	"""A photo of an archived policy"""
+	__table__ = db.Table(
+		'policy_photo_archive',
+		*archive_columns(PolicyPhoto.__table__),
+		db.Index('ix_policy_photo_archive_policy_id', 'policy_id')
+	)
+
+
+class ClaimArchive(db.Model):
+	"""A claim against an archived policy"""
+	__table__ = db.Table(
+		'claim_archive',
+		*archive_columns(Claim.__table__),
+		db.Index('ix_claim_archive_policy_id', 'policy_id')
+	)
+	archived = True
+	
+	policy = db.relationship(
+		'PolicyArchive', primaryjoin='foreign(ClaimArchive.policy_id) == PolicyArchive.id', viewonly=True
+	)
+
+
+class ClaimDocumentArchive(db.Model):
+	"""A document of an archived claim"""
+	__table__ = db.Table(
+		'claim_document_archive',
+		*archive_columns(ClaimDocument.__table__),
+		db.Index('ix_claim_document_archive_claim_id', 'claim_id')
+	)
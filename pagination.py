@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from flask import current_app
+
+from extension import db
+
+
+# Keyset (seek) pagination. A page is the rows just past a (sort value, id)
+# cursor in the list order, read through a (sort value, id) index, so page
+# 500 costs the same as page 1 and rows added while someone pages never
+# shift or repeat what they see. Lists are newest first by a timestamp
+# unless told otherwise.
+
+def encode_cursor(value, row_id):
+	if isinstance(value, datetime):
+		value = value.isoformat()
+	return f'{value}_{row_id}'
+
+
+def decode_cursor(cursor, parse=datetime.fromisoformat):
+	"""Split a cursor into (sort value, id); raises ValueError if malformed"""
+	value, row_id = cursor.rsplit('_', 1)
+	return parse(value), int(row_id)
+
+
+class KeysetPage:
+	"""One page of rows plus the cursors of its neighbours (None at either end)"""
+
+	def __init__(self, items, next_cursor=None, prev_cursor=None):
+		self.items = items
+		self.next_cursor = next_cursor
+		self.prev_cursor = prev_cursor
+
+	@property
+	def has_next(self):
+		return self.next_cursor is not None
+
+	@property
+	def has_prev(self):
+		return self.prev_cursor is not None
+
+
+def keyset_page(query, sort_column, id_column, args, per_page=None, descending=True, parse=datetime.fromisoformat):
+	"""Page through query by (sort_column, id_column), newest first unless
+	descending is False
+
+	args may hold an 'after' cursor (the next page) or a 'before' cursor
+	(the previous page); without either the first page is returned. parse
+	turns a cursor's sort value back into a column value. Raises ValueError
+	for a malformed cursor.
+	"""
+	per_page = per_page or current_app.config['PAGE_SIZE']
+	position = db.tuple_(sort_column, id_column)
+	after, before = args.get('after'), args.get('before')
+
+	def list_order(reverse=False):
+		if descending != reverse:
+			return sort_column.desc(), id_column.desc()
+		return sort_column, id_column
+
+	def past(cursor, reverse=False):
+		value = decode_cursor(cursor, parse)
+		return position < value if descending != reverse else position > value
+
+	if before:
+		# Walk back towards the start of the list, then restore its order
+		rows = query.filter(past(before, reverse=True)).order_by(
+			*list_order(reverse=True)
+		).limit(per_page + 1).all()
+		more = len(rows) > per_page
+		items = rows[:per_page][::-1]
+		has_next, has_prev = bool(items), more
+	else:
+		if after:
+			query = query.filter(past(after))
+		rows = query.order_by(*list_order()).limit(per_page + 1).all()
+		more = len(rows) > per_page
+		items = rows[:per_page]
+		has_next, has_prev = more, bool(after) and bool(items)
+
+	def cursor(row):
+		return encode_cursor(getattr(row, sort_column.key), getattr(row, id_column.key))
+
+	return KeysetPage(
+		items,
+		next_cursor=cursor(items[-1]) if has_next else None,
+		prev_cursor=cursor(items[0]) if has_prev else None
+	)
@@ -0,0 +1,129 @@
+import json
+import time
+from collections import Counter
+from functools import partial
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+
+from extension import db
+
+
+# Per-request SQL statistics. Cursor events on the app's engines count the
+# statements each request runs and the time spent in them, keyed by SQL
+# text; the same statement run SQL_REPEAT_THRESHOLD or more times in one
+# request (one lazy load per row, a query in a loop) is flagged as a likely
+# N+1. Every request logs one JSON line - a warning when it has repeats -
+# and in debug mode the response carries X-DB-Queries and X-DB-Time. The
+# line is written when the server closes the response, after a streamed
+# body has run its queries; stream_with_context pushes the request context
+# again, so teardown_request runs twice for those and only logs requests
+# that never produced a response.
+
+LOGGER_EVENT = 'db_queries'
+
+
+class RequestStats:
+	"""Statements run by one request"""
+
+	def __init__(self):
+		self.queries = 0
+		self.seconds = 0.0
+		self.statements = Counter()
+
+	def record(self, statement, seconds):
+		self.queries += 1
+		self.seconds += seconds
+		self.statements[statement] += 1
+
+	def repeated(self, threshold):
+		"""(statement, count) of the statements run at least threshold times, most first"""
+		return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+def current_stats():
+	"""Statistics of the current request, or None outside one"""
+	if not has_request_context():
+		return None
+	return getattr(request, 'db_stats', None)
+
+
+# The start time rides on the statement's execution context, which is
+# dropped with the statement even when it raises; a stack in conn.info
+# would keep an entry per failed statement for the pooled connection's life
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+	started = context._query_start
+	stats = current_stats()
+	if stats is not None:
+		stats.record(statement, time.perf_counter() - started)
+
+
+def listen(engine):
+	event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+	event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def log_line(stats, response_status=None, req=None):
+	"""The structured log record for a finished request (the current one unless req is given)"""
+	req = req if req is not None else request
+	threshold = current_app.config['SQL_REPEAT_THRESHOLD']
+	return {
+		'event': LOGGER_EVENT,
+		'method': req.method,
+		'path': req.path,
+		'endpoint': req.endpoint,
+		'status': response_status,
+		'queries': stats.queries,
+		'db_time_ms': round(stats.seconds * 1000, 2),
+		'repeated': [
+			{'statement': ' '.join(statement.split())[:200], 'count': count}
+			for statement, count in stats.repeated(threshold)
+		]
+	}
+
+
+def _log(app, line):
+	if line['repeated']:
+		app.logger.warning(json.dumps(line))
+	else:
+		app.logger.info(json.dumps(line))
+
+
+def init_app(app):
+	"""Count every request's queries on the app's engines"""
+	with app.app_context():
+		engines = list(db.engines.values())
+	for engine in engines:
+		listen(engine)
+
+	def log_on_close(stats, req, status):
+		with app.app_context():
+			_log(app, log_line(stats, status, req))
+
+	@app.before_request
+	def start_query_stats():
+		request.db_stats = RequestStats()
+
+	@app.after_request
+	def add_query_headers(response):
+		stats = current_stats()
+		if stats is not None:
+			if app.debug:
+				response.headers['X-DB-Queries'] = str(stats.queries)
+				response.headers['X-DB-Time'] = f'{stats.seconds * 1000:.2f}'
+			# Logged once the response is closed so a streamed body's queries are included
+			request.db_stats_logged = True
+			response.call_on_close(partial(log_on_close, stats, request._get_current_object(), response.status_code))
+		return response
+
+	# Requests that failed before producing a response are logged at teardown
+	@app.teardown_request
+	def log_query_stats(error=None):
+		stats = current_stats()
+		if stats is None or getattr(request, 'db_stats_logged', False):
+			return
+		_log(app, log_line(stats))
@@ -0,0 +1,112 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+# Read-replica routing. Report, dashboard and export views are read-only;
+# with DATABASE_URL_REPLICA set, the queries they run go to the replica
+# engine (the 'replica' bind) while everything that writes stays on the
+# primary: flushes, bulk INSERT/UPDATE/DELETE statements, bare
+# session.connection() calls (how the metrics and search code write), and
+# any read later in a transaction that has already written. A user who has
+# just committed reads from the primary for REPLICA_STICKY_SECONDS, so they
+# never see a report that is missing their own change while the replica
+# catches up.
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(FlaskSession):
+	"""Session that sends the reads of replica-routed code to the replica"""
+
+	def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+		if bind is None and self._use_replica(mapper, clause):
+			engine = self._db.engines.get(REPLICA_BIND)
+			if engine is not None:
+				return engine
+		return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+	def _use_replica(self, mapper, clause):
+		if not routed() or self._flushing or self.info.get('replica_wrote'):
+			return False
+		if mapper is None and clause is None:
+			return False
+		return not getattr(clause, 'is_dml', False)
+
+
+def _scope():
+	"""Where the routing flag lives: the current request, or the app context
+	outside one (export jobs)"""
+	if has_request_context():
+		return flask.request
+	return g if has_app_context() else None
+
+
+def routed():
+	"""Whether reads in the current context go to the replica"""
+	return getattr(_scope(), 'read_replica', False)
+
+
+def recently_wrote():
+	"""Whether the current user committed a change too recently to trust the replica"""
+	return has_request_context() and flask.session.get('primary_until', 0) > time.time()
+
+
+@contextmanager
+def reading():
+	"""Route the reads made inside the block to the replica"""
+	scope = _scope()
+	previous = getattr(scope, 'read_replica', False)
+	scope.read_replica = True
+	try:
+		yield
+	finally:
+		scope.read_replica = previous
+
+
+def use_primary():
+	"""Send the rest of the current context's reads back to the primary"""
+	scope = _scope()
+	if scope is not None:
+		scope.read_replica = False
+
+
+def reads(f):
+	"""Serve a read-only view from the replica, unless its user has just written"""
+	@wraps(f)
+	def decorated_function(*args, **kwargs):
+		if not recently_wrote():
+			flask.request.read_replica = True
+		return f(*args, **kwargs)
+	return decorated_function
+
+
+def note_bulk_write(session):
+	"""Note a write that never flushed (a bulk insert), so its user's reads
+	stay on the primary after the commit"""
+	session.info['replica_wrote'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def note_write(session, flush_context):
+	note_bulk_write(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def stick_to_primary(session):
+	if not session.info.pop('replica_wrote', False):
+		return
+	db = getattr(session, '_db', None)
+	if has_request_context() and db is not None and REPLICA_BIND in db.engines:
+		flask.session['primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_write(session):
+	session.info.pop('replica_wrote', None)
@@ -0,0 +1,409 @@
+from datetime import date
+
+from flask import current_app
+
+from extension import db, cache
+from models import Customer, Insurer, Regulator, InsuranceCompany, Policy, Claim, Quote, CustomerPolicyRequest, PolicyCancellationRequest, PolicyRenewalRequest
+import replica
+
+
+# Set-based reporting queries. Every helper here answers with a fixed number of
+# GROUP BY / conditional-aggregate statements, no matter how many companies,
+# insurers or policies exist, so report pages never load whole tables.
+
+def count_where(condition):
+	"""Conditional COUNT usable inside an aggregate query"""
+	return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+
+
+def sum_where(condition, column):
+	"""Conditional SUM usable inside an aggregate query"""
+	return db.func.coalesce(db.func.sum(db.case((condition, column), else_=0)), 0)
+
+
+def user_summary():
+	"""Totals and active/approved counts for every user table"""
+	customers = db.session.query(
+		db.func.count(Customer.id),
+		count_where(Customer.is_active == True)
+	).one()
+	insurers = db.session.query(
+		db.func.count(Insurer.id),
+		count_where(Insurer.is_approved == True)
+	).one()
+	regulators = db.session.query(
+		db.func.count(Regulator.id),
+		count_where(Regulator.is_approved == True)
+	).one()
+
+	return {
+		'total_customers': customers[0],
+		'active_customers': customers[1],
+		'total_insurers': insurers[0],
+		'approved_insurers': insurers[1],
+		'total_regulators': regulators[0],
+		'approved_regulators': regulators[1]
+	}
+
+
+def policy_summary(company_id=None, query=None):
+	"""Policy counts by status and premium totals, over a filtered Policy
+	query when one is given"""
+	query = (Policy.query if query is None else query).with_entities(
+		db.func.count(Policy.id),
+		count_where(Policy.status == 'Active'),
+		count_where(Policy.status == 'Expired'),
+		count_where(Policy.status == 'Cancelled'),
+		sum_where(Policy.status == 'Active', Policy.premium_amount),
+		db.func.coalesce(db.func.sum(Policy.premium_amount), 0)
+	)
+	if company_id is not None:
+		query = query.filter(Policy.insurance_company_id == company_id)
+	total, active, expired, cancelled, active_premium, total_premium = query.one()
+
+	return {
+		'total': total,
+		'active': active,
+		'expired': expired,
+		'cancelled': cancelled,
+		'active_premium': float(active_premium),
+		'total_premium': float(total_premium)
+	}
+
+
+def claim_summary(company_id=None, query=None):
+	"""Claim counts by status, over a filtered Claim query when one is given"""
+	query = (Claim.query if query is None else query).with_entities(
+		db.func.count(Claim.id),
+		count_where(Claim.status == 'Pending'),
+		count_where(Claim.status == 'Under Review'),
+		count_where(Claim.status == 'Approved'),
+		count_where(Claim.status == 'Rejected')
+	)
+	if company_id is not None:
+		query = query.filter(Claim.insurance_company_id == company_id)
+	total, pending, under_review, approved, rejected = query.one()
+
+	return {
+		'total': total,
+		'pending': pending,
+		'under_review': under_review,
+		'approved': approved,
+		'rejected': rejected
+	}
+
+
+def quote_summary(company_id=None):
+	"""Quote counts by status and conversion rate"""
+	query = db.session.query(
+		db.func.count(Quote.id),
+		count_where(Quote.status == 'Sent'),
+		count_where(Quote.status == 'Converted'),
+		count_where(Quote.status == 'Expired')
+	)
+	if company_id is not None:
+		query = query.filter(Quote.insurance_company_id == company_id)
+	total, sent, converted, expired = query.one()
+
+	return {
+		'total': total,
+		'sent': sent,
+		'converted': converted,
+		'expired': expired,
+		'conversion_rate': (converted / total * 100) if total else 0
+	}
+
+
+def customer_summary(email):
+	"""Policy, premium and claim totals for the policies held under one email address"""
+	total_policies, active_policies, total_premium, active_premium = db.session.query(
+		db.func.count(Policy.id),
+		count_where(Policy.status == 'Active'),
+		db.func.coalesce(db.func.sum(Policy.premium_amount), 0),
+		sum_where(Policy.status == 'Active', Policy.premium_amount)
+	).filter(Policy.email_address == email).one()
+	total_claims, approved_claims, rejected_claims = db.session.query(
+		db.func.count(Claim.id),
+		count_where(Claim.status == 'Approved'),
+		count_where(Claim.status == 'Rejected')
+	).join(Policy, Policy.id == Claim.policy_id).filter(Policy.email_address == email).one()
+
+	return {
+		'total_policies': total_policies,
+		'active_policies': active_policies,
+		'total_premium': float(total_premium),
+		'active_premium': float(active_premium),
+		'total_claims': total_claims,
+		'approved_claims': approved_claims,
+		'rejected_claims': rejected_claims
+	}
+
+
+def company_rankings():
+	"""Per-company policy, claim and staff figures for all active companies
+
+	Ordered by active policies (descending), ties broken by company id.
+	"""
+	policy_stats = db.session.query(
+		Policy.insurance_company_id.label('company_id'),
+		count_where(Policy.status == 'Active').label('active_policies'),
+		sum_where(Policy.status == 'Active', Policy.premium_amount).label('total_premium')
+	).group_by(Policy.insurance_company_id).subquery()
+
+	# Claim.insurance_company_id is always copied from the claim's policy,
+	# so grouping on it avoids a join back to the policy table
+	claim_stats = db.session.query(
+		Claim.insurance_company_id.label('company_id'),
+		db.func.count(Claim.id).label('total_claims'),
+		count_where(Claim.status == 'Approved').label('approved_claims'),
+		count_where(Claim.status == 'Rejected').label('rejected_claims')
+	).group_by(Claim.insurance_company_id).subquery()
+
+	staff_stats = db.session.query(
+		Insurer.insurance_company_id.label('company_id'),
+		db.func.count(Insurer.id).label('staff_count')
+	).filter(Insurer.is_approved == True).group_by(Insurer.insurance_company_id).subquery()
+
+	active_policies = db.func.coalesce(policy_stats.c.active_policies, 0)
+	rows = db.session.query(
+		InsuranceCompany.id,
+		InsuranceCompany.name,
+		InsuranceCompany.is_active,
+		active_policies,
+		db.func.coalesce(policy_stats.c.total_premium, 0),
+		db.func.coalesce(claim_stats.c.total_claims, 0),
+		db.func.coalesce(claim_stats.c.approved_claims, 0),
+		db.func.coalesce(claim_stats.c.rejected_claims, 0),
+		db.func.coalesce(staff_stats.c.staff_count, 0)
+	).outerjoin(
+		policy_stats, policy_stats.c.company_id == InsuranceCompany.id
+	).outerjoin(
+		claim_stats, claim_stats.c.company_id == InsuranceCompany.id
+	).outerjoin(
+		staff_stats, staff_stats.c.company_id == InsuranceCompany.id
+	).filter(
+		InsuranceCompany.is_active == True
+	).order_by(active_policies.desc(), InsuranceCompany.id).all()
+
+	return [{
+		'id': row[0],
+		'name': row[1],
+		'is_active': row[2],
+		'active_policies': row[3],
+		'total_premium': float(row[4]),
+		'total_claims': row[5],
+		'approved_claims': row[6],
+		'rejected_claims': row[7],
+		'staff_count': row[8]
+	} for row in rows]
+
+
+def company_scorecard(limit=10):
+	"""Top active companies by compliance score (claim approval rate)
+
+	Companies without claims score 100. Ties are broken by active policies,
+	then company id.
+	"""
+	policy_stats = db.session.query(
+		Policy.insurance_company_id.label('company_id'),
+		count_where(Policy.status == 'Active').label('active_policies')
+	).group_by(Policy.insurance_company_id).subquery()
+	claim_stats = db.session.query(
+		Claim.insurance_company_id.label('company_id'),
+		db.func.count(Claim.id).label('total_claims'),
+		count_where(Claim.status == 'Approved').label('approved_claims')
+	).group_by(Claim.insurance_company_id).subquery()
+
+	active_policies = db.func.coalesce(policy_stats.c.active_policies, 0)
+	total_claims = db.func.coalesce(claim_stats.c.total_claims, 0)
+	approved_claims = db.func.coalesce(claim_stats.c.approved_claims, 0)
+	# approved <= total, so the rate never exceeds 100
+	compliance_score = db.case(
+		(total_claims == 0, 100.0),
+		else_=approved_claims * 100.0 / total_claims
+	)
+
+	rows = db.session.query(
+		InsuranceCompany.id,
+		InsuranceCompany.name,
+		InsuranceCompany.is_active,
+		active_policies,
+		total_claims,
+		approved_claims,
+		compliance_score
+	).outerjoin(
+		policy_stats, policy_stats.c.company_id == InsuranceCompany.id
+	).outerjoin(
+		claim_stats, claim_stats.c.company_id == InsuranceCompany.id
+	).filter(
+		InsuranceCompany.is_active == True
+	).order_by(
+		compliance_score.desc(), active_policies.desc(), InsuranceCompany.id
+	).limit(limit).all()
+
+	return [{
+		'id': row[0],
+		'name': row[1],
+		'status': 'Active' if row[2] else 'Inactive',
+		'active_policies': row[3],
+		'total_claims': row[4],
+		'approved_claims': row[5],
+		'compliance_score': float(row[6])
+	} for row in rows]
+
+
+ISSUE_TYPES = {
+	'Under Review': ('Claim Processing', 'Medium'),
+	'Rejected': ('Claim Rejection', 'High')
+}
+
+
+def recent_issues(limit=10):
+	"""Most recent rejected or under-review claims for the regulator feed
+
+	Served by ix_claim_status_date_submitted; only the columns the feed
+	shows are selected.
+	"""
+	rows = db.session.query(
+		Claim.claim_number,
+		Claim.status,
+		InsuranceCompany.name
+	).outerjoin(
+		InsuranceCompany, InsuranceCompany.id == Claim.insurance_company_id
+	).filter(
+		Claim.status.in_(list(ISSUE_TYPES))
+	).order_by(Claim.date_submitted.desc()).limit(limit).all()
+
+	return [{
+		'id': claim_number,
+		'company': company_name or 'Unknown',
+		'type': ISSUE_TYPES[status][0],
+		'severity': ISSUE_TYPES[status][1]
+	} for claim_number, status, company_name in rows]
+
+
+def user_activity(company_id=None):
+	"""Policies, claims and quotes created by each approved insurer
+
+	Ordered by policies created (descending), ties broken by insurer id.
+	"""
+	policy_counts = db.session.query(
+		Policy.created_by.label('insurer_id'),
+		db.func.count(Policy.id).label('total')
+	).group_by(Policy.created_by).subquery()
+	claim_counts = db.session.query(
+		Claim.created_by.label('insurer_id'),
+		db.func.count(Claim.id).label('total')
+	).group_by(Claim.created_by).subquery()
+	quote_counts = db.session.query(
+		Quote.created_by.label('insurer_id'),
+		db.func.count(Quote.id).label('total')
+	).group_by(Quote.created_by).subquery()
+
+	policies_created = db.func.coalesce(policy_counts.c.total, 0)
+	query = db.session.query(
+		Insurer.id,
+		Insurer.username,
+		Insurer.email,
+		InsuranceCompany.name,
+		policies_created,
+		db.func.coalesce(claim_counts.c.total, 0),
+		db.func.coalesce(quote_counts.c.total, 0)
+	).outerjoin(
+		InsuranceCompany, InsuranceCompany.id == Insurer.insurance_company_id
+	).outerjoin(
+		policy_counts, policy_counts.c.insurer_id == Insurer.id
+	).outerjoin(
+		claim_counts, claim_counts.c.insurer_id == Insurer.id
+	).outerjoin(
+		quote_counts, quote_counts.c.insurer_id == Insurer.id
+	).filter(Insurer.is_approved == True)
+
+	if company_id is not None:
+		query = query.filter(Insurer.insurance_company_id == company_id)
+
+	rows = query.order_by(policies_created.desc(), Insurer.id).all()
+
+	return [{
+		'id': row[0],
+		'username': row[1],
+		'email': row[2],
+		'company': row[3] or 'N/A',
+		'policies_created': row[4],
+		'claims_processed': row[5],
+		'quotes_generated': row[6]
+	} for row in rows]
+
+
+def _pending_requests(model, company_id):
+	"""Scalar subquery counting a company's pending customer requests of one kind"""
+	return db.session.query(db.func.count(model.id)).join(
+		Policy, Policy.id == model.policy_id
+	).filter(
+		Policy.insurance_company_id == company_id,
+		model.status == 'pending'
+	).scalar_subquery()
+
+
+def _insurer_dashboard_counters(company_id, today):
+	# Lapsed policies stay 'Active' until the expiry job marks them
+	active = db.and_(Policy.status == 'Active', Policy.expiry_date >= today)
+	policy_stats = db.session.query(
+		db.func.count(Policy.id).label('total_policies'),
+		count_where(active).label('active_policies'),
+		sum_where(active, Policy.premium_amount).label('total_premium')
+	).filter(Policy.insurance_company_id == company_id).subquery()
+	claim_stats = db.session.query(
+		db.func.count(Claim.id).label('total_claims'),
+		count_where(Claim.status == 'Pending').label('pending_claims'),
+		count_where(Claim.status == 'Under Review').label('under_review_claims')
+	).filter(Claim.insurance_company_id == company_id).subquery()
+
+	row = db.session.query(
+		policy_stats.c.total_policies,
+		policy_stats.c.active_policies,
+		policy_stats.c.total_premium,
+		claim_stats.c.total_claims,
+		claim_stats.c.pending_claims,
+		claim_stats.c.under_review_claims,
+		_pending_requests(CustomerPolicyRequest, company_id),
+		_pending_requests(PolicyCancellationRequest, company_id),
+		_pending_requests(PolicyRenewalRequest, company_id)
+	).select_from(policy_stats).join(claim_stats, db.true()).one()
+
+	counters = dict(zip([
+		'total_policies', 'active_policies', 'total_premium',
+		'total_claims', 'pending_claims', 'under_review_claims',
+		'pending_access_requests', 'pending_cancellation_requests', 'pending_renewal_requests'
+	], row))
+	counters['total_premium'] = float(counters['total_premium'])
+	counters['total_customer_requests'] = counters['pending_access_requests'] + counters['pending_cancellation_requests'] + counters['pending_renewal_requests']
+	return counters
+
+
+def insurer_dashboard_cache_key(company_id):
+	return f'insurer_dashboard:{company_id}'
+
+
+def insurer_dashboard_counters(company_id):
+	"""Policy, claim and request counters for the insurer dashboard
+
+	Computed in a single statement and cached per company for
+	DASHBOARD_CACHE_TIMEOUT seconds. A miss is computed on the primary:
+	the cache is shared with users who have just written, and a lagging
+	replica would cache counters missing their change.
+	"""
+	key = insurer_dashboard_cache_key(company_id)
+	counters = cache.get(key)
+	if counters is None:
+		replica.use_primary()
+		counters = _insurer_dashboard_counters(company_id, date.today())
+		cache.set(key, counters, timeout=current_app.config['DASHBOARD_CACHE_TIMEOUT'])
+	return counters
+
+
+def invalidate_insurer_dashboard(company_ids):
+	"""Drop cached dashboard counters for the given companies"""
+	keys = [insurer_dashboard_cache_key(company_id) for company_id in company_ids]
+	if keys:
+		cache.delete_many(*keys)
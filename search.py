@@ -0,0 +1,290 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import DDL, event, inspect, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from extension import db
+from models import Customer, Insurer, Regulator, InsuranceCompany, Policy, Claim, SearchDocument
+
+
+# Full-text search. Every searchable policy, claim, user and company has one
+# SearchDocument row holding its normalised search terms; an after_flush
+# listener rewrites the row whenever a searched attribute changes, so the
+# index commits (or rolls back) with the change itself. SQLite matches the
+# documents through an FTS5 table kept in step by triggers, Postgres through
+# a GIN index on to_tsvector('simple', content).
+
+# model -> (document kind, searched attributes)
+INDEXED = {
+	Policy: ('policy', ('policy_number', 'insured_name', 'registration_number', 'national_id', 'email_address', 'make_model')),
+	Claim: ('claim', ('claim_number', 'police_report_number', 'accident_location')),
+	Customer: ('customer', ('username', 'email')),
+	Insurer: ('insurer', ('username', 'email', 'staff_id')),
+	Regulator: ('regulator', ('username', 'email', 'staff_id')),
+	InsuranceCompany: ('company', ('name',))
+}
+
+FTS_TABLE = 'search_document_fts'
+
+_SQLITE_DDL = [
+	f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(content, content='search_document', content_rowid='id')",
+	f"""CREATE TRIGGER IF NOT EXISTS search_document_ai AFTER INSERT ON search_document BEGIN
+		INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+	END""",
+	f"""CREATE TRIGGER IF NOT EXISTS search_document_ad AFTER DELETE ON search_document BEGIN
+		INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+	END""",
+	f"""CREATE TRIGGER IF NOT EXISTS search_document_au AFTER UPDATE ON search_document BEGIN
+		INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+		INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+	END"""
+]
+
+for _statement in _SQLITE_DDL:
+	event.listen(SearchDocument.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(SearchDocument.__table__, 'before_drop', DDL(f'DROP TABLE IF EXISTS {FTS_TABLE}').execute_if(dialect='sqlite'))
+
+_fts = db.table(FTS_TABLE, db.column('rowid'), db.column('rank'))
+
+_executor = None
+_slots = None  # Free search threads
+
+
+def words(text):
+	"""Lower-cased alphanumeric words of a value"""
+	return re.findall(r'[^\W_]+', str(text).lower())
+
+
+def terms(text):
+	"""Search terms of a value: its words, plus the words run together so
+	'KAA 123A' and 'KAA123A' find each other"""
+	found = words(text)
+	if len(found) > 1:
+		found.append(''.join(found))
+	return found
+
+
+def _content(model, get):
+	content = []
+	for key in INDEXED[model][1]:
+		value = get(key)
+		if value is not None:
+			content.extend(terms(value))
+	return ' '.join(content)
+
+
+def document(obj):
+	"""Search document content for an indexed object"""
+	return _content(type(obj), lambda key: getattr(obj, key))
+
+
+def _write_documents(connection, changed, removed):
+	table = SearchDocument.__table__
+	for kind, entity_id in removed:
+		connection.execute(table.delete().where(table.c.kind == kind, table.c.entity_id == entity_id))
+	for obj in changed:
+		kind = INDEXED[type(obj)][0]
+		connection.execute(table.delete().where(table.c.kind == kind, table.c.entity_id == obj.id))
+		connection.execute(table.insert().values(kind=kind, entity_id=obj.id, content=document(obj)))
+
+
+def index_mappings(connection, model, mappings):
+	"""Index rows added by a bulk insert, which never reaches the flush
+	listener, from their inserted mappings (ids included)"""
+	kind = INDEXED[model][0]
+	if mappings:
+		connection.execute(SearchDocument.__table__.insert(), [
+			{'kind': kind, 'entity_id': mapping['id'], 'content': _content(model, mapping.get)}
+			for mapping in mappings
+		])
+
+
+@event.listens_for(Session, 'after_flush')
+def update_search_index(session, flush_context):
+	"""Keep SearchDocument in step with every flushed change"""
+	changed = [obj for obj in session.new if type(obj) in INDEXED]
+	for obj in session.dirty:
+		attributes = INDEXED.get(type(obj), (None, ()))[1]
+		state = inspect(obj)
+		if any(state.attrs[key].history.has_changes() for key in attributes):
+			changed.append(obj)
+	removed = [
+		(INDEXED[type(obj)][0], inspect(obj).identity[0])
+		for obj in session.deleted if type(obj) in INDEXED
+	]
+	if changed or removed:
+		_write_documents(session.connection(), changed, removed)
+
+
+def rebuild_index():
+	"""Rebuild every search document from the raw tables"""
+	connection = db.session.connection()
+	table = SearchDocument.__table__
+	connection.execute(table.delete())
+	rows = 0
+	for model, (kind, attributes) in INDEXED.items():
+		query = select(model.id, *(getattr(model, key) for key in attributes)).execution_options(yield_per=1000)
+		batch = []
+		for row in connection.execute(query):
+			content = ' '.join(term for value in row[1:] if value is not None for term in terms(value))
+			batch.append({'kind': kind, 'entity_id': row[0], 'content': content})
+			if len(batch) == 1000:
+				connection.execute(table.insert(), batch)
+				rows += len(batch)
+				batch = []
+		if batch:
+			connection.execute(table.insert(), batch)
+			rows += len(batch)
+	if connection.dialect.name == 'sqlite':
+		connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+	db.session.commit()
+	return rows
+
+
+def ensure_index():
+	"""Build the index on first start against a database that predates it"""
+	if db.session.query(SearchDocument.id).first() is not None:
+		return 0
+	if not any(db.session.query(model.id).first() is not None for model in INDEXED):
+		return 0
+	return rebuild_index()
+
+
+def _hits(kind, tokens):
+	"""(entity_id, score) of the documents matching every token; lower scores rank first"""
+	dialect = db.engine.dialect.name
+	if dialect == 'sqlite':
+		return select(
+			SearchDocument.entity_id,
+			_fts.c.rank.label('score')
+		).join(_fts, _fts.c.rowid == SearchDocument.id).where(
+			SearchDocument.kind == kind,
+			db.text(f'{FTS_TABLE} MATCH :terms').bindparams(terms=' '.join(f'"{token}"*' for token in tokens))
+		).subquery()
+	if dialect == 'postgresql':
+		# Same expression as ix_search_document_content_tsv so the GIN index is used
+		vector = db.func.to_tsvector(db.literal_column("'simple'"), SearchDocument.content)
+		query = db.func.to_tsquery(db.literal_column("'simple'"), ' & '.join(f'{token}:*' for token in tokens))
+		return select(
+			SearchDocument.entity_id,
+			(-db.func.ts_rank(vector, query)).label('score')
+		).where(SearchDocument.kind == kind, vector.op('@@')(query)).subquery()
+	return select(
+		SearchDocument.entity_id,
+		db.literal(0).label('score')
+	).where(
+		SearchDocument.kind == kind,
+		*(SearchDocument.content.like(f'%{token}%') for token in tokens)
+	).subquery()
+
+
+def ranked(model, text):
+	"""Query for the objects of an indexed model matching text, best match first"""
+	tokens = words(text)
+	if not tokens:
+		return model.query.filter(db.false())
+	hits = _hits(INDEXED[model][0], tokens)
+	return model.query.join(hits, hits.c.entity_id == model.id).order_by(hits.c.score, model.id)
+
+
+# SQLite checks for an expired deadline every this many virtual machine instructions
+PROGRESS_INTERVAL = 1000
+
+
+@contextmanager
+def _deadline(session, deadline):
+	"""Abort the session's queries once deadline (time.monotonic()) passes"""
+	connection = session.connection()
+	if connection.dialect.name == 'postgresql':
+		remaining = max(int((deadline - time.monotonic()) * 1000), 1)
+		session.execute(db.text(f'SET LOCAL statement_timeout = {remaining}'))
+		yield
+		return
+	if connection.dialect.name != 'sqlite':
+		yield
+		return
+	# A non-zero answer interrupts the running statement
+	raw = connection.connection.dbapi_connection
+	raw.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_INTERVAL)
+	try:
+		yield
+	finally:
+		# The connection goes back to the pool
+		raw.set_progress_handler(None, 0)
+
+
+def _run_search(app, search, deadline):
+	# Each entity searches in its own app context, and so its own session
+	with app.app_context():
+		if time.monotonic() >= deadline:
+			raise TimeoutError
+		try:
+			with _deadline(db.session, deadline):
+				return search()
+		except OperationalError:
+			if time.monotonic() >= deadline:
+				raise TimeoutError
+			raise
+
+
+def _release_slot(future):
+	_slots.release()
+
+
+def run_searches(searches):
+	"""Run independent entity searches concurrently.
+
+	searches maps a result name to a callable returning a list of objects.
+	Returns (results, timed_out): the objects found, attached to the
+	request's session, and the names of searches that ran past
+	SEARCH_TIMEOUT and were left empty. Queries are stopped at the
+	deadline, so a slow search never keeps a search thread busy; searches
+	that find every thread taken run in the request's thread instead of
+	queuing behind them.
+	"""
+	global _executor, _slots
+	workers = current_app.config['SEARCH_WORKERS']
+	if len(searches) < 2 or not workers:
+		return {name: search() for name, search in searches.items()}, []
+	if _executor is None:
+		_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search')
+		_slots = threading.BoundedSemaphore(workers)
+
+	app = current_app._get_current_object()
+	deadline = time.monotonic() + current_app.config['SEARCH_TIMEOUT']
+	futures, inline = {}, []
+	for name, search in searches.items():
+		if _slots.acquire(blocking=False):
+			futures[name] = _executor.submit(_run_search, app, search, deadline)
+			futures[name].add_done_callback(_release_slot)
+		else:
+			inline.append(name)
+
+	found, timed_out = {}, []
+	for name in inline:
+		try:
+			found[name] = _run_search(app, searches[name], deadline)
+		except TimeoutError:
+			timed_out.append(name)
+	for name, future in futures.items():
+		try:
+			found[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+		except TimeoutError:
+			timed_out.append(name)
+
+	results = {}
+	for name in searches:
+		if name in timed_out:
+			current_app.logger.warning('Search for %s timed out', name)
+			results[name] = []
+		else:
+			# Rows were loaded by another session; attach them so templates
+			# can still lazy-load relationships
+			results[name] = [db.session.merge(obj, load=False) for obj in found[name]]
+	return results, [name for name in searches if name in timed_out]
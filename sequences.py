@@ -0,0 +1,93 @@
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from extension import db
+from models import NumberSequence, Policy, Claim, Quote
+
+
+# Policy, claim and quote numbers. Each prefix has a NumberSequence row
+# holding the last number handed out; a single UPDATE ... RETURNING advances
+# it, so concurrent workers never compute the same number and no insert has
+# to scan for the last one issued. A caller needing many numbers (a bulk
+# import) reserves them a block at a time, one round-trip per block. On
+# Postgres and other servers numbers are reserved in their own short
+# transaction, like a database sequence: the row is locked only for the
+# UPDATE, and numbers reserved by a request that later fails are skipped.
+# SQLite serializes every writer anyway, so there they come from the
+# caller's transaction and are released if it rolls back.
+
+# sequence -> (number format, column holding numbers issued before the sequence existed)
+SEQUENCES = {
+	'CO': ('CO-{:04d}', Policy.policy_number),
+	'TO': ('TO-{:04d}', Policy.policy_number),
+	'CL': ('CL-{:04d}', Claim.claim_number),
+	'QT': ('QT-{:06d}', Quote.quote_number),
+}
+
+
+def issued_max(connection, name):
+	"""Highest number already issued under a sequence's prefix, 0 if none"""
+	column = SEQUENCES[name][1]
+	prefix = f'{name}-'
+	query = select(column).where(column.like(f'{prefix}%')).execution_options(yield_per=1000)
+	highest = 0
+	for number in connection.execute(query).scalars():
+		suffix = number[len(prefix):]
+		if suffix.isdigit():
+			highest = max(highest, int(suffix))
+	return highest
+
+
+def _advance(connection, name, count):
+	table = NumberSequence.__table__
+	return connection.execute(
+		table.update().where(table.c.name == name).values(
+			last_value=table.c.last_value + count
+		).returning(table.c.last_value)
+	).scalar()
+
+
+def _reserve(connection, name, count):
+	last = _advance(connection, name, count)
+	if last is None:
+		# First use: carry on from the numbers issued before the sequence existed
+		table = NumberSequence.__table__
+		try:
+			with connection.begin_nested():
+				connection.execute(table.insert().values(name=name, last_value=issued_max(connection, name)))
+		except IntegrityError:
+			pass  # Another worker created it first
+		last = _advance(connection, name, count)
+	return range(last - count + 1, last + 1)
+
+
+def reserve(name, count=1):
+	"""Reserve count consecutive numbers from a sequence, as a range"""
+	if name not in SEQUENCES:
+		raise ValueError(f'Unknown number sequence {name!r}')
+	if count < 1:
+		raise ValueError('count must be at least 1')
+	if db.engine.dialect.name == 'sqlite':
+		return _reserve(db.session.connection(), name, count)
+	with db.engine.begin() as connection:
+		return _reserve(connection, name, count)
+
+
+def format_number(name, value):
+	return SEQUENCES[name][0].format(value)
+
+
+def next_number(name):
+	"""The next formatted number of a sequence, e.g. 'CL-0042'"""
+	return format_number(name, reserve(name)[0])
+
+
+def numbers(name, block_size=None):
+	"""Endless iterator of formatted numbers, reserved block_size at a time
+	(SEQUENCE_BLOCK_SIZE by default); numbers left unused when the caller
+	stops are skipped"""
+	block_size = block_size or current_app.config['SEQUENCE_BLOCK_SIZE']
+	while True:
+		for value in reserve(name, block_size):
+			yield format_number(name, value)
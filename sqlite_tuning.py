@@ -0,0 +1,52 @@
+from sqlalchemy import event
+
+from extension import db
+
+
+# SQLite performance mode for deployments that run on a SQLite file. Every
+# new connection switches to WAL journaling, so readers no longer block the
+# writer, with synchronous=NORMAL (durable at each checkpoint rather than
+# each commit), a larger page cache, memory-mapped reads, and a busy timeout
+# so a worker waits for the write lock instead of failing with "database is
+# locked". Turned on by SQLITE_TUNING; other databases are left alone.
+
+def pragmas(config):
+	"""PRAGMA statements for a new connection, from the SQLITE_* settings"""
+	return [
+		'PRAGMA journal_mode=WAL',
+		'PRAGMA synchronous=NORMAL',
+		f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+		f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE'])}",
+		f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+		'PRAGMA temp_store=MEMORY'
+	]
+
+
+def tune_engine(engine, config):
+	"""Apply the pragmas to every connection a SQLite engine opens"""
+	if engine.dialect.name != 'sqlite':
+		return False
+	statements = pragmas(config)
+
+	@event.listens_for(engine, 'connect')
+	def set_pragmas(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		try:
+			for statement in statements:
+				cursor.execute(statement)
+		finally:
+			cursor.close()
+
+	return True
+
+
+def init_app(app):
+	"""Tune the app's SQLite engines when SQLITE_TUNING is set"""
+	if not app.config['SQLITE_TUNING']:
+		return
+	with app.app_context():
+		engines = list(db.engines.values())
+	for engine in engines:
+		# Connections already in the pool predate the listener
+		if tune_engine(engine, app.config):
+			engine.dispose()
@@ -4,29 +4,50 @@ Sets up test environment and fixtures
 """
 import pytest
 import os
+import shutil
 import tempfile
-from app import app as flask_app
-from extension import db
+
+# The app binds its database engine when it is imported, so point it at a
+# scratch database first; the tests must never touch instance/app.db
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+
+from app import app as flask_app  # noqa: E402
+from extension import db, cache
+import autocomplete
 from models import Admin, Customer, Insurer, Regulator, InsuranceCompany, RegulatoryBody
 from werkzeug.security import generate_password_hash
 
 
+def pytest_sessionfinish(session, exitstatus):
+    """Remove the scratch database"""
+    os.close(_db_fd)
+    os.unlink(_db_path)
+
+
 @pytest.fixture
 def app():
     """Create application instance for testing"""
-    # Create a temporary database file
-    db_fd, db_path = tempfile.mkstemp()
+    export_dir = tempfile.mkdtemp()
+    upload_dir = tempfile.mkdtemp()
     
     flask_app.config.update({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL'],
         'WTF_CSRF_ENABLED': False,  # Disable CSRF for testing
         'SECRET_KEY': 'test-secret-key',
+        'EXPORT_WORKERS': 0,  # Run export jobs explicitly, not on worker threads
+        'EXPORT_DIR': export_dir,
+        'CLAIM_DOCUMENT_WORKERS': 0,  # Store queued claim documents explicitly
+        'UPLOAD_DIR': upload_dir,
+        'AUTOCOMPLETE_INDEX': True,  # One process, so its autocomplete index is always current
     })
     
     # Create database tables
     with flask_app.app_context():
         db.create_all()
+        cache.clear()
+        autocomplete.reset_indexes()
         
         # Create test insurance company
         test_company = InsuranceCompany(name="Test Insurance Co", is_active=True)
@@ -43,8 +64,8 @@ def app():
     with flask_app.app_context():
         db.session.remove()
         db.drop_all()
-    os.close(db_fd)
-    os.unlink(db_path)
+    shutil.rmtree(export_dir, ignore_errors=True)
+    shutil.rmtree(upload_dir, ignore_errors=True)
 
 
 @pytest.fixture
@@ -109,6 +130,13 @@ def insurer_user(app):
         return insurer
 
 
+@pytest.fixture
+def insurer(app, insurer_user):
+    """The test insurer, loaded again so it stays usable in a test's own app context"""
+    with app.app_context():
+        return Insurer.query.filter_by(email='insurer@test.com').first()
+
+
 @pytest.fixture
 def regulator_user(app):
     """Create test regulator user"""
@@ -166,3 +194,115 @@ def authenticated_regulator(client, regulator_user):
         'password': 'TestPassword123'
     }, follow_redirects=True)
     return client
+
+
+@pytest.fixture
+def make_policy(app):
+    """Factory for policies with every required column filled in"""
+    from datetime import date, timedelta
+    from models import Policy
+    counter = {'n': 0}
+
+    def _make_policy(insurer, **overrides):
+        counter['n'] += 1
+        n = counter['n']
+        values = dict(
+            policy_number=f'TP-{n:05d}',
+            policy_type='Comprehensive',
+            effective_date=date.today(),
+            expiry_date=date.today() + timedelta(days=365),
+            premium_amount=1000.0,
+            payment_mode='Mobile Money',
+            insured_name=f'Insured {n}',
+            national_id=f'ID{n:06d}',
+            date_of_birth=date(1990, 1, 1),
+            phone_number='0700000000',
+            email_address=f'holder{n}@test.com',
+            registration_number=f'KAA{n:03d}A',
+            make_model='Toyota Axio',
+            year_of_manufacture=2018,
+            chassis_number=f'CH{n:06d}',
+            engine_number=f'EN{n:06d}',
+            body_type='Saloon',
+            color='White',
+            seating_capacity=5,
+            use_category='Private',
+            sum_insured=1000000.0,
+            excess=10000.0,
+            insurance_company_id=insurer.insurance_company_id,
+            created_by=insurer.id,
+            status='Active'
+        )
+        values.update(overrides)
+        policy = Policy(**values)
+        db.session.add(policy)
+        db.session.commit()
+        return policy
+
+    return _make_policy
+
+
+@pytest.fixture
+def make_claim(app):
+    """Factory for claims against an existing policy"""
+    from datetime import date, time
+    from models import Claim
+    counter = {'n': 0}
+
+    def _make_claim(policy, **overrides):
+        counter['n'] += 1
+        n = counter['n']
+        values = dict(
+            claim_number=f'TC-{n:05d}',
+            policy_id=policy.id,
+            insurance_company_id=policy.insurance_company_id,
+            accident_date=date.today(),
+            accident_time=time(12, 0),
+            accident_location='Nairobi',
+            accident_description='Rear-end collision',
+            weather_conditions='Clear',
+            police_report_number=f'OB{n:05d}',
+            damage_insured_vehicle='Rear bumper',
+            created_by=policy.created_by,
+            status='Pending'
+        )
+        values.update(overrides)
+        claim = Claim(**values)
+        db.session.add(claim)
+        db.session.commit()
+        return claim
+
+    return _make_claim
+
+
+@pytest.fixture
+def query_budget(app):
+    """Context manager that fails the test when its block runs more SQL
+    statements than a budget; yields the list of statements run so far.
+    The block starts with an empty session, as a real request does, so rows
+    loaded earlier in the test cannot hide lazy loads."""
+    from contextlib import contextmanager
+    from flask import has_app_context
+    from sqlalchemy import event
+
+    @contextmanager
+    def _query_budget(limit):
+        with app.app_context():
+            engine = db.engine
+        if has_app_context():
+            db.session.remove()
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        assert len(statements) <= limit, (
+            f'{len(statements)} queries over a budget of {limit}:\n' + '\n'.join(statements)
+        )
+
+    return _query_budget
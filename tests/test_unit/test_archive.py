@@ -0,0 +1,140 @@
+"""
+Unit tests for the policy archive tier
+Checks which policies are archived, batching, rollups and vehicle history
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from extension import db
+from models import (Customer, Policy, PolicyPhoto, Claim, ClaimDocument, ClaimDocumentUpload,
+                    CustomerMonitoredPolicy, PolicyArchive, PolicyPhotoArchive, ClaimArchive, ClaimDocumentArchive,
+                    MetricsRollup, SearchDocument)
+import archive
+import metrics
+
+
+LONG_AGO = date.today() - timedelta(days=800)
+
+
+@pytest.fixture
+def lapsed(app, insurer, make_policy, make_claim):
+    """A policy expired long ago, with a photo and a settled claim with a document"""
+    with app.app_context():
+        policy = make_policy(insurer, status='Expired', expiry_date=LONG_AGO, registration_number='KAA 001A')
+        db.session.add(PolicyPhoto(policy_id=policy.id, photo_type='front_view', file_path='photos/front.jpg'))
+        claim = make_claim(policy, status='Approved')
+        db.session.add(ClaimDocument(claim_id=claim.id, document_type='police_abstract', file_path='docs/abstract.pdf'))
+        db.session.commit()
+        return policy.id, claim.id
+
+
+def snapshot(company_id):
+    row = MetricsRollup.query.filter_by(scope=metrics.company_scope(company_id)).first()
+    return {name: getattr(row, name) for name in metrics.COUNTER_COLUMNS}
+
+
+class TestArchivePolicies:
+    """Test the archive job moves the right policies and everything under them"""
+
+    def test_moves_policy_with_photos_claims_and_documents(self, app, lapsed):
+        with app.app_context():
+            policy_id, claim_id = lapsed
+            assert archive.archive_policies() == 1
+
+            assert db.session.get(Policy, policy_id) is None
+            assert db.session.get(Claim, claim_id) is None
+            assert PolicyPhoto.query.filter_by(policy_id=policy_id).count() == 0
+            assert ClaimDocument.query.filter_by(claim_id=claim_id).count() == 0
+
+            archived = db.session.get(PolicyArchive, policy_id)
+            assert archived.status == 'Expired'
+            assert archived.registration_key == 'kaa001a'
+            assert archived.archived_at is not None
+            assert PolicyPhotoArchive.query.filter_by(policy_id=policy_id).count() == 1
+            assert db.session.get(ClaimArchive, claim_id).status == 'Approved'
+            assert ClaimDocumentArchive.query.filter_by(claim_id=claim_id).count() == 1
+            assert SearchDocument.query.filter_by(kind='policy', entity_id=policy_id).count() == 0
+
+    def test_keeps_policies_still_in_use(self, app, insurer, customer_user, make_policy, make_claim):
+        """Test recent, active, open-claim and monitored policies stay live"""
+        with app.app_context():
+            customer = Customer.query.filter_by(email='customer@test.com').first()
+            kept = [
+                make_policy(insurer, status='Expired', expiry_date=date.today() - timedelta(days=30)),
+                make_policy(insurer, expiry_date=LONG_AGO),
+                make_policy(insurer, status='Cancelled', expiry_date=LONG_AGO, cancellation_date=datetime.now()),
+            ]
+            open_claim = make_policy(insurer, status='Expired', expiry_date=LONG_AGO)
+            make_claim(open_claim, status='Under Review')
+            monitored = make_policy(insurer, status='Expired', expiry_date=LONG_AGO)
+            db.session.add(CustomerMonitoredPolicy(customer_id=customer.id, policy_id=monitored.id))
+            db.session.commit()
+            cancelled = make_policy(insurer, status='Cancelled', expiry_date=date.today(),
+                                    cancellation_date=datetime.now() - timedelta(days=800))
+
+            assert archive.archive_policies() == 1
+            assert db.session.get(PolicyArchive, cancelled.id) is not None
+            live = {policy_id for (policy_id,) in db.session.query(Policy.id)}
+            assert {policy.id for policy in kept + [open_claim, monitored]} <= live
+
+    def test_waits_for_queued_claim_documents(self, app, lapsed):
+        """Test a policy stays live until the document worker has stored its claim's uploads"""
+        with app.app_context():
+            policy_id, claim_id = lapsed
+            db.session.add(ClaimDocumentUpload(claim_id=claim_id, document_type='logbook', filename='logbook.pdf',
+                                               content=b'%PDF-1.4', status='failed', error='Disk full'))
+            db.session.commit()
+            assert archive.archive_policies() == 0
+            assert db.session.get(Policy, policy_id) is not None
+
+            ClaimDocumentUpload.query.delete()
+            db.session.commit()
+            assert archive.archive_policies() == 1
+
+    def test_runs_in_resumable_batches(self, app, insurer, make_policy):
+        """Test each batch commits on its own and the next run carries on"""
+        with app.app_context():
+            ids = [make_policy(insurer, status='Expired', expiry_date=LONG_AGO).id for _ in range(5)]
+            cutoff = archive.months_before(date.today(), 12)
+            assert archive.archive_batch(cutoff, 2) == 2
+            assert PolicyArchive.query.count() == 2
+            assert archive.archive_policies(batch_size=2) == 3
+            assert sorted(policy_id for (policy_id,) in db.session.query(PolicyArchive.id)) == ids
+
+    def test_rollup_follows_archive(self, app, runner, insurer, lapsed, make_policy):
+        """Test archived rows leave the live counters, as a reconcile would count them"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            make_policy(insurer)
+            archive.archive_policies()
+            counters = snapshot(company_id)
+            assert counters['policies_total'] == 1
+            assert counters['policies_expired'] == 0
+            assert counters['claims_total'] == 0
+
+        runner.invoke(args=['reconcile-metrics'])
+        with app.app_context():
+            assert snapshot(company_id) == counters
+
+    def test_months_before(self):
+        assert archive.months_before(date(2026, 3, 31), 1) == date(2026, 2, 28)
+        assert archive.months_before(date(2026, 1, 15), 12) == date(2025, 1, 15)
+        assert archive.months_before(date(2026, 1, 15), 13) == date(2024, 12, 15)
+
+
+class TestVehicleHistory:
+    """Test vehicle history includes the archive only when asked"""
+
+    def test_archived_policies_on_request(self, app, authenticated_customer, lapsed):
+        with app.app_context():
+            archive.archive_policies()
+            policy_number = PolicyArchive.query.first().policy_number.encode()
+
+        response = authenticated_customer.get('/customer/vehicle/KAA001A')
+        assert response.status_code == 302
+
+        response = authenticated_customer.get('/customer/vehicle/kaa-001a?archived=1')
+        assert response.status_code == 200
+        assert policy_number in response.data
+        assert b'TC-' in response.data
+        assert b'Archived' in response.data
@@ -0,0 +1,213 @@
+"""
+Unit tests for the policy autocomplete
+Checks the in-process trigram index, its upkeep and the API routes
+"""
+from extension import db, cache
+from models import InsuranceCompany, Policy
+import autocomplete
+
+
+def numbers(rows):
+    return [row['policy_number'] for row in rows]
+
+
+class TestCompanyIndex:
+    """Test matching and ranking in the trigram index"""
+
+    def test_lookup(self):
+        """Test substring, spacing and prefix-first matching"""
+        index = autocomplete.CompanyIndex(None)
+        index.add({'id': 1, 'policy_number': 'POL-002', 'insured_name': 'Jane Kaara', 'registration_number': 'KBC 111B'})
+        index.add({'id': 2, 'policy_number': 'POL-001', 'insured_name': 'John Doe', 'registration_number': 'KAA 123A'})
+        index.add({'id': 3, 'policy_number': 'POL-003', 'insured_name': 'Mary Njeri', 'registration_number': 'KAA 124A'})
+
+        assert numbers(index.substring_lookup('kaa12')) == ['POL-001', 'POL-003']
+        assert numbers(index.substring_lookup('KAA123A')) == ['POL-001']
+        assert numbers(index.substring_lookup('kaa 123')) == ['POL-001']
+        assert numbers(index.substring_lookup('njer')) == ['POL-003']
+        # Registration prefix matches rank ahead of a name containing the text
+        assert numbers(index.substring_lookup('kaa')) == ['POL-001', 'POL-003', 'POL-002']
+        assert numbers(index.substring_lookup('kaa', limit=1)) == ['POL-001']
+        assert index.substring_lookup('xyz') == []
+        assert index.substring_lookup('--') == []
+
+    def test_prefix_lookup(self):
+        """Test registration then policy number prefixes, in key order"""
+        index = autocomplete.CompanyIndex(None)
+        index.add({'id': 1, 'policy_number': 'KAA-9', 'insured_name': 'Jane', 'registration_number': 'KBC 111B'})
+        index.add({'id': 2, 'policy_number': 'POL-2', 'insured_name': 'John', 'registration_number': 'KAA 124A'})
+        index.add({'id': 3, 'policy_number': 'POL-3', 'insured_name': 'Kaa Mary', 'registration_number': 'KAA 123A'})
+
+        assert numbers(index.prefix_lookup('KAA')) == ['POL-3', 'POL-2', 'KAA-9']
+        assert numbers(index.prefix_lookup('kaa 12')) == ['POL-3', 'POL-2']
+        assert numbers(index.prefix_lookup('kaa', limit=2)) == ['POL-3', 'POL-2']
+        # Names are substring matches only
+        assert index.prefix_lookup('mary') == []
+
+    def test_remove(self):
+        """Test removed policies leave no keys or postings behind"""
+        index = autocomplete.CompanyIndex(None)
+        index.add({'id': 1, 'policy_number': 'POL-001', 'insured_name': 'Jane', 'registration_number': 'KAA 123A'})
+        index.add({'id': 1, 'policy_number': 'POL-001', 'insured_name': 'Jane', 'registration_number': 'KAA 123B'})
+        index.remove(1)
+        index.remove(1)
+        assert index.substring_lookup('kaa') == []
+        assert index.prefix_lookup('kaa') == []
+        assert not index.postings
+        assert not any(index.sorted_keys.values())
+
+
+class TestSuggestions:
+    """Test suggestions follow committed policy changes"""
+
+    def test_scoped_to_company(self, app, insurer, make_policy):
+        """Test only the company's own policies are suggested"""
+        with app.app_context():
+            other_company = InsuranceCompany(name='Other Insurance Co', is_active=True)
+            db.session.add(other_company)
+            db.session.commit()
+            make_policy(insurer, registration_number='KAA 123A')
+            make_policy(insurer, registration_number='KAA 123B', insurance_company_id=other_company.id)
+
+            rows = autocomplete.suggest_policies(insurer.insurance_company_id, 'kaa123')
+            assert [row['registration_number'] for row in rows] == ['KAA 123A']
+            assert set(rows[0]) == set(autocomplete.DROPDOWN_FIELDS)
+
+    def test_index_follows_commits(self, app, insurer, make_policy):
+        """Test inserts, updates and deletes reach a loaded index"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            policy = make_policy(insurer, insured_name='Jane Wanjiku')
+            assert len(autocomplete.suggest_policies(company_id, 'wanjiku')) == 1
+
+            make_policy(insurer, insured_name='Peter Wanjiku')
+            assert len(autocomplete.suggest_policies(company_id, 'wanjiku')) == 2
+
+            policy.insured_name = 'Jane Otieno'
+            db.session.commit()
+            assert len(autocomplete.suggest_policies(company_id, 'wanjiku')) == 1
+            assert len(autocomplete.suggest_policies(company_id, 'otieno')) == 1
+
+            db.session.delete(policy)
+            db.session.commit()
+            assert autocomplete.suggest_policies(company_id, 'otieno') == []
+
+    def test_rollback_not_applied(self, app, insurer, make_policy):
+        """Test rolled-back changes never reach the index"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            policy = make_policy(insurer, insured_name='Jane Wanjiku')
+            autocomplete.suggest_policies(company_id, 'wanjiku')
+
+            policy.insured_name = 'Jane Otieno'
+            db.session.flush()
+            db.session.rollback()
+            assert autocomplete.suggest_policies(company_id, 'otieno') == []
+            assert len(autocomplete.suggest_policies(company_id, 'wanjiku')) == 1
+
+    def test_other_process_changes_replayed(self, app, insurer, make_policy, monkeypatch):
+        """Test a delta published by another process is replayed onto a copy, without a reload"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            policy = make_policy(insurer, insured_name='Jane Wanjiku')
+            before = autocomplete.company_index(company_id)
+
+            # Another process renames the policy and publishes the change
+            row = dict(autocomplete.dropdown_row(getattr(policy, field) for field in autocomplete.DROPDOWN_FIELDS),
+                       insured_name='Jane Otieno')
+            version = cache.cache.inc(autocomplete.version_key(company_id))
+            cache.set(autocomplete.delta_key(company_id, version), [('add', row)])
+            monkeypatch.setattr(autocomplete, 'build_index', None)
+
+            assert autocomplete.suggest_policies(company_id, 'wanjiku') == []
+            assert len(autocomplete.suggest_policies(company_id, 'otieno')) == 1
+            assert autocomplete.company_index(company_id).version == version
+            # The index earlier lookups hold is left as it was
+            assert len(before.substring_lookup('wanjiku')) == 1
+
+    def test_lost_delta_rebuilt_in_background(self, app, insurer, make_policy):
+        """Test a worker missing a delta answers from its old index until a rebuild lands"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            make_policy(insurer, insured_name='Jane Wanjiku')
+            autocomplete.suggest_policies(company_id, 'wanjiku')
+
+            # Another process renames the policy; its delta has expired by
+            # the time a later one arrives
+            db.session.execute(db.update(Policy).values(insured_name='Jane Otieno'))
+            db.session.commit()
+            version = cache.cache.inc(autocomplete.version_key(company_id), 2)
+            cache.set(autocomplete.delta_key(company_id, version), [('remove', 0)])
+
+            assert len(autocomplete.suggest_policies(company_id, 'wanjiku')) == 1
+            # The rebuild thread runs jobs in order
+            autocomplete._executor.submit(lambda: None).result()
+            assert autocomplete.suggest_policies(company_id, 'wanjiku') == []
+            assert len(autocomplete.suggest_policies(company_id, 'otieno')) == 1
+
+    def test_short_text_matches_prefixes(self, app, insurer, make_policy):
+        """Test one or two characters only match registration and policy number prefixes"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            make_policy(insurer, insured_name='Jane Kaara', registration_number='KBC 111B')
+            make_policy(insurer, insured_name='John Doe', registration_number='KAA 123A')
+            rows = autocomplete.suggest_policies(company_id, 'ka')
+            assert [row['registration_number'] for row in rows] == ['KAA 123A']
+            assert len(autocomplete.suggest_policies(company_id, 'kaar')) == 1
+
+    def test_per_process_cache_uses_database(self, app, insurer, make_policy, monkeypatch):
+        """Test without a shared cache nothing is served from an in-process index"""
+        monkeypatch.setitem(app.config, 'AUTOCOMPLETE_INDEX', False)
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            make_policy(insurer, insured_name='Jane Wanjiku')
+            assert autocomplete.warm_indexes() == 0
+            assert len(autocomplete.suggest_policies(company_id, 'wanjiku')) == 1
+
+            # Another process renames the policy; no version reaches this one
+            db.session.execute(db.update(Policy).values(insured_name='Jane Otieno'))
+            db.session.commit()
+            assert autocomplete.suggest_policies(company_id, 'wanjiku') == []
+            assert len(autocomplete.suggest_policies(company_id, 'otieno')) == 1
+            assert company_id not in autocomplete._indexes
+
+
+class TestAutocompleteRoutes:
+    """Test the claim form's autocomplete endpoints"""
+
+    def test_search_and_details(self, app, authenticated_insurer, insurer, make_policy):
+        """Test suggestions are slim and details are company scoped"""
+        with app.app_context():
+            policy = make_policy(insurer, registration_number='KAA 123A')
+            other_company = InsuranceCompany(name='Other Insurance Co', is_active=True)
+            db.session.add(other_company)
+            db.session.commit()
+            other = make_policy(insurer, insurance_company_id=other_company.id)
+            policy_id, national_id, other_id = policy.id, policy.national_id, other.id
+
+        suggestions = authenticated_insurer.get('/api/search-policies?q=KAA12').get_json()['policies']
+        assert [row['id'] for row in suggestions] == [policy_id]
+        assert 'national_id' not in suggestions[0]
+
+        details = authenticated_insurer.get(f'/api/policies/{policy_id}').get_json()['policy']
+        assert details['national_id'] == national_id
+        assert authenticated_insurer.get(f'/api/policies/{other_id}').status_code == 404
+
+    def test_vehicle_lookup(self, app, authenticated_customer, insurer, make_policy):
+        """Test the customer vehicle page finds every company's policies across spacing variants"""
+        with app.app_context():
+            other_company = InsuranceCompany(name='Other Insurance Co', is_active=True)
+            db.session.add(other_company)
+            db.session.commit()
+            expired = make_policy(insurer, registration_number='KAA 123A', status='Expired')
+            policy = make_policy(insurer, registration_number='KAA-123A', make_model='Mazda Demio', insurance_company_id=other_company.id)
+            other = make_policy(insurer, registration_number='KAA 123B')
+            assert policy.registration_key == 'kaa123a'
+            numbers = expired.policy_number, policy.policy_number, other.policy_number
+
+        response = authenticated_customer.get('/customer/vehicle/kaa123a')
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        assert 'Mazda Demio' in page
+        assert numbers[0] in page and numbers[1] in page and numbers[2] not in page
+        assert authenticated_customer.get('/customer/vehicle/KZZ999Z').status_code == 302
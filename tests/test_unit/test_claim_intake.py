@@ -0,0 +1,246 @@
+"""
+Unit tests for the batch claim intake
+Checks row validation, the one-claim-per-policy rule, bookkeeping and the document queue
+"""
+import base64
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from extension import db
+from models import Insurer, InsuranceCompany, Policy, Claim, ClaimDocument, ClaimDocumentUpload, MetricsRollup, SearchDocument
+import claim_intake
+import metrics
+
+
+def claim_row(policy_number, **overrides):
+    row = dict(
+        policy_number=policy_number,
+        accident_date='2026-03-14',
+        accident_time='17:45',
+        accident_location='Mombasa Road',
+        accident_description='Side-swiped while merging',
+        weather_conditions='Rainy',
+        police_report_number=f'OB/{policy_number}',
+        vehicle_towed='no',
+        tow_location='',
+        damage_insured_vehicle='Driver side doors',
+        damage_third_party='',
+        injuries_driver_passengers='',
+        injuries_third_parties='',
+        witness_name='',
+        witness_contact='',
+        witness_statement=''
+    )
+    row.update(overrides)
+    return row
+
+
+def jsonl(rows):
+    return io.BytesIO(''.join(json.dumps(row) + '\n' for row in rows).encode())
+
+
+def document(document_type='police_abstract', filename='abstract.pdf', content=b'%PDF-1.4 abstract'):
+    return {'document_type': document_type, 'filename': filename, 'content': base64.b64encode(content).decode()}
+
+
+@pytest.fixture
+def policies(app, insurer, make_policy):
+    """Policy numbers of four policies of the test insurer"""
+    with app.app_context():
+        return [make_policy(insurer).policy_number for _ in range(4)]
+
+
+class TestIntakeClaims:
+    """Test rows become claims exactly as the claim form would create them"""
+
+    def test_creates_claims(self, app, insurer, policies):
+        with app.app_context():
+            rows = [claim_row(policies[0]), claim_row(policies[1], vehicle_towed=True, tow_location='AA Garage')]
+            result = claim_intake.intake_claims(claim_intake.read_rows(jsonl(rows), 'jsonl'), insurer)
+            assert (result.created, result.rejected) == (2, 0)
+            report = result.report()
+            assert [row['claim_number'] for row in report['results']] == ['CL-0001', 'CL-0002']
+
+            first, second = Claim.query.order_by(Claim.id).all()
+            assert first.policy.policy_number == policies[0]
+            assert first.status == 'Pending' and first.created_by == insurer.id
+            assert first.accident_time.isoformat() == '17:45:00'
+            assert (first.vehicle_towed, first.tow_location, first.witness_name) == (False, None, None)
+            assert (second.vehicle_towed, second.tow_location) == (True, 'AA Garage')
+
+    def test_rejects_rows(self, app, insurer, policies, make_policy, make_claim):
+        """Test form errors, claimed, repeated and unknown policies are reported by row"""
+        with app.app_context():
+            existing = make_claim(make_policy(insurer), claim_number='CL-0900')
+            other_company = InsuranceCompany(name='Other Insurance Co', is_active=True)
+            db.session.add(other_company)
+            db.session.commit()
+            other_insurer = Insurer(username='otherinsurer', email='other@test.com', password='x',
+                                    insurance_company_id=other_company.id, is_approved=True)
+            db.session.add(other_insurer)
+            db.session.commit()
+            foreign = make_policy(other_insurer).policy_number
+            body = io.BytesIO('\n'.join([
+                json.dumps(claim_row(policies[0], weather_conditions='Snow', accident_date='')),
+                json.dumps(claim_row(policies[1])),
+                'not json',
+                json.dumps(claim_row(policies[1].lower())),
+                '',
+                json.dumps(claim_row(foreign)),
+                json.dumps(claim_row(existing.policy.policy_number)),
+                json.dumps(claim_row('', documents=[{'document_type': 'selfie', 'filename': 'me.jpg', 'content': 'eA=='}]))
+            ]).encode())
+            result = claim_intake.intake_claims(claim_intake.read_rows(body, 'jsonl'), insurer, batch_size=3)
+            assert result.created == 1
+            errors = {row['row']: row['errors'] for row in result.report()['results'] if row['status'] == 'rejected'}
+            assert sorted(errors) == [1, 3, 4, 6, 7, 8]
+            assert any('Date of Accident' in error for error in errors[1])
+            assert any('Weather/Road Conditions' in error for error in errors[1])
+            assert errors[3] == ['Line is not a JSON object']
+            assert errors[4] == ['Policy appears more than once in the request']
+            assert errors[6] == [f'No policy {foreign} with your company']
+            assert errors[7] == ['Policy already has a claim (Claim No: CL-0900)']
+            assert errors[8] == ['Policy number is required', "Document 1: unknown document type 'selfie'"]
+
+    def test_policy_claimed_during_intake(self, app, insurer, policies, make_claim, monkeypatch):
+        """Test a claim committed by another request after the lookup rejects only its row"""
+        with app.app_context():
+            lookup = claim_intake._policies
+            calls = []
+
+            def before_other_request(policy_numbers, company_id):
+                # The first lookup runs before the other request commits its claim
+                calls.append(policy_numbers)
+                found = lookup(policy_numbers, company_id)
+                if len(calls) == 1:
+                    found = {number: (policy_id, None) for number, (policy_id, _) in found.items()}
+                return found
+
+            make_claim(Policy.query.filter_by(policy_number=policies[1]).one(), claim_number='CL-0900')
+            monkeypatch.setattr(claim_intake, '_policies', before_other_request)
+            result = claim_intake.intake_claims([(1, claim_row(policies[0])), (2, claim_row(policies[1]))], insurer)
+            assert (result.created, result.rejected) == (1, 1)
+            assert result.report()['results'][1]['errors'] == ['Policy already has a claim (Claim No: CL-0900)']
+            assert Claim.query.count() == 2
+            rollup = MetricsRollup.query.filter_by(scope=metrics.company_scope(insurer.insurance_company_id)).first()
+            assert rollup.claims_total == 2
+
+    def test_bookkeeping_follows_bulk_insert(self, app, insurer, policies):
+        """Test rollups and search see claims the flush never did"""
+        with app.app_context():
+            result = claim_intake.intake_claims([(1, claim_row(policies[0])), (2, claim_row(policies[1]))], insurer)
+            rollup = MetricsRollup.query.filter_by(scope=metrics.company_scope(insurer.insurance_company_id)).first()
+            assert (rollup.claims_total, rollup.claims_pending) == (2, 2)
+            claim_id = result.report()['results'][0]['claim_id']
+            assert 'mombasa' in SearchDocument.query.filter_by(kind='claim', entity_id=claim_id).first().content
+
+    def test_statements_per_batch(self, app, insurer, make_policy, query_budget):
+        """Test a batch costs a fixed number of statements, not one per row"""
+        with app.app_context():
+            numbers = [make_policy(insurer).policy_number for _ in range(100)]
+            rows = [(n, claim_row(number, documents=[document()])) for n, number in enumerate(numbers, 1)]
+        with app.app_context():
+            with query_budget(30) as statements:
+                result = claim_intake.intake_claims(rows, Insurer.query.filter_by(email='insurer@test.com').first(), batch_size=50)
+            assert (result.created, result.documents_queued) == (100, 100)
+            assert sum(statement.startswith('INSERT INTO claim ') for statement in statements) <= 2
+            assert sum(statement.startswith('SELECT policy.policy_number') for statement in statements) == 2
+
+    def test_csv_rows(self, app, insurer, policies):
+        with app.app_context():
+            output = io.StringIO()
+            writer = csv.DictWriter(output, fieldnames=list(claim_row('')))
+            writer.writeheader()
+            writer.writerows([claim_row(policies[0]), claim_row(policies[1], accident_time='late')])
+            result = claim_intake.intake_claims(claim_intake.read_rows(io.BytesIO(output.getvalue().encode()), 'csv'), insurer)
+            assert result.created == 1
+            assert result.report()['results'][1]['row'] == 3
+
+
+class TestDocumentQueue:
+    """Test documents wait in the queue until the document worker stores them"""
+
+    def test_stores_queued_documents(self, app, insurer, policies):
+        with app.app_context():
+            rows = [(1, claim_row(policies[0], documents=[document(), document('accident_photo_1', '../front.jpg', b'jpeg')]))]
+            result = claim_intake.intake_claims(rows, insurer)
+            claim_id = result.report()['results'][0]['claim_id']
+            assert ClaimDocument.query.count() == 0
+            assert ClaimDocumentUpload.query.filter_by(status='queued').count() == 2
+
+            assert claim_intake.store_queued_documents(batch_size=1) == 2
+            assert ClaimDocumentUpload.query.count() == 0
+            paths = sorted(d.file_path for d in ClaimDocument.query.filter_by(claim_id=claim_id))
+            assert paths == [f'claims/{claim_id}/accident_photo_1_front.jpg', f'claims/{claim_id}/police_abstract_abstract.pdf']
+            with open(os.path.join(claim_intake.upload_dir(), paths[1]), 'rb') as stored:
+                assert stored.read() == b'%PDF-1.4 abstract'
+            assert claim_intake.store_queued_documents() == 0
+
+    def test_stalled_documents_reclaimed(self, app, insurer, policies):
+        """Test documents left 'storing' by a stopped worker are stored by the next run"""
+        with app.app_context():
+            claim_intake.intake_claims([(1, claim_row(policies[0], documents=[document(), document('logbook')]))], insurer)
+            stalled, running = ClaimDocumentUpload.query.order_by(ClaimDocumentUpload.id).all()
+            stalled.status, stalled.claimed_at = 'storing', datetime.utcnow() - timedelta(seconds=app.config['CLAIM_DOCUMENT_TIMEOUT'] + 60)
+            running.status, running.claimed_at = 'storing', datetime.utcnow()
+            db.session.commit()
+
+            assert claim_intake.store_queued_documents() == 1
+            assert [upload.id for upload in ClaimDocumentUpload.query] == [running.id]
+
+    def test_failed_documents_retried(self, app, runner, insurer, policies):
+        """Test failed documents stay put until retried from the CLI"""
+        with app.app_context():
+            claim_intake.intake_claims([(1, claim_row(policies[0], documents=[document()]))], insurer)
+            ClaimDocumentUpload.query.update({'status': 'failed', 'error': 'Disk full'})
+            db.session.commit()
+            assert claim_intake.store_queued_documents() == 0
+
+        assert 'Stored 0 claim documents' in runner.invoke(args=['store-claim-documents']).output
+        output = runner.invoke(args=['store-claim-documents', '--retry-failed']).output
+        assert 'Queued 1 failed claim documents again' in output
+        assert 'Stored 1 claim documents' in output
+        with app.app_context():
+            assert ClaimDocumentUpload.query.count() == 0
+            assert ClaimDocument.query.count() == 1
+
+
+class TestIntakeEndpoint:
+    """Test the batch API and the document CLI command"""
+
+    def test_batch_api(self, app, authenticated_insurer, policies):
+        body = jsonl([claim_row(policies[0], documents=[document()]), claim_row('CO-9999')]).getvalue()
+        response = authenticated_insurer.post('/api/insurer/claims/batch', data=body, content_type='application/x-ndjson')
+        assert response.status_code == 200
+        report = response.get_json()
+        assert (report['success'], report['created'], report['rejected'], report['documents_queued']) == (True, 1, 1, 1)
+        assert report['results'][0]['status'] == 'created'
+        assert report['results'][1]['errors'] == ['No policy CO-9999 with your company']
+
+        claim_id = report['results'][0]['claim_id']
+        runner = app.test_cli_runner()
+        assert 'Stored 1 claim documents' in runner.invoke(args=['store-claim-documents']).output
+        stored = authenticated_insurer.get(f'/uploads/claims/{claim_id}/police_abstract_abstract.pdf')
+        assert stored.data == b'%PDF-1.4 abstract'
+
+    def test_form_uploads_share_upload_dir(self, app, authenticated_insurer, insurer, make_policy, make_claim):
+        """Test documents uploaded on the claim page land where /uploads/ serves them"""
+        with app.app_context():
+            claim_id = make_claim(make_policy(insurer)).id
+        response = authenticated_insurer.post(f'/insurer/upload-claim-document/{claim_id}', data={
+            'file': (io.BytesIO(b'%PDF-1.4 logbook'), 'logbook.pdf'),
+            'document_type': 'logbook'
+        }, content_type='multipart/form-data')
+        file_url = response.get_json()['file_url']
+        assert os.path.exists(os.path.join(claim_intake.upload_dir(), 'claims', str(claim_id), 'logbook_logbook.pdf'))
+        assert authenticated_insurer.get(file_url).data == b'%PDF-1.4 logbook'
+
+    def test_rejects_other_bodies(self, authenticated_insurer, insurer):
+        response = authenticated_insurer.post('/api/insurer/claims/batch', data=b'{}', content_type='application/json')
+        assert response.status_code == 415
+        response = authenticated_insurer.post('/api/insurer/claims/batch', data=b'\xff\xfe\n', content_type='application/x-ndjson')
+        assert response.status_code == 400
@@ -0,0 +1,97 @@
+"""
+Unit tests for the unified user directory
+Checks role and status filters, alphabetical paging and the admin pages
+"""
+import pytest
+from extension import db
+from models import Customer, Insurer, Regulator, InsuranceCompany, RegulatoryBody
+import directory
+
+
+@pytest.fixture
+def people(app):
+    """Accounts of every role, with one username shared across roles"""
+    with app.app_context():
+        company = InsuranceCompany.query.first()
+        body = RegulatoryBody.query.first()
+        db.session.add_all([
+            Customer(username='alice', email='alice@test.com', password='x', is_active=True),
+            Customer(username='sam', email='sam.c@test.com', password='x', is_active=False),
+            Insurer(username='sam', email='sam.i@test.com', password='x', staff_id='INS100',
+                    insurance_company_id=company.id, is_approved=False, is_active=True),
+            Insurer(username='bob', email='bob@test.com', password='x', staff_id='INS101',
+                    insurance_company_id=company.id, is_approved=True, is_active=True),
+            Regulator(username='sam', email='sam.r@test.com', password='x', staff_id='REG100',
+                      regulatory_body_id=body.id, is_approved=True, is_active=True),
+        ])
+        db.session.commit()
+
+
+def accounts(page):
+    return [(row.username, row.role) for row in page.items]
+
+
+class TestDirectory:
+    """Test the union of every account table"""
+
+    def test_filters(self, app, people):
+        """Test role and status filters apply per branch"""
+        with app.app_context():
+            rows = directory.directory_page({})
+            assert accounts(rows) == [
+                ('alice', 'customer'), ('bob', 'insurer'),
+                ('sam', 'customer'), ('sam', 'insurer'), ('sam', 'regulator')
+            ]
+            assert accounts(directory.directory_page({'role': 'insurer'})) == [('bob', 'insurer'), ('sam', 'insurer')]
+            assert accounts(directory.directory_page({'status': 'disabled'})) == [('sam', 'customer')]
+            assert accounts(directory.directory_page({'status': 'pending'})) == [('sam', 'insurer')]
+            assert accounts(directory.directory_page({'role': 'customer', 'status': 'approved'})) == [
+                ('alice', 'customer'), ('sam', 'customer')
+            ]
+
+    def test_organisation(self, app, people):
+        """Test staff rows carry their company or body name"""
+        with app.app_context():
+            rows = {row.role: row for row in directory.directory_page({}).items if row.username == 'sam'}
+            assert rows['customer'].organisation is None
+            assert rows['insurer'].organisation == 'Test Insurance Co'
+            assert rows['regulator'].organisation == 'Test Regulatory Body'
+            assert rows['regulator'].staff_id == 'REG100'
+
+    def test_paging_across_roles(self, app, people):
+        """Test shared usernames page without gaps or repeats"""
+        with app.app_context():
+            first = directory.directory_page({}, per_page=3)
+            assert accounts(first) == [('alice', 'customer'), ('bob', 'insurer'), ('sam', 'customer')]
+            second = directory.directory_page({'after': first.next_cursor}, per_page=3)
+            assert accounts(second) == [('sam', 'insurer'), ('sam', 'regulator')]
+            assert not second.has_next
+            back = directory.directory_page({'before': second.prev_cursor}, per_page=3)
+            assert accounts(back) == accounts(first)
+
+
+class TestAdminPages:
+    """Test the admin pages built on the directory"""
+
+    def test_user_management(self, app, monkeypatch, authenticated_admin, people):
+        """Test the filtered, paged list"""
+        monkeypatch.setitem(app.config, 'PAGE_SIZE', 2)
+        body = authenticated_admin.get('/admin/user-management?role=insurer').get_data(as_text=True)
+        assert 'bob@test.com' in body and 'sam.i@test.com' in body
+        assert 'alice@test.com' not in body
+
+        body = authenticated_admin.get('/admin/user-management').get_data(as_text=True)
+        assert 'alice@test.com' in body and 'bob@test.com' in body
+        assert 'sam.c@test.com' not in body
+        assert 'after=' in body
+
+        assert authenticated_admin.get('/admin/user-management?after=nonsense').status_code == 400
+
+    def test_export(self, authenticated_admin, people):
+        """Test the CSV export follows the filters"""
+        response = authenticated_admin.get('/admin/export-users-csv?role=regulator')
+        assert response.status_code == 200
+        lines = response.get_data(as_text=True).strip().splitlines()
+        assert lines[0].startswith('Username,Email,Role')
+        assert len(lines) == 2
+        assert 'sam.r@test.com' in lines[1] and 'Test Regulatory Body' in lines[1]
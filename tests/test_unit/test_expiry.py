@@ -0,0 +1,128 @@
+"""
+Unit tests for the policy and quote expiry job
+Checks batched status updates, the rollup counters and the CLI command
+"""
+from datetime import date, datetime, timedelta
+
+from extension import db
+from models import Policy, Quote, MetricsRollup
+import expiry
+import metrics
+import reports
+
+
+def add_quote(insurer, number, valid_until, status='Sent'):
+    quote = Quote(
+        quote_number=number,
+        insurance_company_id=insurer.insurance_company_id,
+        created_by=insurer.id,
+        customer_email='quote@test.com',
+        vehicle_value=1000000.0,
+        cover_type='Comprehensive',
+        base_premium=40000.0,
+        final_premium=40000.0,
+        status=status,
+        valid_until=valid_until
+    )
+    db.session.add(quote)
+    db.session.commit()
+    return quote
+
+
+def snapshot(company_id):
+    row = MetricsRollup.query.filter_by(scope=metrics.company_scope(company_id)).first()
+    return {name: getattr(row, name) for name in metrics.COUNTER_COLUMNS}
+
+
+class TestExpirePolicies:
+    """Test lapsed policies are expired in batches"""
+
+    def test_expires_lapsed_active_policies(self, app, insurer, make_policy):
+        """Test only active policies past their expiry date change"""
+        with app.app_context():
+            yesterday = date.today() - timedelta(days=1)
+            lapsed = [make_policy(insurer, expiry_date=yesterday, premium_amount=1000.0).id for _ in range(5)]
+            current = make_policy(insurer, expiry_date=date.today(), premium_amount=700.0).id
+            cancelled = make_policy(insurer, expiry_date=yesterday, status='Cancelled').id
+
+            assert expiry.expire_policies(batch_size=2) == 5
+            assert expiry.expire_policies(batch_size=2) == 0
+
+            statuses = dict(db.session.query(Policy.id, Policy.status))
+            assert {statuses[policy_id] for policy_id in lapsed} == {'Expired'}
+            assert statuses[current] == 'Active'
+            assert statuses[cancelled] == 'Cancelled'
+
+    def test_rollup_follows_expiry(self, app, runner, insurer, make_policy):
+        """Test the bulk update moves the rollup counters like a reconcile would"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            make_policy(insurer, expiry_date=date.today() - timedelta(days=30), premium_amount=1500.0)
+            make_policy(insurer, premium_amount=500.0)
+
+            expiry.expire_policies()
+            counters = snapshot(company_id)
+            assert counters['policies_active'] == 1
+            assert counters['policies_expired'] == 1
+            assert counters['active_premium'] == 500.0
+
+        runner.invoke(args=['reconcile-metrics'])
+        with app.app_context():
+            assert snapshot(company_id) == counters
+
+    def test_lapsed_policies_inactive_before_job_runs(self, app, insurer, make_policy):
+        """Test pages do not count a lapsed policy as active while it waits for the job"""
+        with app.app_context():
+            make_policy(insurer, expiry_date=date.today() - timedelta(days=1), premium_amount=1500.0)
+            make_policy(insurer, premium_amount=500.0)
+            counters = reports.insurer_dashboard_counters(insurer.insurance_company_id)
+            assert counters['active_policies'] == 1
+            assert counters['total_premium'] == 500.0
+
+
+class TestExpireQuotes:
+    """Test sent quotes past their validity are expired"""
+
+    def test_expires_sent_quotes(self, app, insurer):
+        with app.app_context():
+            now = datetime.now()
+            add_quote(insurer, 'QT-900001', now - timedelta(days=1))
+            add_quote(insurer, 'QT-900002', now + timedelta(days=1))
+            add_quote(insurer, 'QT-900003', now - timedelta(days=1), status='Converted')
+            add_quote(insurer, 'QT-900004', None)
+
+            assert expiry.expire_quotes() == 1
+            statuses = dict(db.session.query(Quote.quote_number, Quote.status))
+            assert statuses == {'QT-900001': 'Expired', 'QT-900002': 'Sent', 'QT-900003': 'Converted', 'QT-900004': 'Sent'}
+
+
+class TestExpiryRuns:
+    """Test the CLI command and the in-process scheduler"""
+
+    def test_cli_command(self, app, runner, insurer, make_policy):
+        with app.app_context():
+            make_policy(insurer, expiry_date=date.today() - timedelta(days=1))
+            add_quote(insurer, 'QT-900001', datetime.now() - timedelta(days=1))
+
+        result = runner.invoke(args=['expire-policies'])
+        assert 'Expired 1 policies and 1 quotes' in result.output
+
+    def test_scheduler(self, app, insurer, make_policy, monkeypatch):
+        """Test the scheduler thread runs the job and stops on request"""
+        with app.app_context():
+            policy_id = make_policy(insurer, expiry_date=date.today() - timedelta(days=1)).id
+
+        assert expiry.start_scheduler(app) is None  # EXPIRY_INTERVAL is 0 by default
+        monkeypatch.setitem(app.config, 'EXPIRY_INTERVAL', 3600)
+        thread = expiry.start_scheduler(app)
+        try:
+            for _ in range(50):
+                with app.app_context():
+                    if db.session.get(Policy, policy_id).status == 'Expired':
+                        break
+                thread.join(0.1)
+        finally:
+            expiry.stop_scheduler()
+        assert not thread.is_alive()
+        with app.app_context():
+            assert db.session.get(Policy, policy_id).status == 'Expired'
@@ -0,0 +1,140 @@
+"""
+Unit tests for background export jobs
+Checks deduplication, the job runner and signed downloads
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from extension import db
+from models import Insurer, ExportJob
+import export_jobs
+
+
+@pytest.fixture
+def policies(app, insurer_user, make_policy):
+    """Three policies, one of them cancelled"""
+    with app.app_context():
+        insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+        make_policy(insurer)
+        make_policy(insurer)
+        make_policy(insurer, status='Cancelled')
+
+
+class TestExportJobs:
+    """Test queuing, running and downloading export jobs"""
+
+    def test_identical_jobs_deduplicated(self, app, policies):
+        """Test an identical in-flight export is reused, not queued twice"""
+        with app.app_context():
+            first = export_jobs.submit_export('policies', {'status': 'Active', 'company_id': ''}, 'admin_1')
+            second = export_jobs.submit_export('policies', {'status': 'Active'}, 'admin_2')
+            other = export_jobs.submit_export('policies', {'status': 'Cancelled'}, 'admin_1')
+            assert second.id == first.id
+            assert other.id != first.id
+            assert ExportJob.query.count() == 2
+
+    def test_stalled_jobs_reaped(self, app, policies):
+        """Test jobs left in flight past the timeout fail instead of absorbing new requests"""
+        with app.app_context():
+            queued = export_jobs.submit_export('policies', {'status': 'Active'}, 'admin_1')
+            running = export_jobs.submit_export('policies', {'status': 'Cancelled'}, 'admin_1')
+            stale = datetime.utcnow() - timedelta(seconds=app.config['EXPORT_JOB_TIMEOUT'] + 60)
+            queued.created_at = stale
+            running.status, running.started_at = 'running', stale
+            db.session.commit()
+
+            again = export_jobs.submit_export('policies', {'status': 'Active'}, 'admin_2')
+            assert again.id != queued.id
+            db.session.expire_all()
+            assert db.session.get(ExportJob, queued.id).status == 'failed'
+            assert db.session.get(ExportJob, running.id).error.startswith('Timed out')
+
+            result = app.test_cli_runner().invoke(args=['run-export-jobs'])
+            assert 'Ran 1 export jobs' in result.output
+
+    def test_one_in_flight_job_per_fingerprint(self, app, policies):
+        """Test the database refuses a second in-flight copy of a job"""
+        with app.app_context():
+            job = export_jobs.submit_export('policies', {'status': 'Active'}, 'admin_1')
+            db.session.add(ExportJob(kind=job.kind, params=job.params, fingerprint=job.fingerprint, requested_by='admin_2'))
+            with pytest.raises(IntegrityError):
+                db.session.commit()
+            db.session.rollback()
+
+    def test_run_job_writes_artifact(self, app, policies):
+        """Test the runner writes the CSV and records progress"""
+        with app.app_context():
+            job = export_jobs.submit_export('policies', {'status': 'Active'}, 'admin_1')
+            assert export_jobs.run_queued_jobs() == 1
+            # Jobs run in their own app context and session
+            db.session.expire_all()
+
+            job = db.session.get(ExportJob, job.id)
+            assert job.status == 'completed'
+            assert job.rows_written == 2
+            with open(os.path.join(export_jobs.export_dir(), job.file_path)) as artifact:
+                assert len(artifact.read().splitlines()) == 3
+
+            # Completed jobs no longer deduplicate
+            again = export_jobs.submit_export('policies', {'status': 'Active'}, 'admin_1')
+            assert again.id != job.id
+
+    def test_parquet_job(self, app, policies):
+        """Test jobs write columnar artifacts when asked for them"""
+        pytest.importorskip('pyarrow')
+        with app.app_context():
+            job = export_jobs.submit_export('policies', {'format': 'parquet'}, 'admin_1')
+            export_jobs.run_queued_jobs()
+            db.session.expire_all()
+
+            job = db.session.get(ExportJob, job.id)
+            assert job.status == 'completed'
+            assert job.file_path.endswith('.parquet')
+            assert job.rows_written == 3
+
+    def test_failed_job(self, app, policies):
+        """Test a failing export is marked failed with its error"""
+        with app.app_context():
+            job = export_jobs.submit_export('policies', {'start_date': '2024-01-01'}, 'admin_1')
+            # Unknown kinds can only come from a corrupted row
+            job.kind = 'missing'
+            db.session.commit()
+            export_jobs.run_queued_jobs()
+            db.session.expire_all()
+
+            job = db.session.get(ExportJob, job.id)
+            assert job.status == 'failed'
+            assert job.error
+
+    def test_download_token(self, app, policies):
+        """Test download tokens resolve only for completed jobs"""
+        with app.test_request_context():
+            job = export_jobs.submit_export('policies', {}, 'admin_1')
+            token = export_jobs.download_token(job)
+            assert export_jobs.job_for_token(token) is None
+
+            export_jobs.run_queued_jobs()
+            db.session.expire_all()
+            assert export_jobs.job_for_token(token).id == job.id
+            assert export_jobs.job_for_token(token + 'x') is None
+            assert export_jobs.job_status(db.session.get(ExportJob, job.id))['download_url'].startswith('/exports/')
+
+    def test_export_job_routes(self, app, authenticated_admin, policies):
+        """Test queuing, polling and downloading through the routes"""
+        response = authenticated_admin.post('/export-jobs', data={'kind': 'policies', 'status': 'Active'})
+        assert response.status_code == 202
+        job_id = response.get_json()['job']['id']
+
+        with app.app_context():
+            export_jobs.run_queued_jobs()
+
+        status = authenticated_admin.get(f'/export-jobs/{job_id}').get_json()['job']
+        assert status['status'] == 'completed'
+        download = authenticated_admin.get(status['download_url'])
+        assert download.status_code == 200
+        assert 'attachment' in download.headers['Content-Disposition']
+        assert len(download.get_data(as_text=True).splitlines()) == 3
+
+        assert authenticated_admin.post('/export-jobs', data={'kind': 'regulator_report'}).status_code == 403
@@ -0,0 +1,187 @@
+"""
+Unit tests for the streaming CSV exports
+Checks export rows, filters and batched CSV output
+"""
+import csv
+from io import StringIO
+
+import pytest
+from extension import db
+from models import Insurer, InsuranceCompany
+import exports
+
+
+@pytest.fixture
+def book(app, insurer_user, make_policy, make_claim):
+    """Two companies, a handful of policies and claims"""
+    with app.app_context():
+        insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+        other_company = InsuranceCompany(name='Other Insurance Co', is_active=True)
+        db.session.add(other_company)
+        db.session.commit()
+        other_insurer = Insurer(
+            username='otherinsurer',
+            email='other@test.com',
+            password='x',
+            insurance_company_id=other_company.id,
+            is_approved=True
+        )
+        db.session.add(other_insurer)
+        db.session.commit()
+
+        p1 = make_policy(insurer, premium_amount=1000.0, email_address='holder@test.com')
+        make_policy(insurer, premium_amount=2000.0, status='Cancelled')
+        p3 = make_policy(other_insurer, premium_amount=500.0, email_address='holder@test.com')
+
+        make_claim(p1, status='Approved')
+        make_claim(p3, status='Rejected', accident_description='x' * 150)
+        return insurer.insurance_company_id, other_company.id
+
+
+def read_csv(export):
+    return list(csv.reader(StringIO(''.join(exports.stream_csv(export)))))
+
+
+class TestExports:
+    """Test export rows and CSV streaming"""
+
+    def test_policies_filters(self, app, book):
+        """Test the admin policy export applies status and company filters"""
+        with app.app_context():
+            export = exports.policies({'status': 'Active'})
+            rows = list(export.csv_rows())
+            assert export.header[0] == 'Policy Number'
+            assert [row[2] for row in rows] == [InsuranceCompany.query.get(book[0]).name, 'Other Insurance Co']
+            assert rows[0][4] == '1000.00'
+
+            export = exports.policies({'company_id': str(book[1]), 'start_date': 'bad'})
+            assert len(list(export.records)) == 1
+
+    def test_claims_truncates_description(self, app, book):
+        """Test the admin claim export joins policy columns and truncates descriptions"""
+        with app.app_context():
+            rows = list(exports.claims({'status': 'Rejected'}).csv_rows())
+            assert len(rows) == 1
+            assert rows[0][2] == 'holder@test.com'
+            assert rows[0][3] == 'Other Insurance Co'
+            assert len(rows[0][6]) == 100
+
+    def test_customer_report_scoped_to_email(self, app, book):
+        """Test customer exports only include the customer's policies"""
+        with app.app_context():
+            export = exports.customer_report('policies', 'holder@test.com')
+            assert len(list(export.records)) == 2
+            summary = dict(exports.customer_report('summary', 'holder@test.com').csv_rows())
+            assert summary['Total Policies'] == '2'
+            assert summary['Total Premium Paid (KES)'] == '1500.00'
+            assert summary['Approved Claims'] == '1'
+            assert summary['Rejected Claims'] == '1'
+
+    def test_regulator_companies(self, app, book):
+        """Test compliance scores on the regulator company export"""
+        with app.app_context():
+            scores = {row[0]: row[-1] for row in exports.regulator_report('companies').csv_rows()}
+            assert scores[InsuranceCompany.query.get(book[0]).name] == '100.0'
+            assert scores['Other Insurance Co'] == '40.0'
+
+    def test_stream_csv_batches(self, app, book, monkeypatch):
+        """Test CSV output is yielded in EXPORT_BATCH_SIZE row chunks"""
+        monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 1)
+        with app.app_context():
+            chunks = list(exports.stream_csv(exports.admin_report('policies')))
+            assert len(chunks) == 4
+            parsed = read_csv(exports.admin_report('policies'))
+            assert parsed[0][2] == 'Policyholder'
+            assert len(parsed) == 4
+
+    def test_export_endpoint_streams(self, app, authenticated_admin, book):
+        """Test the export route returns a streamed CSV attachment"""
+        response = authenticated_admin.get('/admin/export-policies-csv?status=Active')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert 'attachment; filename=clearview_policies_' in response.headers['Content-Disposition']
+        assert len(list(csv.reader(StringIO(response.get_data(as_text=True))))) == 3
+
+    def test_parquet_export_typed(self, app, book):
+        """Test Parquet exports keep typed columns and match the CSV rows"""
+        pa = pytest.importorskip('pyarrow')
+        import pyarrow.parquet as pq
+        with app.app_context():
+            data = b''.join(exports.stream_export(exports.policies({}), 'parquet'))
+            table = pq.read_table(pa.BufferReader(data))
+            assert table.num_rows == 3
+            assert table.schema.field('Premium (KES)').type == pa.float64()
+            assert table.schema.field('Start Date').type == pa.date32()
+            assert table.column('Premium (KES)').to_pylist() == [1000.0, 2000.0, 500.0]
+
+    def test_arrow_export_row_groups(self, app, book, monkeypatch):
+        """Test Arrow IPC exports write one record batch per EXPORT_BATCH_SIZE rows"""
+        pa = pytest.importorskip('pyarrow')
+        monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 2)
+        with app.app_context():
+            data = b''.join(exports.stream_export(exports.regulator_report('claims'), 'arrow'))
+            reader = pa.ipc.open_file(pa.BufferReader(data))
+            assert reader.num_record_batches == 1
+            assert reader.read_all().num_rows == 2
+
+    def test_unknown_format_falls_back_to_csv(self, app):
+        """Test unknown formats are exported as CSV"""
+        assert exports.requested_format({'format': 'xml'}) == 'csv'
+
+
+class TestDeltaExports:
+    """Test the since-cursor delta feed"""
+
+    def test_delta_feed(self, app, book, monkeypatch):
+        """Test a delta returns only rows changed after the cursor"""
+        from datetime import datetime, timedelta
+        from models import Policy
+        monkeypatch.setitem(app.config, 'EXPORT_DELTA_LAG', 0)
+        with app.app_context():
+            export = exports.policies({'since': ''})
+            assert len(list(export.records)) == 3
+            cursor = export.next_cursor
+
+            export = exports.policies({'since': cursor})
+            assert list(export.records) == []
+            assert export.next_cursor == cursor
+
+            policy = Policy.query.order_by(Policy.id).first()
+            policy.status = 'Expired'
+            db.session.commit()
+            assert policy.updated_at > exports.decode_cursor(cursor)[0] - timedelta(seconds=1)
+
+            export = exports.policies({'since': cursor})
+            rows = list(export.csv_rows())
+            assert [row[0] for row in rows] == [policy.policy_number]
+            assert export.next_cursor != cursor
+
+    def test_delta_lag(self, app, book, monkeypatch):
+        """Test rows changed inside the lag window wait for the next pull"""
+        monkeypatch.setitem(app.config, 'EXPORT_DELTA_LAG', 3600)
+        with app.app_context():
+            export = exports.claims({'since': ''})
+            assert list(export.records) == []
+            assert export.next_cursor is None
+
+    def test_no_cursor_is_full_export(self, app, book):
+        """Test exports without 'since' are unchanged and carry no cursor"""
+        with app.app_context():
+            export = exports.claims({})
+            assert len(list(export.records)) == 2
+            assert export.next_cursor is None
+
+    def test_bad_cursor(self, app, book):
+        """Test malformed cursors are rejected"""
+        with app.app_context():
+            with pytest.raises(ValueError):
+                exports.policies({'since': 'yesterday'})
+
+    def test_cursor_header(self, app, authenticated_admin, book, monkeypatch):
+        """Test the delta cursor is returned in X-Next-Cursor"""
+        monkeypatch.setitem(app.config, 'EXPORT_DELTA_LAG', 0)
+        response = authenticated_admin.get('/admin/export-claims-csv?since=')
+        assert response.status_code == 200
+        assert response.headers['X-Next-Cursor']
+        assert len(response.get_data(as_text=True).splitlines()) == 3
+        assert authenticated_admin.get('/admin/export-claims-csv?since=bad').status_code == 400
@@ -0,0 +1,170 @@
+"""
+Unit tests for the bulk policy import
+Checks row validation, the active registration rule, bookkeeping and reports
+"""
+import csv
+import io
+
+import pytest
+from extension import db
+from models import Policy, MetricsRollup, SearchDocument
+import autocomplete
+import imports
+import metrics
+
+
+def policy_row(n, **overrides):
+    row = dict(
+        policy_type='Comprehensive',
+        effective_date='2026-02-01',
+        premium_amount='25000',
+        payment_mode='Mobile Money',
+        insured_name=f'Imported Holder {n}',
+        national_id=f'IMP{n:06d}',
+        kra_pin='',
+        date_of_birth='1985-06-15',
+        phone_number='0711000000',
+        email_address=f'imported{n}@test.com',
+        postal_address='',
+        registration_number=f'kbz {n:03d}x',
+        make_model='Nissan Note',
+        year_of_manufacture='2017',
+        chassis_number=f'CHI{n:06d}',
+        engine_number=f'ENI{n:06d}',
+        body_type='Saloon',
+        color='Blue',
+        seating_capacity='5',
+        use_category='Private',
+        sum_insured='900000',
+        excess='10000',
+        political_violence='yes',
+        windscreen_cover='no',
+        passenger_liability='',
+        road_rescue='1'
+    )
+    row.update(overrides)
+    return row
+
+
+def sheet(rows):
+    """A CSV upload of policy rows"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=list(policy_row(0)))
+    writer.writeheader()
+    writer.writerows(rows)
+    return io.BytesIO(output.getvalue().encode())
+
+
+class TestImportPolicies:
+    """Test rows become policies exactly as the policy form would create them"""
+
+    def test_imports_valid_rows(self, app, insurer):
+        with app.app_context():
+            rows = [policy_row(1), policy_row(2, policy_type='Third-Party Only'), policy_row(3)]
+            result = imports.import_policies(imports.read_rows(sheet(rows), 'csv'), insurer)
+            assert (result.imported, result.errors) == (3, [])
+
+            policies = {p.registration_number: p for p in Policy.query.filter_by(insurance_company_id=insurer.insurance_company_id)}
+            first = policies['KBZ 001X']
+            assert first.policy_number == 'CO-0001'
+            assert policies['KBZ 002X'].policy_number == 'TO-0001'
+            assert policies['KBZ 003X'].policy_number == 'CO-0002'
+            assert first.expiry_date.isoformat() == '2027-02-01'
+            assert first.status == 'Active' and first.created_by == insurer.id
+            assert (first.political_violence, first.windscreen_cover, first.passenger_liability, first.road_rescue) == (True, False, False, True)
+            assert first.kra_pin is None
+
+    def test_bookkeeping_follows_bulk_insert(self, app, insurer):
+        """Test rollups, search and autocomplete see policies the flush never did"""
+        with app.app_context():
+            company_id = insurer.insurance_company_id
+            imports.import_policies(imports.read_rows(sheet([policy_row(1), policy_row(2)]), 'csv'), insurer)
+
+            rollup = MetricsRollup.query.filter_by(scope=metrics.company_scope(company_id)).first()
+            assert rollup.policies_active == 2
+            assert rollup.active_premium == 50000.0
+            policy = Policy.query.filter_by(registration_number='KBZ 001X').first()
+            assert 'imported' in SearchDocument.query.filter_by(kind='policy', entity_id=policy.id).first().content
+            assert [row['id'] for row in autocomplete.suggest_policies(company_id, 'KBZ001')] == [policy.id]
+
+    def test_rejects_invalid_rows(self, app, insurer, make_policy):
+        """Test form errors, repeated and already insured vehicles are reported by row"""
+        with app.app_context():
+            make_policy(insurer, registration_number='KBZ 004X', policy_number='CO-0100')
+            rows = [
+                policy_row(1),
+                policy_row(2, email_address='not-an-email', seating_capacity='0'),
+                policy_row(3, registration_number='KBZ 001X'),
+                policy_row(4),
+                policy_row(5, body_type='Hovercraft'),
+            ]
+            result = imports.import_policies(imports.read_rows(sheet(rows), 'csv'), insurer, batch_size=2)
+            assert result.imported == 1
+            errors = {row: message for row, _, message in result.errors}
+            assert sorted(errors) == [3, 4, 5, 6]
+            assert 'Email Address' in errors[3] and 'Seating Capacity' in errors[3]
+            assert errors[4] == 'Registration number appears more than once in the file'
+            assert errors[5] == 'Registration number is already on active policy CO-0100'
+            assert 'Body Type' in errors[6]
+
+            output = io.StringIO()
+            imports.write_error_report(result, output)
+            report = list(csv.reader(io.StringIO(output.getvalue())))
+            assert report[0] == imports.ERROR_HEADER
+            assert report[2][:2] == ['4', 'KBZ 001X']
+
+    def test_statements_per_batch(self, app, insurer, query_budget):
+        """Test a batch costs a fixed number of statements, not one per row"""
+        rows = [policy_row(n) for n in range(1, 201)]
+        with app.app_context():
+            with query_budget(40) as statements:
+                result = imports.import_policies(imports.read_rows(sheet(rows), 'csv'), insurer, batch_size=100)
+            assert result.imported == 200
+            assert sum(statement.startswith('INSERT INTO policy ') for statement in statements) <= 2
+
+    def test_excel_sheet(self, app, insurer):
+        openpyxl = pytest.importorskip('openpyxl')
+        from datetime import date
+        workbook = openpyxl.Workbook()
+        row = policy_row(1, effective_date=date(2026, 2, 1), year_of_manufacture=2017.0, premium_amount=25000.5)
+        workbook.active.append([name.replace('_', ' ').title() for name in row])
+        workbook.active.append(list(row.values()))
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+
+        with app.app_context():
+            result = imports.import_policies(imports.read_rows(upload, 'xlsx'), insurer)
+            assert (result.imported, result.errors) == (1, [])
+            assert Policy.query.filter_by(registration_number='KBZ 001X').first().premium_amount == 25000.5
+
+
+class TestImportEndpoints:
+    """Test the upload page, the error report link and the CLI command"""
+
+    def test_upload_and_download_report(self, app, authenticated_insurer, insurer):
+        response = authenticated_insurer.post('/insurer/import-policies', data={
+            'file': (sheet([policy_row(1), policy_row(2, premium_amount='lots')]), 'book.csv')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        assert b'Imported 1 policies. 1 rows were rejected.' in response.data
+
+        link = response.data.split(b'/insurer/import-policies/errors/')[1].split(b'"')[0].decode()
+        report = authenticated_insurer.get(f'/insurer/import-policies/errors/{link}')
+        assert report.status_code == 200
+        assert b'Premium Amount' in report.data
+        assert authenticated_insurer.get(f'/insurer/import-policies/errors/{link}x').status_code == 404
+
+    def test_rejects_other_files(self, authenticated_insurer, insurer):
+        response = authenticated_insurer.post('/insurer/import-policies', data={
+            'file': (io.BytesIO(b'policies'), 'book.pdf')
+        }, content_type='multipart/form-data')
+        assert b'Please upload a CSV or Excel' in response.data
+
+    def test_cli_command(self, app, runner, insurer, tmp_path):
+        path = tmp_path / 'book.csv'
+        path.write_bytes(sheet([policy_row(1), policy_row(1)]).getvalue())
+        errors = tmp_path / 'errors.csv'
+        result = runner.invoke(args=['import-policies', str(path), '--insurer', 'insurer@test.com', '--errors', str(errors)])
+        assert 'Imported 1 of 2 rows' in result.output
+        assert 'appears more than once' in errors.read_text()
@@ -0,0 +1,59 @@
+"""
+Unit tests for the hot query indexes
+EXPLAINs each hot query shape and checks it is answered from its index
+"""
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from extension import db
+from models import (Policy, Claim, Quote, CustomerPolicyRequest, PolicyCancellationRequest,
+                    PolicyRenewalRequest)
+
+
+def plan(query):
+    """SQLite's query plan for a query, as one string"""
+    sql = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all()
+    return ' | '.join(row[-1] for row in rows)
+
+
+HOT_QUERIES = [
+    (lambda: Policy.query.filter_by(insurance_company_id=1, status='Active'), 'ix_policy_company_status'),
+    (lambda: Policy.query.filter_by(email_address='holder@test.com'), 'ix_policy_email_address'),
+    (lambda: Policy.query.filter_by(registration_number='KAA001A', status='Active'), 'ix_policy_registration_status'),
+    (lambda: Policy.query.filter_by(registration_key='kaa001a'), 'ix_policy_registration_key'),
+    (lambda: Policy.query.filter(Policy.status == 'Active', Policy.expiry_date < date(2026, 1, 1)),
+     'ix_policy_status_expiry_date'),
+    (lambda: Claim.query.filter_by(insurance_company_id=1, status='Pending'), 'ix_claim_company_status'),
+    (lambda: Claim.query.filter(Claim.policy_id.in_([1, 2, 3])), 'ix_claim_policy_id'),
+    (lambda: CustomerPolicyRequest.query.filter_by(customer_id=1, policy_id=1, status='pending'),
+     'ix_customer_policy_request_customer_policy_status'),
+    (lambda: PolicyCancellationRequest.query.filter_by(customer_id=1, policy_id=1, status='pending'),
+     'ix_policy_cancellation_request_customer_policy_status'),
+    (lambda: PolicyRenewalRequest.query.filter_by(customer_id=1, status='pending'),
+     'ix_policy_renewal_request_customer_policy_status'),
+    (lambda: Quote.query.filter(Quote.status == 'Sent', Quote.valid_until < datetime(2026, 1, 1)),
+     'ix_quote_status_valid_until'),
+]
+
+
+class TestHotQueryIndexes:
+    """Test the hot query shapes are index lookups"""
+
+    @pytest.mark.parametrize('query, index', HOT_QUERIES, ids=[index for _, index in HOT_QUERIES])
+    def test_uses_index(self, app, query, index):
+        """Test the query searches its index rather than scanning the table"""
+        with app.app_context():
+            explained = plan(query())
+            assert f'INDEX {index} ' in explained
+            assert 'SCAN' not in explained
+
+    def test_one_active_policy_per_registration(self):
+        """Test the Postgres partial unique index covers active policies only"""
+        index = next(index for index in Policy.__table__.indexes if index.name == 'ux_policy_active_registration')
+        ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        assert ddl.startswith('CREATE UNIQUE INDEX ux_policy_active_registration ON policy (registration_number)')
+        assert "WHERE status = 'Active'" in ddl
@@ -0,0 +1,83 @@
+"""
+Unit tests for the loader profiles
+Checks list views stay within a fixed query budget however many rows they show
+"""
+import pytest
+from extension import db
+from models import Insurer, InsuranceCompany, Customer, Policy, Claim, CustomerPolicyRequest, PolicyCancellationRequest
+import loaders
+
+ROWS = 12
+# Queries a list view may run, whatever ROWS is; one lazy load per row breaks it
+BUDGET = 8
+
+
+@pytest.fixture
+def book(app, insurer_user, make_policy, make_claim):
+    """A company with ROWS policies, each with a claim and customer requests"""
+    with app.app_context():
+        insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+        customer = Customer(username='requester', email='requester@test.com', password='x')
+        db.session.add(customer)
+        for n in range(ROWS):
+            policy = make_policy(insurer)
+            make_claim(policy)
+            db.session.add(CustomerPolicyRequest(customer_id=customer.id, policy_id=policy.id))
+            db.session.add(PolicyCancellationRequest(customer_id=customer.id, policy_id=policy.id, cancellation_reason='Sold'))
+        db.session.commit()
+
+
+class TestProfiles:
+    """Test profiles load what their templates touch"""
+
+    def test_every_profile_applies(self, app, book):
+        """Test each profile is valid against its model"""
+        models = {
+            'policy_list': 'Policy', 'claim_list': 'Claim', 'insurer_list': 'Insurer', 'regulator_list': 'Regulator',
+            'company_list': 'InsuranceCompany', 'company_scorecard': 'InsuranceCompany',
+            'insurer_requests': 'InsurerRequest', 'regulator_requests': 'RegulatorRequest',
+            'access_requests': 'CustomerPolicyRequest', 'cancellation_requests': 'PolicyCancellationRequest',
+            'renewal_requests': 'PolicyRenewalRequest'
+        }
+        import models as model_module
+        assert set(models) == set(loaders.PROFILES)
+        with app.app_context():
+            for profile, model in models.items():
+                loaders.load(getattr(model_module, model).query, profile).limit(1).all()
+
+    def test_claim_list_needs_no_lazy_loads(self, app, book, query_budget):
+        """Test a claim list's policies and companies come with it"""
+        with app.app_context():
+            with query_budget(1):
+                claims = loaders.load(Claim.query, 'claim_list').all()
+                assert len(claims) == ROWS
+                for claim in claims:
+                    assert claim.policy.insurance_company.name
+                    assert claim.insurance_company.name
+
+    def test_company_scorecard_counts_in_one_query(self, app, book, query_budget):
+        """Test scorecard counts come with the companies, without loading the rows"""
+        with app.app_context():
+            company_id = Insurer.query.filter_by(email='insurer@test.com').first().insurance_company_id
+            with query_budget(1) as statements:
+                company = loaders.load(InsuranceCompany.query.filter_by(id=company_id), 'company_scorecard').one()
+                assert (company.policy_count, company.claim_count) == (ROWS, ROWS)
+            assert 'policy.policy_number' not in statements[0]
+
+
+class TestViewBudgets:
+    """Test list views issue a fixed number of queries"""
+
+    @pytest.mark.parametrize('url', ['/admin/view-claims', '/admin/view-policies', '/admin/search?q=tp',
+                                     '/admin/export-claims-csv', '/admin/export-policies-csv'])
+    def test_admin_lists(self, authenticated_admin, book, query_budget, url):
+        """Test admin lists, searches and exports"""
+        with query_budget(BUDGET):
+            assert authenticated_admin.get(url).status_code == 200
+
+    @pytest.mark.parametrize('url', ['/insurer/claims', '/insurer/manage-policies', '/insurer/dashboard',
+                                     '/insurer/customer-requests'])
+    def test_insurer_lists(self, authenticated_insurer, book, query_budget, url):
+        """Test insurer lists and dashboard"""
+        with query_budget(BUDGET):
+            assert authenticated_insurer.get(url).status_code == 200
@@ -0,0 +1,86 @@
+"""
+Unit tests for the incrementally maintained metrics rollup
+Checks flush-time counter updates against a full reconcile
+"""
+import pytest
+from extension import db
+from models import Insurer, Customer, MetricsRollup, PolicyCancellationRequest
+import metrics
+
+
+COUNTERS = metrics.COUNTER_COLUMNS
+
+
+def snapshot(company_id=None):
+    scope = metrics.GLOBAL_SCOPE if company_id is None else metrics.company_scope(company_id)
+    row = MetricsRollup.query.filter_by(scope=scope).first()
+    return {name: getattr(row, name) for name in COUNTERS}
+
+
+class TestMetricsRollup:
+    """Test rollup maintenance on the write paths"""
+
+    def test_policy_and_claim_changes_update_rollup(self, app, insurer_user, make_policy, make_claim):
+        """Test inserts and status changes move the counters"""
+        with app.app_context():
+            insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+            company_id = insurer.insurance_company_id
+            policy = make_policy(insurer, premium_amount=1500.0)
+            make_policy(insurer, premium_amount=500.0)
+            claim = make_claim(policy)
+
+            company = snapshot(company_id)
+            assert company['policies_total'] == 2
+            assert company['policies_active'] == 2
+            assert company['active_premium'] == 2000.0
+            assert company['claims_pending'] == 1
+
+            policy.status = 'Cancelled'
+            claim.status = 'Approved'
+            db.session.commit()
+
+            company = snapshot(company_id)
+            assert company['policies_active'] == 1
+            assert company['policies_cancelled'] == 1
+            assert company['active_premium'] == 500.0
+            assert company['claims_pending'] == 0
+            assert company['claims_approved'] == 1
+            assert snapshot() == company
+
+    def test_customer_requests_update_rollup(self, app, insurer_user, customer_user, make_policy):
+        """Test pending request counters follow the request status"""
+        with app.app_context():
+            insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+            customer = Customer.query.filter_by(email='customer@test.com').first()
+            policy = make_policy(insurer)
+            request = PolicyCancellationRequest(
+                customer_id=customer.id,
+                policy_id=policy.id,
+                cancellation_reason='Sold the vehicle'
+            )
+            db.session.add(request)
+            db.session.commit()
+            assert snapshot(policy.insurance_company_id)['pending_cancellation_requests'] == 1
+
+            request.status = 'rejected'
+            db.session.commit()
+            assert snapshot(policy.insurance_company_id)['pending_cancellation_requests'] == 0
+
+    def test_reconcile_matches_incremental(self, app, runner, insurer_user, make_policy, make_claim):
+        """Test the reconcile command rebuilds identical counters"""
+        with app.app_context():
+            insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+            make_claim(make_policy(insurer), status='Rejected')
+            make_policy(insurer, status='Expired')
+            company_id = insurer.insurance_company_id
+            before = snapshot(company_id)
+
+            MetricsRollup.query.update({'policies_total': 0, 'claims_total': 0})
+            db.session.commit()
+
+        result = runner.invoke(args=['reconcile-metrics'])
+        assert 'Reconciled' in result.output
+
+        with app.app_context():
+            assert snapshot(company_id) == before
+            assert snapshot()['policies_total'] == 2
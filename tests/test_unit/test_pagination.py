@@ -0,0 +1,124 @@
+"""
+Unit tests for keyset pagination
+Checks page boundaries, cursors and the paginated insurer lists
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from extension import db
+from models import Insurer, Policy, Claim
+import pagination
+
+
+@pytest.fixture
+def book(app, insurer_user, make_policy):
+    """Seven policies entered a minute apart, two sharing a timestamp"""
+    with app.app_context():
+        insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+        start = datetime(2024, 1, 1, 9, 0)
+        for n in range(7):
+            make_policy(insurer, date_entered=start + timedelta(minutes=min(n, 5)))
+        return insurer.insurance_company_id
+
+
+def numbers(page):
+    return [policy.policy_number for policy in page.items]
+
+
+class TestKeysetPage:
+    """Test paging forwards and back through a list"""
+
+    def test_forward_and_back(self, app, book):
+        """Test every row is seen exactly once in each direction"""
+        with app.app_context():
+            query = Policy.query.filter_by(insurance_company_id=book)
+
+            def page(**args):
+                return pagination.keyset_page(query, Policy.date_entered, Policy.id, args, per_page=3)
+
+            first = page()
+            assert numbers(first) == ['TP-00007', 'TP-00006', 'TP-00005']
+            assert not first.has_prev
+
+            second = page(after=first.next_cursor)
+            assert numbers(second) == ['TP-00004', 'TP-00003', 'TP-00002']
+            third = page(after=second.next_cursor)
+            assert numbers(third) == ['TP-00001']
+            assert not third.has_next
+
+            assert numbers(page(before=third.prev_cursor)) == numbers(second)
+            back = page(before=second.prev_cursor)
+            assert numbers(back) == numbers(first)
+            assert not back.has_prev
+
+    def test_bad_cursor(self, app, book):
+        """Test malformed cursors raise ValueError"""
+        with app.app_context():
+            with pytest.raises(ValueError):
+                pagination.keyset_page(Policy.query, Policy.date_entered, Policy.id, {'after': 'nonsense'})
+
+
+class TestPaginatedLists:
+    """Test the insurer lists page through their filters"""
+
+    def test_manage_policies(self, app, monkeypatch, authenticated_insurer, book):
+        """Test pages keep the filters and the stats cover the whole book"""
+        monkeypatch.setitem(app.config, 'PAGE_SIZE', 2)
+        with app.app_context():
+            Policy.query.filter_by(policy_number='TP-00006').one().status = 'Cancelled'
+            db.session.commit()
+
+        body = authenticated_insurer.get('/insurer/manage-policies?status=active').get_data(as_text=True)
+        assert 'TP-00007' in body and 'TP-00005' in body
+        assert 'TP-00006' not in body
+        assert 'status=active' in body and 'after=' in body
+
+        with app.app_context():
+            cursor = pagination.encode_cursor(*db.session.query(Policy.date_entered, Policy.id).filter_by(policy_number='TP-00005').one())
+        body = authenticated_insurer.get(f'/insurer/manage-policies?status=active&after={cursor}').get_data(as_text=True)
+        assert 'TP-00004' in body and 'TP-00003' in body
+        assert 'TP-00005' not in body
+
+        assert authenticated_insurer.get('/insurer/manage-policies?after=bad').status_code == 400
+
+    def test_manage_claims(self, app, monkeypatch, authenticated_insurer, book, make_claim):
+        """Test the claims list is paged"""
+        monkeypatch.setitem(app.config, 'PAGE_SIZE', 2)
+        with app.app_context():
+            for policy in Policy.query.order_by(Policy.id).limit(3):
+                make_claim(policy)
+
+        body = authenticated_insurer.get('/insurer/claims').get_data(as_text=True)
+        assert 'TC-00003' in body and 'TC-00002' in body
+        assert 'TC-00001' not in body
+        assert 'after=' in body
+
+    def test_admin_view_policies(self, app, monkeypatch, authenticated_admin, book):
+        """Test the admin list pages while the stats cover every match"""
+        monkeypatch.setitem(app.config, 'PAGE_SIZE', 3)
+        with app.app_context():
+            Policy.query.filter_by(policy_number='TP-00001').one().status = 'Expired'
+            db.session.commit()
+
+        response = authenticated_admin.get(f'/admin/view-policies?company_id={book}')
+        body = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert 'TP-00007' in body and 'TP-00005' in body
+        assert 'TP-00004' not in body
+        assert 'Policies List (7 results)' in body
+        assert '7,000.00' in body
+        assert f'company_id={book}' in body and 'after=' in body
+
+    def test_admin_view_claims(self, app, monkeypatch, authenticated_admin, book, make_claim):
+        """Test the admin claim list pages with filters applied"""
+        monkeypatch.setitem(app.config, 'PAGE_SIZE', 1)
+        with app.app_context():
+            policies = Policy.query.order_by(Policy.id).limit(3).all()
+            make_claim(policies[0], status='Approved')
+            make_claim(policies[1], status='Approved')
+            make_claim(policies[2])
+
+        body = authenticated_admin.get('/admin/view-claims?status=Approved').get_data(as_text=True)
+        assert 'Claims List (2 results)' in body
+        assert 'TC-00002' in body and 'TC-00001' not in body
+        assert 'status=Approved' in body and 'after=' in body
@@ -0,0 +1,106 @@
+"""
+Unit tests for per-request SQL statistics
+Checks query counting, repeated statement detection, headers and the log line
+"""
+import json
+import logging
+
+import pytest
+from flask import request
+from sqlalchemy.exc import OperationalError
+
+from extension import db
+from models import Insurer, Policy
+import query_stats
+
+
+def db_query_lines(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.getMessage().startswith('{"event": "db_queries"')]
+
+
+@pytest.fixture
+def book(app, insurer_user, make_policy):
+    with app.app_context():
+        insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+        return [make_policy(insurer).id for _ in range(6)]
+
+
+class TestRequestStats:
+    """Test statements are counted against the current request"""
+
+    def test_repeated_statements_flagged(self, app, book):
+        """Test a statement run once per row is reported as repeated"""
+        with app.test_request_context('/loop'):
+            request.db_stats = query_stats.RequestStats()
+            Policy.query.filter_by(status='Active').count()
+            for policy_id in book:
+                Policy.query.filter_by(id=policy_id).first()
+
+            stats = query_stats.current_stats()
+            assert stats.queries == 7
+            assert stats.seconds > 0
+            line = query_stats.log_line(stats, 200)
+            assert line['path'] == '/loop' and line['queries'] == 7
+            assert [entry['count'] for entry in line['repeated']] == [6]
+            assert line['repeated'][0]['statement'].startswith('SELECT policy.id')
+
+    def test_failed_statement_leaves_connection_clean(self, app, book):
+        """Test a statement that raises keeps no timing state on the pooled connection"""
+        with app.test_request_context('/broken'):
+            request.db_stats = query_stats.RequestStats()
+            connection = db.session.connection()
+            with pytest.raises(OperationalError):
+                connection.execute(db.text('SELECT * FROM no_such_table'))
+            db.session.rollback()
+            Policy.query.count()
+
+            assert query_stats.current_stats().queries == 1
+            assert 'query_start' not in db.session.connection().info
+
+    def test_no_stats_outside_requests(self, app, book):
+        """Test queries outside a counted request are ignored"""
+        with app.app_context():
+            Policy.query.count()
+        assert query_stats.current_stats() is None
+
+
+class TestRequestHooks:
+    """Test the response headers and log line"""
+
+    def test_debug_headers(self, app, monkeypatch, authenticated_admin, book):
+        """Test debug responses carry the query count and time"""
+        monkeypatch.setattr(app, 'debug', True)
+        response = authenticated_admin.get('/admin/view-policies')
+        assert int(response.headers['X-DB-Queries']) > 0
+        assert float(response.headers['X-DB-Time']) >= 0
+
+    def test_no_headers_outside_debug(self, app, authenticated_admin, book):
+        """Test production responses do not expose query counts"""
+        response = authenticated_admin.get('/admin/view-policies')
+        assert 'X-DB-Queries' not in response.headers
+
+    def test_log_line_per_request(self, app, caplog, authenticated_admin, book):
+        """Test each request logs one JSON line with its counts"""
+        caplog.set_level(logging.INFO, logger=app.logger.name)
+        # The line is written when the server closes the response
+        authenticated_admin.get('/admin/view-policies').close()
+        lines = db_query_lines(caplog)
+        assert len(lines) == 1
+        assert lines[0]['endpoint'] == 'admin_view_policies'
+        assert lines[0]['status'] == 200
+        assert lines[0]['queries'] > 0
+        assert lines[0]['repeated'] == []
+
+    def test_streamed_export_logged_once(self, app, caplog, authenticated_admin, book):
+        """Test a streamed response logs one line including the queries run while streaming"""
+        caplog.set_level(logging.INFO, logger=app.logger.name)
+        response = authenticated_admin.get('/admin/export-policies-csv')
+        assert len(response.get_data(as_text=True).splitlines()) == 7
+        assert db_query_lines(caplog) == []
+        response.close()
+        lines = db_query_lines(caplog)
+        assert len(lines) == 1
+        assert lines[0]['endpoint'] == 'admin_export_policies_csv'
+        assert lines[0]['status'] == 200
+        assert lines[0]['queries'] > 0
@@ -0,0 +1,153 @@
+"""
+Unit tests for read-replica routing
+Uses a second SQLite file as the replica
+"""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+
+from extension import db
+from models import Customer, Insurer, InsuranceCompany
+import metrics
+import replica
+import reports
+
+
+@pytest.fixture
+def replica_engine(app, monkeypatch):
+    """A replica database holding rows the primary does not"""
+    fd, path = tempfile.mkstemp()
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(InsuranceCompany.__table__.insert().values(name='Replica Co', is_active=True))
+        connection.execute(Customer.__table__.insert().values(
+            username='replicacustomer', email='replica@test.com', password='x', is_active=True
+        ))
+    with app.app_context():
+        monkeypatch.setitem(db.engines, replica.REPLICA_BIND, engine)
+    yield engine
+    engine.dispose()
+    os.close(fd)
+    os.unlink(path)
+
+
+@pytest.fixture
+def customer_id(app, customer_user):
+    with app.app_context():
+        return Customer.query.filter_by(email='customer@test.com').one().id
+
+
+def company_names():
+    return [company.name for company in InsuranceCompany.query.order_by(InsuranceCompany.name)]
+
+
+class TestRouting:
+    """Test which engine a query goes to"""
+
+    def test_reads_go_to_replica(self, app, replica_engine):
+        """Test reads inside reading() come from the replica and others from the primary"""
+        with app.test_request_context():
+            assert 'Test Insurance Co' in company_names()
+            db.session.commit()
+            with replica.reading():
+                assert company_names() == ['Replica Co']
+            db.session.commit()
+            assert 'Replica Co' not in company_names()
+
+    def test_writes_stay_on_primary(self, app, replica_engine):
+        """Test flushes go to the primary, and so do reads after them"""
+        with app.test_request_context():
+            with replica.reading():
+                db.session.add(Customer(username='written', email='written@test.com', password='x'))
+                db.session.flush()
+                assert Customer.query.filter_by(username='written').count() == 1
+                db.session.commit()
+                # A new transaction reads the replica again
+                assert Customer.query.filter_by(username='written').count() == 0
+                db.session.commit()
+            assert Customer.query.filter_by(username='written').count() == 1
+
+    def test_dml_and_bare_connections_stay_on_primary(self, app, replica_engine):
+        """Test bulk statements and session.connection() use the primary"""
+        with app.test_request_context():
+            with replica.reading():
+                assert db.session.connection().engine is db.engine
+                db.session.query(InsuranceCompany).update({'is_active': False})
+                db.session.commit()
+            assert InsuranceCompany.query.filter_by(is_active=True).count() == 0
+        with replica_engine.connect() as connection:
+            assert connection.execute(InsuranceCompany.__table__.select().where(
+                InsuranceCompany.is_active == False
+            )).first() is None
+
+    def test_use_primary(self, app, replica_engine):
+        """Test use_primary() ends routing for the rest of the context"""
+        with app.test_request_context():
+            with replica.reading():
+                replica.use_primary()
+                assert 'Replica Co' not in company_names()
+
+    def test_dashboard_miss_computed_on_primary(self, app, replica_engine, insurer_user, make_policy):
+        """Test shared dashboard counters are never cached from the lagging replica"""
+        with app.test_request_context():
+            insurer = Insurer.query.filter_by(email='insurer@test.com').one()
+            make_policy(insurer)
+            company_id = insurer.insurance_company_id
+            with replica.reading():
+                counters = reports.insurer_dashboard_counters(company_id)
+            assert counters['total_policies'] == 1
+
+    def test_new_rollup_read_from_primary(self, app, replica_engine, insurer_user):
+        """Test a rollup row created on the primary is read back from it"""
+        with app.test_request_context():
+            company_id = Insurer.query.filter_by(email='insurer@test.com').one().insurance_company_id
+            db.session.execute(metrics.MetricsRollup.__table__.delete())
+            db.session.commit()
+            with replica.reading():
+                rollup = metrics.get_rollup(company_id)
+            assert rollup is not None
+            assert rollup.insurance_company_id == company_id
+
+
+    def test_new_rollup_leaves_request_session_alone(self, app, replica_engine, insurer_user):
+        """Test creating a missing rollup row neither commits the request's
+        session nor moves its reads off the replica"""
+        with app.test_request_context():
+            company_id = Insurer.query.filter_by(email='insurer@test.com').one().insurance_company_id
+            db.session.execute(metrics.MetricsRollup.__table__.delete())
+            db.session.commit()
+            db.session.add(InsuranceCompany(name='Uncommitted Co', is_active=True))
+            with db.session.no_autoflush, replica.reading():
+                rollup = metrics.get_rollup(company_id)
+                assert replica.routed()
+            assert rollup.insurance_company_id == company_id
+            db.session.rollback()
+            assert InsuranceCompany.query.filter_by(name='Uncommitted Co').first() is None
+
+class TestReplicaViews:
+    """Test routed views and the read-your-writes guard"""
+
+    def test_export_reads_replica_until_user_writes(self, authenticated_admin, customer_id, replica_engine):
+        """Test an export reads the replica, then the primary right after a write"""
+        body = authenticated_admin.get('/admin/export-users-csv').get_data(as_text=True)
+        assert 'replicacustomer' in body
+        assert 'testcustomer' not in body
+
+        authenticated_admin.post(f'/admin/toggle-user/customer/{customer_id}')
+        with authenticated_admin.session_transaction() as session:
+            assert 'primary_until' in session
+
+        body = authenticated_admin.get('/admin/export-users-csv').get_data(as_text=True)
+        assert 'testcustomer' in body
+        assert 'replicacustomer' not in body
+
+    def test_no_replica_configured(self, app, authenticated_admin, customer_id):
+        """Test routed views read the primary and writes set no cookie without a replica"""
+        body = authenticated_admin.get('/admin/export-users-csv').get_data(as_text=True)
+        assert 'testcustomer' in body
+        authenticated_admin.post(f'/admin/toggle-user/customer/{customer_id}')
+        with authenticated_admin.session_transaction() as session:
+            assert 'primary_until' not in session
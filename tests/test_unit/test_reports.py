@@ -0,0 +1,162 @@
+"""
+Unit tests for the set-based reporting queries
+Checks aggregate figures against a small, known data set
+"""
+import pytest
+from extension import db
+from models import Insurer, Customer, InsuranceCompany, Policy, Quote, PolicyCancellationRequest
+import reports
+
+
+@pytest.fixture
+def book(app, insurer_user, make_policy, make_claim):
+    """Two companies with a mix of policy and claim statuses"""
+    with app.app_context():
+        insurer = Insurer.query.filter_by(email='insurer@test.com').first()
+        other_company = InsuranceCompany(name='Other Insurance Co', is_active=True)
+        db.session.add(other_company)
+        db.session.commit()
+        other_insurer = Insurer(
+            username='otherinsurer',
+            email='other@test.com',
+            password='x',
+            insurance_company_id=other_company.id,
+            is_approved=True
+        )
+        db.session.add(other_insurer)
+        db.session.commit()
+
+        p1 = make_policy(insurer, premium_amount=1000.0)
+        make_policy(insurer, premium_amount=2000.0)
+        make_policy(insurer, premium_amount=4000.0, status='Cancelled')
+        p4 = make_policy(other_insurer, premium_amount=500.0)
+        p5 = make_policy(other_insurer, premium_amount=800.0, status='Expired')
+
+        make_claim(p1, status='Approved')
+        make_claim(p4, status='Rejected')
+        make_claim(p5, status='Pending')
+
+        db.session.add(Quote(
+            quote_number='QT-000001',
+            insurance_company_id=insurer.insurance_company_id,
+            created_by=insurer.id,
+            customer_email='q@test.com',
+            vehicle_value=1000000.0,
+            cover_type='Comprehensive',
+            base_premium=50000.0,
+            final_premium=50000.0,
+            status='Converted'
+        ))
+        db.session.commit()
+        return insurer.insurance_company_id, other_company.id
+
+
+class TestReportAggregates:
+    """Test aggregate report helpers"""
+
+    def test_policy_summary(self, app, book):
+        """Test policy counts and active premium"""
+        with app.app_context():
+            summary = reports.policy_summary()
+            assert summary['total'] == 5
+            assert summary['active'] == 3
+            assert summary['expired'] == 1
+            assert summary['cancelled'] == 1
+            assert summary['active_premium'] == 3500.0
+
+            company_summary = reports.policy_summary(book[0])
+            assert company_summary['total'] == 3
+            assert company_summary['active_premium'] == 3000.0
+
+            filtered = reports.policy_summary(query=Policy.query.filter(Policy.status != 'Active'))
+            assert filtered['total'] == 2
+            assert filtered['active'] == 0
+            assert filtered['total_premium'] == summary['total_premium'] - summary['active_premium']
+
+    def test_claim_and_quote_summary(self, app, book):
+        """Test claim status counts and quote conversion"""
+        with app.app_context():
+            claims = reports.claim_summary()
+            assert claims['total'] == 3
+            assert claims['approved'] == 1
+            assert claims['rejected'] == 1
+            assert claims['pending'] == 1
+
+            quotes = reports.quote_summary()
+            assert quotes['total'] == 1
+            assert quotes['conversion_rate'] == 100
+
+    def test_company_rankings(self, app, book):
+        """Test rankings are ordered by active policies"""
+        with app.app_context():
+            rankings = reports.company_rankings()
+            assert [r['id'] for r in rankings] == [book[0], book[1]]
+            first, second = rankings
+            assert first['active_policies'] == 2
+            assert first['total_premium'] == 3000.0
+            assert first['approved_claims'] == 1
+            assert first['staff_count'] == 1
+            assert second['total_claims'] == 2
+            assert second['rejected_claims'] == 1
+
+    def test_company_scorecard(self, app, book):
+        """Test compliance ranking and the top-N limit"""
+        with app.app_context():
+            scorecard = reports.company_scorecard()
+            assert [row['id'] for row in scorecard] == [book[0], book[1]]
+            assert scorecard[0]['compliance_score'] == 100.0
+            assert scorecard[0]['active_policies'] == 2
+            assert scorecard[1]['compliance_score'] == 0.0
+            assert scorecard[1]['total_claims'] == 2
+            assert len(reports.company_scorecard(limit=1)) == 1
+
+    def test_recent_issues(self, app, book):
+        """Test the issue feed only lists problem claims"""
+        with app.app_context():
+            issues = reports.recent_issues()
+            assert len(issues) == 1
+            assert issues[0]['company'] == 'Other Insurance Co'
+            assert issues[0]['type'] == 'Claim Rejection'
+            assert issues[0]['severity'] == 'High'
+
+    def test_user_activity(self, app, book):
+        """Test per-insurer activity counts"""
+        with app.app_context():
+            activity = reports.user_activity()
+            assert activity[0]['username'] == 'testinsurer'
+            assert activity[0]['policies_created'] == 3
+            assert activity[0]['claims_processed'] == 1
+            assert activity[0]['quotes_generated'] == 1
+            assert activity[1]['company'] == 'Other Insurance Co'
+
+    def test_admin_reports_page(self, authenticated_admin, book):
+        """Test the admin reports page renders from the aggregates"""
+        response = authenticated_admin.get('/admin/reports-and-insights')
+        assert response.status_code == 200
+        assert b'Other Insurance Co' in response.data
+
+    def test_insurer_dashboard_counters(self, app, book, customer_user):
+        """Test dashboard counters and their invalidation on commit"""
+        with app.app_context():
+            company_id = book[0]
+            counters = reports.insurer_dashboard_counters(company_id)
+            assert counters['total_policies'] == 3
+            assert counters['active_policies'] == 2
+            assert counters['total_premium'] == 3000.0
+            assert counters['total_claims'] == 1
+            assert counters['pending_claims'] == 0
+            assert counters['total_customer_requests'] == 0
+
+            customer = Customer.query.filter_by(email='customer@test.com').first()
+            policy_id = Policy.query.filter_by(insurance_company_id=company_id).first().id
+            db.session.add(PolicyCancellationRequest(
+                customer_id=customer.id,
+                policy_id=policy_id,
+                cancellation_reason='Sold the vehicle'
+            ))
+            db.session.commit()
+
+            counters = reports.insurer_dashboard_counters(company_id)
+            assert counters['pending_cancellation_requests'] == 1
+            assert counters['total_customer_requests'] == 1
+            assert reports.insurer_dashboard_counters(book[1])['total_claims'] == 2
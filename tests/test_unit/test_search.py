@@ -0,0 +1,204 @@
+"""
+Unit tests for the full-text search index
+Checks index maintenance, matching and ranking
+"""
+import threading
+import time
+
+from extension import db
+from models import InsuranceCompany, Policy, Claim, SearchDocument
+import search
+
+
+class TestSearchIndex:
+    """Test search documents follow the indexed records"""
+
+    def test_terms(self):
+        """Test values are split into words plus their compact form"""
+        assert search.terms('KAA 123A') == ['kaa', '123a', 'kaa123a']
+        assert search.terms('holder@test.com') == ['holder', 'test', 'com', 'holdertestcom']
+        assert search.terms('TP-00001') == ['tp', '00001', 'tp00001']
+
+    def test_document_written_on_insert_and_update(self, app, insurer, make_policy):
+        """Test documents are written with the record and rewritten on change"""
+        with app.app_context():
+            policy = make_policy(insurer, insured_name='Jane Wanjiku')
+            doc = SearchDocument.query.filter_by(kind='policy', entity_id=policy.id).one()
+            assert 'wanjiku' in doc.content.split()
+
+            policy.insured_name = 'Jane Otieno'
+            db.session.commit()
+            assert [p.id for p in search.ranked(Policy, 'otieno')] == [policy.id]
+            assert search.ranked(Policy, 'wanjiku').all() == []
+
+    def test_document_removed_on_delete(self, app, insurer, make_policy, make_claim):
+        """Test deleting a record drops it from the index"""
+        with app.app_context():
+            claim = make_claim(make_policy(insurer), police_report_number='OB 77/2024')
+            assert search.ranked(Claim, 'OB 77').count() == 1
+            db.session.delete(claim)
+            db.session.commit()
+            assert search.ranked(Claim, 'OB 77').count() == 0
+            assert SearchDocument.query.filter_by(kind='claim').count() == 0
+
+    def test_rollback_discards_document(self, app, insurer, make_policy):
+        """Test the index rolls back with the change"""
+        with app.app_context():
+            policy = make_policy(insurer, insured_name='Jane Wanjiku')
+            policy.insured_name = 'Jane Otieno'
+            db.session.flush()
+            db.session.rollback()
+            assert search.ranked(Policy, 'otieno').count() == 0
+            assert search.ranked(Policy, 'wanjiku').count() == 1
+
+    def test_rebuild_index(self, app, insurer, make_policy):
+        """Test the index can be rebuilt from the raw tables"""
+        with app.app_context():
+            policy = make_policy(insurer, registration_number='KCB 456X')
+            db.session.query(SearchDocument).delete()
+            db.session.commit()
+            assert search.ranked(Policy, 'KCB456X').count() == 0
+
+            assert search.rebuild_index() == SearchDocument.query.count()
+            assert [p.id for p in search.ranked(Policy, 'KCB456X')] == [policy.id]
+
+
+class TestSearchMatching:
+    """Test matching and ranking of search queries"""
+
+    def test_prefix_and_compact_matching(self, app, insurer, make_policy):
+        """Test partial words and spacing variants match"""
+        with app.app_context():
+            policy = make_policy(insurer, registration_number='KAA 123A', national_id='28765432')
+            for text in ['KAA 123A', 'kaa123a', 'KAA12', 'kaa 1', '2876']:
+                assert [p.id for p in search.ranked(Policy, text)] == [policy.id], text
+            assert search.ranked(Policy, 'KAB').count() == 0
+
+    def test_every_word_must_match(self, app, insurer, make_policy):
+        """Test multi-word queries narrow the results"""
+        with app.app_context():
+            make_policy(insurer, insured_name='Jane Wanjiku')
+            second = make_policy(insurer, insured_name='Jane Otieno')
+            assert search.ranked(Policy, 'jane').count() == 2
+            assert [p.id for p in search.ranked(Policy, 'jane otieno')] == [second.id]
+
+    def test_ranked_by_relevance(self, app, insurer, make_policy):
+        """Test records matching on more terms rank first"""
+        with app.app_context():
+            weak = make_policy(insurer, insured_name='Mary Kamau')
+            strong = make_policy(insurer, insured_name='Kamau Kamau', email_address='kamau@test.com')
+            assert [p.id for p in search.ranked(Policy, 'kamau')] == [strong.id, weak.id]
+
+    def test_blank_query(self, app, insurer, make_policy):
+        """Test punctuation-only queries match nothing"""
+        with app.app_context():
+            make_policy(insurer)
+            assert search.ranked(Policy, '%%').all() == []
+
+    def test_customer_search_scoped_to_own_policies(self, app, authenticated_customer, insurer, make_policy, make_claim):
+        """Test customers only find their own policies and claims"""
+        with app.app_context():
+            own = make_policy(insurer, email_address='customer@test.com', insured_name='Searchable Owner')
+            other = make_policy(insurer, insured_name='Searchable Stranger')
+            make_claim(own, claim_number='CLM-OWN')
+            make_claim(other, claim_number='CLM-OTHER')
+
+        response = authenticated_customer.get('/customer/search?q=searchable')
+        body = response.get_data(as_text=True)
+        assert response.status_code == 200
+        assert 'Searchable Owner' in body
+        assert 'Searchable Stranger' not in body
+
+        body = authenticated_customer.get('/customer/search?q=clm&type=claims').get_data(as_text=True)
+        assert 'CLM-OWN' in body
+        assert 'CLM-OTHER' not in body
+
+
+class TestSearchFanOut:
+    """Test multi-entity searches run concurrently with a timeout"""
+
+    def test_results_attached_to_request_session(self, app, insurer, make_policy, make_claim):
+        """Test rows found on worker threads can still lazy-load relationships"""
+        with app.test_request_context():
+            policy = make_policy(insurer, insured_name='Jane Wanjiku')
+            make_claim(policy, accident_location='Wanjiku Road')
+            db.session.expunge_all()
+
+            results, timed_out = search.run_searches({
+                'policies': lambda: search.ranked(Policy, 'wanjiku').all(),
+                'claims': lambda: search.ranked(Claim, 'wanjiku').all()
+            })
+            assert timed_out == []
+            assert [p.insured_name for p in results['policies']] == ['Jane Wanjiku']
+            assert results['claims'][0] in db.session
+            assert results['claims'][0].policy.insured_name == 'Jane Wanjiku'
+
+    def test_slow_search_left_out(self, app, monkeypatch, insurer, make_policy):
+        """Test a search past the timeout is dropped, not waited for"""
+        monkeypatch.setitem(app.config, 'SEARCH_TIMEOUT', 0.2)
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return []
+
+        with app.test_request_context():
+            make_policy(insurer, insured_name='Jane Wanjiku')
+            started = time.monotonic()
+            results, timed_out = search.run_searches({
+                'slow': slow,
+                'policies': lambda: search.ranked(Policy, 'wanjiku').all()
+            })
+            release.set()
+            assert time.monotonic() - started < 2
+            assert timed_out == ['slow']
+            assert results['slow'] == []
+            assert len(results['policies']) == 1
+
+    def test_slow_query_interrupted(self, app, monkeypatch, insurer):
+        """Test a query past the timeout is stopped, freeing its search thread"""
+        monkeypatch.setitem(app.config, 'SEARCH_TIMEOUT', 0.2)
+        # Counts to a billion unless interrupted
+        endless = db.text('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000000) '
+                          'SELECT count(*) FROM n')
+
+        with app.test_request_context():
+            started = time.monotonic()
+            results, timed_out = search.run_searches({
+                'slow': lambda: db.session.execute(endless).all(),
+                'companies': lambda: search.ranked(InsuranceCompany, 'test').all()
+            })
+            assert timed_out == ['slow']
+            assert len(results['companies']) == 1
+            # The thread gave up the query rather than running it to the end
+            search._executor.submit(lambda: None).result(timeout=2)
+            assert time.monotonic() - started < 2
+
+    def test_saturated_pool_runs_inline(self, app, monkeypatch, insurer, make_policy):
+        """Test searches that find every thread busy run in the request's thread"""
+        with app.test_request_context():
+            make_policy(insurer, insured_name='Jane Wanjiku')
+            search.run_searches({'warm': lambda: [], 'up': lambda: []})
+            monkeypatch.setattr(search, '_slots', threading.BoundedSemaphore(1))
+            search._slots.acquire()
+
+            threads = {}
+
+            def policies():
+                threads['policies'] = threading.current_thread()
+                return search.ranked(Policy, 'wanjiku').all()
+
+            results, timed_out = search.run_searches({'policies': policies, 'claims': lambda: []})
+            assert timed_out == []
+            assert threads['policies'] is threading.current_thread()
+            assert len(results['policies']) == 1
+
+    def test_admin_search_all(self, app, authenticated_admin, insurer, make_policy):
+        """Test the admin page gathers every entity type"""
+        with app.app_context():
+            make_policy(insurer, insured_name='Testinsurer Holder')
+
+        body = authenticated_admin.get('/admin/search?q=testinsurer').get_data(as_text=True)
+        assert 'Testinsurer Holder' in body
+        assert 'insurer@test.com' in body
+        assert 'took too long' not in body
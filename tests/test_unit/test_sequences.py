@@ -0,0 +1,73 @@
+"""
+Unit tests for the policy, claim and quote number sequences
+Checks seeding from issued numbers, block reservation and concurrent workers
+"""
+import threading
+
+import pytest
+from extension import db
+from models import NumberSequence
+import sequences
+
+
+class TestSequences:
+    """Test numbers are handed out once each, in order"""
+
+    def test_continues_from_issued_numbers(self, app, insurer, make_policy):
+        """Test a new sequence starts after the numbers already issued"""
+        with app.app_context():
+            make_policy(insurer, policy_number='CO-0041')
+            make_policy(insurer, policy_number='CO-0007')
+            make_policy(insurer, policy_number='TO-0100')
+            assert sequences.next_number('CO') == 'CO-0042'
+            assert sequences.next_number('CO') == 'CO-0043'
+            assert sequences.next_number('TO') == 'TO-0101'
+            assert sequences.next_number('CL') == 'CL-0001'
+            assert sequences.next_number('QT') == 'QT-000001'
+
+    def test_block_reservation(self, app):
+        """Test a block is one reservation and later numbers follow it"""
+        with app.app_context():
+            block = sequences.reserve('CL', 1000)
+            assert (block.start, block.stop) == (1, 1001)
+            assert sequences.next_number('CL') == 'CL-1001'
+
+    def test_numbers_reserves_lazily(self, app):
+        """Test the iterator takes a new block only when one runs out"""
+        with app.app_context():
+            issued = sequences.numbers('QT', block_size=3)
+            taken = [next(issued) for _ in range(7)]
+            assert taken == [f'QT-{n:06d}' for n in range(1, 8)]
+            assert db.session.get(NumberSequence, 'QT').last_value == 9
+
+    def test_rejects_bad_requests(self, app):
+        """Test unknown sequences and empty reservations raise ValueError"""
+        with app.app_context():
+            with pytest.raises(ValueError):
+                sequences.reserve('XX')
+            with pytest.raises(ValueError):
+                sequences.reserve('CL', 0)
+
+    def test_concurrent_workers(self, app):
+        """Test workers reserving at the same time never share a number"""
+        issued, errors = [], []
+        start = threading.Barrier(4)
+
+        def work():
+            try:
+                with app.app_context():
+                    start.wait()
+                    for _ in range(25):
+                        issued.append(sequences.next_number('CL'))
+                        db.session.commit()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert sorted(issued) == [f'CL-{n:04d}' for n in range(1, 101)]
@@ -0,0 +1,92 @@
+"""
+Unit tests for the SQLite performance mode
+Checks the connection pragmas and concurrent writers on one database file
+"""
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from config import Config
+import sqlite_tuning
+
+
+SETTINGS = {
+    'SQLITE_BUSY_TIMEOUT': 10000,
+    'SQLITE_CACHE_SIZE': Config.SQLITE_CACHE_SIZE,
+    'SQLITE_MMAP_SIZE': Config.SQLITE_MMAP_SIZE,
+}
+
+
+@pytest.fixture
+def engine():
+    """A tuned engine on a fresh database file, with pysqlite's own wait disabled"""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'tuned.db')
+    engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': 0})
+    assert sqlite_tuning.tune_engine(engine, SETTINGS)
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE entry (id INTEGER PRIMARY KEY, writer INTEGER, n INTEGER)'))
+    yield engine
+    engine.dispose()
+    for name in os.listdir(directory):
+        os.unlink(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+class TestSqliteTuning:
+    """Test the performance mode pragmas"""
+
+    def test_pragmas(self, engine):
+        """Test every connection is switched to WAL with the configured settings"""
+        with engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 10000
+            assert connection.execute(text('PRAGMA cache_size')).scalar() == -Config.SQLITE_CACHE_SIZE
+
+    def test_other_databases_untouched(self):
+        """Test engines for other databases are not tuned"""
+        engine = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+        assert not sqlite_tuning.tune_engine(engine, SETTINGS)
+
+    def test_init_app_respects_toggle(self, app, monkeypatch):
+        """Test the app's engine is only tuned when SQLITE_TUNING is set"""
+        calls = []
+        monkeypatch.setattr(sqlite_tuning, 'tune_engine', lambda engine, config: calls.append(engine))
+        monkeypatch.setitem(app.config, 'SQLITE_TUNING', False)
+        sqlite_tuning.init_app(app)
+        assert calls == []
+        monkeypatch.setitem(app.config, 'SQLITE_TUNING', True)
+        sqlite_tuning.init_app(app)
+        assert len(calls) == 1
+
+    def test_concurrent_writers(self, engine):
+        """Test writers on separate connections wait for the lock instead of failing"""
+        writers, rows = 8, 50
+        errors = []
+        start = threading.Barrier(writers)
+
+        def write(writer):
+            try:
+                start.wait()
+                for n in range(rows):
+                    with engine.begin() as connection:
+                        connection.execute(text('INSERT INTO entry (writer, n) VALUES (:writer, :n)'), {'writer': writer, 'n': n})
+                        # Readers in other connections keep going during the write
+                        connection.execute(text('SELECT count(*) FROM entry')).scalar()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        with engine.connect() as connection:
+            assert connection.execute(text('SELECT count(*) FROM entry')).scalar() == writers * rows